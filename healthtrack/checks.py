@@ -0,0 +1,24 @@
+"""
+System checks of the project's settings.
+"""
+
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.security, deploy=True)
+def check_metrics_token(app_configs, **kwargs):
+    """
+    Run by `manage.py check --deploy`: /metrics has to require a token.
+    """
+    options = getattr(settings, "METRICS", {})
+    if options.get("ENABLED", True) and not options.get("TOKEN"):
+        return [
+            Error(
+                "/metrics is served to anyone who asks.",
+                hint="Set METRICS_TOKEN to the token scrapers of /metrics have to "
+                "send.",
+                id="healthtrack.E001",
+            )
+        ]
+    return []
@@ -0,0 +1,387 @@
+"""
+Prometheus metrics of the requests served, in the text format at /metrics.
+
+MetricsMiddleware measures every request and labels it with the name of the route
+it resolved to ("unmatched" when it did not), its method and, for the latency, its
+status:
+
+- healthtrack_request_duration_seconds, a histogram of the time to respond.
+- healthtrack_request_db_queries_total and healthtrack_request_db_seconds_total,
+  the SQL queries run, on any database, and the time they took.
+- healthtrack_request_serialization_seconds_total, the time serializers with
+  MeasuredSerializerMixin spent producing data, including the queries they ran.
+  Lists are measured once, not per row.
+- healthtrack_request_render_seconds_total, the time spent rendering responses.
+
+The values are kept in the memory of each process. With METRICS["DIRECTORY"] every
+process also writes them to a file there every EXPORT_INTERVAL seconds, and
+/metrics adds up the files of all processes, so any worker answers for all of them.
+"""
+
+import atexit
+import hmac
+import json
+import os
+import tempfile
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from time import perf_counter, sleep
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from rest_framework.serializers import (
+    LIST_SERIALIZER_KWARGS,
+    LIST_SERIALIZER_KWARGS_REMOVE,
+    ListSerializer,
+)
+
+DEFAULTS = {
+    "ENABLED": True,
+    "BUCKETS": [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+    "TOKEN": None,
+    "DIRECTORY": None,
+    "EXPORT_INTERVAL": 5,
+}
+
+# Totals kept per route and method, in the order of their metrics.
+TOTALS = [
+    ("db_queries_total", "SQL queries run by requests."),
+    ("db_seconds_total", "Time spent running SQL queries."),
+    ("serialization_seconds_total", "Time spent in serializers."),
+    ("render_seconds_total", "Time spent rendering responses."),
+]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RequestStats:
+    """
+    What one request spent its time on, shared with the threads it runs code in.
+    """
+
+    __slots__ = ("queries", "db_time", "serialization", "render", "serializing")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = self.serialization = self.render = 0.0
+        self.serializing = False
+
+
+request_stats = ContextVar("request_stats", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += perf_counter() - start
+
+
+def install(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def install_on_connect(*, connection, **kwargs):
+    install(connection)
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """
+    The metrics of this process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.configure()
+        atexit.register(self.export)
+
+    def configure(self):
+        options = {**DEFAULTS, **getattr(settings, "METRICS", {})}
+        self.enabled = options["ENABLED"]
+        self.buckets = sorted(options["BUCKETS"])
+        self.token = options["TOKEN"]
+        self.directory = options["DIRECTORY"] and Path(options["DIRECTORY"])
+        self.export_interval = options["EXPORT_INTERVAL"]
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # (route, method, status) -> [count per bucket..., count above, sum]
+            self.durations = {}
+            # (route, method) -> values of TOTALS
+            self.totals = {}
+
+    def observe(self, route, method, status, duration, stats):
+        if self.pid != os.getpid():
+            self.start()
+        index = bisect_left(self.buckets, duration)
+        with self.lock:
+            key = (route, method, status)
+            durations = self.durations.get(key)
+            if durations is None:
+                durations = self.durations[key] = [0] * (len(self.buckets) + 2)
+            durations[index] += 1
+            durations[-1] += duration
+            totals = self.totals.get((route, method))
+            if totals is None:
+                totals = self.totals[(route, method)] = [0] * len(TOTALS)
+            totals[0] += stats.queries
+            totals[1] += stats.db_time
+            totals[2] += stats.serialization
+            totals[3] += stats.render
+
+    def snapshot(self):
+        with self.lock:
+            durations = [[*key, *values] for key, values in self.durations.items()]
+            totals = [[*key, *values] for key, values in self.totals.items()]
+        return {"buckets": self.buckets, "durations": durations, "totals": totals}
+
+    def start(self):
+        """
+        Starts exporting the metrics of this process, again after a fork.
+        """
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            if self.pid is not None:
+                # The values recorded before the fork are the parent's.
+                self.durations, self.totals = {}, {}
+            self.pid = os.getpid()
+        if self.directory:
+            threading.Thread(target=self.run, name="metrics", daemon=True).start()
+
+    def run(self):
+        while True:
+            sleep(self.export_interval)
+            self.export()
+
+    def export(self):
+        if not self.directory or self.pid != os.getpid():
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.directory, suffix=".tmp", delete=False
+        ) as file:
+            json.dump(self.snapshot(), file)
+        os.replace(file.name, self.directory / f"{self.pid}.json")
+
+    def collect(self):
+        """
+        Returns the durations and totals of this process, added to those the other
+        processes exported.
+        """
+        snapshots = [self.snapshot()]
+        if self.directory and self.directory.is_dir():
+            for path in self.directory.glob("*.json"):
+                if path.stem == str(os.getpid()):
+                    continue
+                try:
+                    snapshot = json.loads(path.read_text())
+                except (OSError, ValueError):
+                    continue
+                # Histograms of other buckets, exported before a change of
+                # METRICS["BUCKETS"], can not be added up.
+                if snapshot["buckets"] == self.buckets:
+                    snapshots.append(snapshot)
+        durations, totals = {}, {}
+        for snapshot in snapshots:
+            for merged, rows, size in [
+                (durations, snapshot["durations"], 3),
+                (totals, snapshot["totals"], 2),
+            ]:
+                for row in rows:
+                    key, values = tuple(row[:size]), row[size:]
+                    if key in merged:
+                        merged[key] = [a + b for a, b in zip(merged[key], values)]
+                    else:
+                        merged[key] = values
+        return durations, totals
+
+    def render(self):
+        durations, totals = self.collect()
+        bounds = [*(f"{bound:g}" for bound in self.buckets), "+Inf"]
+        lines = [
+            "# HELP healthtrack_request_duration_seconds Time to respond to requests.",
+            "# TYPE healthtrack_request_duration_seconds histogram",
+        ]
+        name = "healthtrack_request_duration_seconds"
+        for (route, method, status), values in sorted(durations.items()):
+            labels = (
+                f'route="{escape(route)}",method="{escape(method)}",'
+                f'status="{status}"'
+            )
+            count = 0
+            for bound, value in zip(bounds, values):
+                count += value
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {values[-1]}")
+            lines.append(f"{name}_count{{{labels}}} {count}")
+        for index, (suffix, description) in enumerate(TOTALS):
+            name = f"healthtrack_request_{suffix}"
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} counter")
+            for (route, method), values in sorted(totals.items()):
+                labels = f'route="{escape(route)}",method="{escape(method)}"'
+                lines.append(f"{name}{{{labels}}} {values[index]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+@receiver(setting_changed)
+def reload_metrics(*, setting, **kwargs):
+    if setting == "METRICS":
+        metrics.configure()
+
+
+def metrics_view(request):
+    if metrics.token and not hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {metrics.token}"
+    ):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    """
+    Measures the requests for /metrics. It goes first in MIDDLEWARE, so the time of
+    the other middleware counts and responses are rendered in its
+    process_template_response, after that of all other middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections opened before the first request, like those of management
+        # commands or tests, missed connection_created.
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not metrics.enabled:
+            return self.get_response(request)
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        start = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        self.observe(request, response, perf_counter() - start, stats)
+        return response
+
+    async def __acall__(self, request):
+        if not metrics.enabled:
+            return await self.get_response(request)
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        self.observe(request, response, perf_counter() - start, stats)
+        return response
+
+    def observe(self, request, response, duration, stats):
+        match = request.resolver_match
+        route = match.view_name if match else "unmatched"
+        metrics.observe(route, request.method, response.status_code, duration, stats)
+
+    def process_template_response(self, request, response):
+        stats = request_stats.get()
+        if stats is not None:
+            start = perf_counter()
+            response.render()
+            stats.render += perf_counter() - start
+        return response
+
+
+@contextmanager
+def measure_serialization():
+    """
+    Counts the time of the block as serialization time of the request, unless an
+    enclosing block already does.
+    """
+    stats = request_stats.get()
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialization += perf_counter() - start
+        stats.serializing = False
+
+
+class MeasuredListSerializer(ListSerializer):
+    """
+    The list serializer of MeasuredSerializerMixin, measuring the whole list once.
+    """
+
+    @property
+    def data(self):
+        with measure_serialization():
+            return super().data
+
+
+class MeasuredSerializerMixin:
+    """
+    Counts the time a serializer spends producing its data, with many=True that of
+    the whole list, as serialization time of the request. Serializers nested in a
+    measured one are measured with it.
+    """
+
+    @property
+    def data(self):
+        with measure_serialization():
+            return super().data
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        meta = getattr(cls, "Meta", None)
+        if hasattr(meta, "list_serializer_class"):
+            return super().many_init(*args, **kwargs)
+        # BaseSerializer.many_init with MeasuredListSerializer as the default.
+        removed = {key: kwargs.pop(key, None) for key in LIST_SERIALIZER_KWARGS_REMOVE}
+        list_kwargs = {
+            key: value for key, value in removed.items() if value is not None
+        }
+        list_kwargs["child"] = cls(*args, **kwargs)
+        list_kwargs.update(
+            {
+                key: value
+                for key, value in kwargs.items()
+                if key in LIST_SERIALIZER_KWARGS
+            }
+        )
+        return MeasuredListSerializer(*args, **list_kwargs)
@@ -0,0 +1,218 @@
+"""
+Routing of read queries to replica databases.
+
+ReplicaRoutingMiddleware marks GET, HEAD and OPTIONS requests authenticated with a
+JWT as safe to read from a replica, and ReplicaRouter then sends the reads of such a
+request to one replica, chosen when the request first reads. Everything else, all
+writes and every read of other requests, goes to the default (primary) database.
+
+After a clinician's successful write their reads are pinned to the primary for
+REPLICA_ROUTING["PIN_SECONDS"], so they read their own writes while the replicas
+catch up. The pins live in the Django cache named by REPLICA_ROUTING["CACHE_ALIAS"],
+which has to be shared between worker processes (see patients.cache.get_shared_cache)
+so a pin set by one worker holds for the requests the others serve.
+
+A replica that can not be connected to is skipped for
+REPLICA_ROUTING["RETRY_SECONDS"] and its requests read from another replica or the
+primary instead.
+"""
+
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from patients.cache import get_shared_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "DATABASES": [],
+    "PIN_SECONDS": 5,
+    "RETRY_SECONDS": 30,
+    "CACHE_ALIAS": "default",
+}
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "REPLICA_ROUTING", {})}
+
+
+class RequestRouting:
+    """
+    The routing state of one request, shared with the threads it runs code in.
+    """
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.alias = None
+
+
+request_routing = ContextVar("request_routing", default=None)
+
+
+class ReplicaPool:
+    """
+    Chooses replicas, skipping the ones that recently failed to connect.
+    """
+
+    def __init__(self):
+        self.down_until = {}
+        self._lock = threading.Lock()
+
+    def choose(self):
+        options = get_options()
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                alias
+                for alias in options["DATABASES"]
+                if self.down_until.get(alias, 0) <= now
+            ]
+        random.shuffle(candidates)
+        for alias in candidates:
+            try:
+                connections[alias].ensure_connection()
+            except DatabaseError:
+                logger.warning(
+                    "Replica %s is unavailable, retrying it in %s seconds.",
+                    alias,
+                    options["RETRY_SECONDS"],
+                    exc_info=True,
+                )
+                with self._lock:
+                    self.down_until[alias] = now + options["RETRY_SECONDS"]
+                continue
+            return alias
+        return DEFAULT_DB_ALIAS
+
+
+replica_pool = ReplicaPool()
+
+
+def pin_key(user_id):
+    return f"replicas:pinned:{user_id}"
+
+
+def get_pin_cache():
+    return get_shared_cache(get_options()["CACHE_ALIAS"], "REPLICA_ROUTING")
+
+
+def pin_to_primary(user_id):
+    get_pin_cache().set(pin_key(user_id), True, timeout=get_options()["PIN_SECONDS"])
+
+
+def is_pinned(user_id):
+    return bool(get_pin_cache().get(pin_key(user_id)))
+
+
+def get_token_user_id(request):
+    """
+    Returns the user id of a valid JWT sent with the request, without touching the
+    database.
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    try:
+        raw_token = header and authentication.get_raw_token(header)
+        if not raw_token:
+            return None
+        token = authentication.get_validated_token(raw_token)
+        return token[api_settings.USER_ID_CLAIM]
+    except (AuthenticationFailed, KeyError):
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Decides whether a request may read from a replica and pins clinicians to the
+    primary after they wrote.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        user_id, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_routing.reset(token)
+        self.finish(request, response, user_id)
+        return response
+
+    async def __acall__(self, request):
+        user_id, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_routing.reset(token)
+        self.finish(request, response, user_id)
+        return response
+
+    def start(self, request):
+        user_id = None
+        use_replica = False
+        if get_options()["DATABASES"]:
+            user_id = get_token_user_id(request)
+            use_replica = (
+                user_id is not None
+                and request.method in SAFE_METHODS
+                and not is_pinned(user_id)
+            )
+        return user_id, request_routing.set(RequestRouting(use_replica))
+
+    def finish(self, request, response, user_id):
+        if (
+            user_id is not None
+            and request.method not in SAFE_METHODS
+            and response.status_code < 400
+        ):
+            pin_to_primary(user_id)
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of requests marked by ReplicaRoutingMiddleware to a replica and
+    everything else to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = request_routing.get()
+        if routing is None or not routing.use_replica:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads inside a transaction have to see its writes.
+            return DEFAULT_DB_ALIAS
+        if routing.alias is None:
+            routing.alias = replica_pool.choose()
+        return routing.alias
+
+    def db_for_write(self, model, **hints):
+        # Also for objects that were read from a replica.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication.
+        return db not in get_options()["DATABASES"]
@@ -1,5 +1,5 @@
 from datetime import timedelta
-from os import path
+from os import getenv, path
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -12,6 +12,7 @@ load_dotenv(env_file)
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
+SECRET_KEY = getenv("SECRET_KEY")
 
 # Application definition
 LOCAL_APPS = [
@@ -25,7 +26,6 @@ THIRD_PARTY_APPS = [
     "phonenumber_field",
     "django_filters",
     "drf_spectacular",
-    "debug_toolbar",
     "djoser",
 ]
 INSTALLED_APPS = [
@@ -35,25 +35,24 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     *THIRD_PARTY_APPS,
     *LOCAL_APPS,
 ]
 
 MIDDLEWARE = [
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
+    "healthtrack.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
+    "healthtrack.replicas.ReplicaRoutingMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "patients.audit.AuditMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
-INTERNAL_IPS = [
-    "127.0.0.1",
-]
-
 ROOT_URLCONF = "healthtrack.urls"
 
 TEMPLATES = [
@@ -74,6 +73,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "healthtrack.wsgi.application"
 
+# Writes the buffered audit events before the test databases are destroyed.
+TEST_RUNNER = "healthtrack.test_runner.TestRunner"
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -112,16 +114,142 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.postgresql_psycopg2",
+        "NAME": getenv("POSTGRES_DB"),
+        "USER": getenv("POSTGRES_USER"),
+        "PASSWORD": getenv("POSTGRES_PASSWORD"),
+        "HOST": getenv("POSTGRES_HOST"),
+        "PORT": 5432,
+    }
+}
+
+# Read replicas as a comma separated list of host[:port][/database], for example
+# "replica1,replica2:5433" or "localhost/healthtrack_replica" for a second local
+# database. In tests they mirror the default database.
+replica_aliases = []
+replicas = getenv("POSTGRES_REPLICAS", "")
+for number, replica in enumerate(filter(None, replicas.split(","))):
+    address, _, name = replica.partition("/")
+    host, _, port = address.partition(":")
+    alias = f"replica_{number + 1}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "NAME": name or DATABASES["default"]["NAME"],
+        "HOST": host or DATABASES["default"]["HOST"],
+        "PORT": int(port or DATABASES["default"]["PORT"]),
+        "TEST": {"MIRROR": "default"},
+    }
+    replica_aliases.append(alias)
+
+# Reads of API GET requests go to the replicas in REPLICA_ROUTING["DATABASES"], see
+# healthtrack/replicas.py. Without replicas everything uses the default database.
+DATABASE_ROUTERS = ["healthtrack.replicas.ReplicaRouter"]
+
+REPLICA_ROUTING = {
+    "DATABASES": replica_aliases,
+    # How long a clinician's reads stay on the primary after they wrote.
+    "PIN_SECONDS": 5,
+    # How long a replica that failed to connect is skipped.
+    "RETRY_SECONDS": 30,
+    "CACHE_ALIAS": "default",
+}
+
 AUTH_USER_MODEL = "users.User"
 
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        # JWTAuthentication with a cache for the user lookup, see
+        # users/authentication.py.
+        "users.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 10,
+    # orjson based drop-in replacements for the JSON renderer and parser, see
+    # patients/renderers.py and patients/parsers.py.
+    "DEFAULT_RENDERER_CLASSES": (
+        "patients.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "patients.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
+}
+
+# Serve the list and detail endpoints with the async views of patients/async_views.py.
+# Only pays off under ASGI, healthtrack/asgi.py turns it on.
+ASYNC_VIEWS = getenv("ASYNC_VIEWS", "") == "1"
+
+# Whether the site runs in a single process. The caches whose CACHE_ALIAS has to be
+# shared between worker processes refuse a process local backend, like the default
+# LocMemCache, unless it is set.
+SINGLE_PROCESS = getenv("SINGLE_PROCESS", "") == "1"
+
+# Per-clinician cache for list responses, see patients/cache.py. CACHE_ALIAS has to
+# point at a backend shared between the worker processes (redis, memcached). Every
+# process also keeps up to LRU_MAXSIZE responses for LRU_TIMEOUT seconds.
+RESPONSE_CACHE = {
+    "ENABLED": True,
+    "CACHE_ALIAS": "default",
+    "TIMEOUT": 300,
+    "LRU_MAXSIZE": 1024,
+    "LRU_TIMEOUT": 30,
+}
+
+# Audit trail of patient and assessment reads and changes, see patients/audit.py.
+# "async" writes the events in batches from a background thread, every
+# FLUSH_INTERVAL seconds or once BATCH_SIZE events wait, and buffers at most
+# MAX_BUFFERED of them. "sync" writes every event before the request goes on.
+AUDIT_LOG = {
+    "ENABLED": True,
+    "DURABILITY": "async",
+    "FLUSH_INTERVAL": 1.0,
+    "BATCH_SIZE": 500,
+    "MAX_BUFFERED": 10000,
+}
+
+# Request metrics served at /metrics, see healthtrack/metrics.py. BUCKETS are the
+# upper bounds of the latency histogram in seconds. With TOKEN set, scrapers have to
+# send it as "Authorization: Bearer <token>". With more than one worker process
+# DIRECTORY has to name a directory they all write their metrics to.
+METRICS = {
+    "ENABLED": True,
+    "BUCKETS": [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+    "TOKEN": getenv("METRICS_TOKEN") or None,
+    "DIRECTORY": getenv("METRICS_DIRECTORY") or None,
+    "EXPORT_INTERVAL": 5,
+}
+
+# Background jobs run by `manage.py run_jobs`, see patients/jobs.py. Idle workers look
+# for due jobs every POLL_INTERVAL seconds. A job is leased to its worker for LEASE
+# seconds, and renewed while it runs, so jobs of a worker that died run again after
+# at most LEASE seconds. Failed jobs are retried after BACKOFF seconds, doubling per
+# attempt up to MAX_BACKOFF, until they made MAX_ATTEMPTS attempts.
+JOB_QUEUE = {
+    "POLL_INTERVAL": 1.0,
+    "LEASE": 300,
+    "MAX_ATTEMPTS": 5,
+    "BACKOFF": 10,
+    "MAX_BACKOFF": 3600,
+}
+
+# Cache of the users that JWT requests authenticate as, see users/authentication.py.
+# SHARED also keeps the users in the Django cache named by CACHE_ALIAS, which holds
+# the auth versions either way and has to be shared between worker processes. Every
+# process keeps up to LRU_MAXSIZE users for LRU_TIMEOUT seconds.
+AUTH_USER_CACHE = {
+    "ENABLED": True,
+    "CACHE_ALIAS": "default",
+    "SHARED": False,
+    "TIMEOUT": 300,
+    "LRU_MAXSIZE": 4096,
+    "LRU_TIMEOUT": 10,
 }
 
 SIMPLE_JWT = {
@@ -133,12 +261,26 @@ SIMPLE_JWT = {
 
 DJOSER = {
     "PASSWORD_RESET_CONFIRM_URL": "password-reset/{uid}/{token}",
+    "USERNAME_RESET_CONFIRM_URL": "email-reset/{uid}/{token}",
     "SEND_ACTIVATION_EMAIL": True,
     "ACTIVATION_URL": "activation/{uid}/{token}",
     "USER_CREATE_PASSWORD_RETYPE": True,
     "PASSWORD_RESET_CONFIRM_RETYPE": True,
+    # Authentication is JWT only, there are no authtoken tokens to delete on logout.
+    "TOKEN_MODEL": None,
 }
 
+EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+EMAIL_HOST = getenv("EMAIL_HOST")
+EMAIL_HOST_USER = getenv("EMAIL_HOST_USER")
+EMAIL_HOST_PASSWORD = getenv("EMAIL_HOST_PASSWORD")
+EMAIL_PORT = getenv("EMAIL_PORT")
+EMAIL_USE_TLS = True
+DEFAULT_FROM_EMAIL = "info@healthtrack.com"
+
+# Mount the OpenAPI schema and Swagger UI routes, see healthtrack/urls.py.
+API_DOCS = True
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "Health Tracker",
     "DESCRIPTION": "Health Tracker is a patient assessment system. The app allow clinicians to"
@@ -1,28 +1,13 @@
-from os import getenv
-
 from .base import *  # noqa
 
 load_dotenv(env_file)
 
 DEBUG = True
 ALLOWED_HOSTS = ["localhost", "127.0.0.1", "0.0.0.0"]
-SECRET_KEY = getenv("SECRET_KEY")
+INTERNAL_IPS = ["127.0.0.1"]
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.postgresql_psycopg2",
-        "NAME": getenv("POSTGRES_DB"),
-        "USER": getenv("POSTGRES_USER"),
-        "PASSWORD": getenv("POSTGRES_PASSWORD"),
-        "HOST": getenv("POSTGRES_HOST"),
-        "PORT": 5432,
-    }
-}
+INSTALLED_APPS = [*INSTALLED_APPS, "debug_toolbar"]
+MIDDLEWARE = ["debug_toolbar.middleware.DebugToolbarMiddleware", *MIDDLEWARE]
 
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
-EMAIL_HOST = getenv("EMAIL_HOST")
-EMAIL_HOST_USER = getenv("EMAIL_HOST_USER")
-EMAIL_HOST_PASSWORD = getenv("EMAIL_HOST_PASSWORD")
-EMAIL_PORT = getenv("EMAIL_PORT")
-EMAIL_USE_TLS = True
-DEFAULT_FROM_EMAIL = "info@healthtrack.com"
+# runserver and the tests run in one process, so the default LocMemCache will do.
+SINGLE_PROCESS = True
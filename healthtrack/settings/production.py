@@ -0,0 +1,54 @@
+from os import getenv
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .base import *  # noqa
+
+# Only what serving the API needs: drf_spectacular only when the docs are served.
+# Cold starts are measured by `manage.py benchmark_cold_start`.
+DEBUG = False
+ALLOWED_HOSTS = [host for host in getenv("ALLOWED_HOSTS", "").split(",") if host]
+
+# The response, user and replica pin caches are read on every request and shared
+# between the worker processes: redis with REDIS_URL, or memcached with the comma
+# separated MEMCACHED_LOCATION. With SINGLE_PROCESS the in-process default will do.
+if getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": getenv("REDIS_URL"),
+        }
+    }
+elif getenv("MEMCACHED_LOCATION"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+            "LOCATION": getenv("MEMCACHED_LOCATION").split(","),
+        }
+    }
+elif not SINGLE_PROCESS:
+    raise ImproperlyConfigured(
+        "Set REDIS_URL or MEMCACHED_LOCATION to the cache the worker processes "
+        "share, or SINGLE_PROCESS=1 when the site runs in a single process."
+    )
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    # The browsable API is for development.
+    "DEFAULT_RENDERER_CLASSES": ("patients.renderers.FastJSONRenderer",),
+}
+
+API_DOCS = getenv("API_DOCS", "") == "1"
+if not API_DOCS:
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app != "drf_spectacular"]
+    # DRF's default, the routers instantiate the schema of every viewset.
+    REST_FRAMEWORK["DEFAULT_SCHEMA_CLASS"] = "rest_framework.schemas.openapi.AutoSchema"
+
+# Workers keep their database connections between requests.
+for database in DATABASES.values():
+    database["CONN_MAX_AGE"] = int(getenv("CONN_MAX_AGE", 60))
+    database["CONN_HEALTH_CHECKS"] = True
+
+SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
+SESSION_COOKIE_SECURE = True
+CSRF_COOKIE_SECURE = True
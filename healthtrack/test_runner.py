@@ -0,0 +1,15 @@
+from django.test.runner import DiscoverRunner
+
+from patients.audit import audit_log
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Stops the audit log flusher before the test databases are destroyed, so the
+    events buffered by the tests are written to them and not to the real database
+    when the process exits.
+    """
+
+    def teardown_databases(self, old_config, **kwargs):
+        audit_log.stop()
+        super().teardown_databases(old_config, **kwargs)
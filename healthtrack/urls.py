@@ -1,17 +1,50 @@
-from debug_toolbar.toolbar import debug_toolbar_urls
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from django.utils.module_loading import import_string
+
+from healthtrack.metrics import metrics_view
+
+
+def lazy_view(view_path):
+    """
+    Imports the class based view at `view_path` on its first request, so workers that
+    never serve it do not pay for importing it.
+    """
+    view = None
+
+    def dispatch(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = import_string(view_path).as_view()
+        return view(request, *args, **kwargs)
+
+    return dispatch
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("patients.urls")),
     path("api/auth/", include("djoser.urls")),
     path("api/auth/", include("djoser.urls.jwt")),
-    path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
-    path(
-        "api/swagger-ui/",
-        SpectacularSwaggerView.as_view(),
-        name="swagger-ui",
-    ),
-] + debug_toolbar_urls()
+    path("metrics", metrics_view, name="metrics"),
+]
+
+if settings.API_DOCS:
+    urlpatterns += [
+        path(
+            "api/schema/",
+            lazy_view("drf_spectacular.views.SpectacularAPIView"),
+            name="schema",
+        ),
+        path(
+            "api/swagger-ui/",
+            lazy_view("drf_spectacular.views.SpectacularSwaggerView"),
+            name="swagger-ui",
+        ),
+    ]
+
+if "debug_toolbar" in settings.INSTALLED_APPS:
+    from debug_toolbar.toolbar import debug_toolbar_urls
+
+    urlpatterns += debug_toolbar_urls()
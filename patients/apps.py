@@ -6,4 +6,5 @@ class PatientsConfig(AppConfig):
     name = "patients"
 
     def ready(self) -> None:
+        import healthtrack.checks  # noqa
         import patients.signals  # noqa
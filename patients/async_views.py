@@ -0,0 +1,97 @@
+"""
+Async versions of the list, detail and export views of patients/views.py, for
+deployments served through ASGI (see healthtrack/asgi.py and the ASYNC_VIEWS setting).
+
+The views keep the names, URLs and behaviour of their synchronous counterparts.
+Authentication and permission checks run in one thread hop (the user normally comes
+from the user cache), GET requests are then answered with the async ORM, and the
+write methods run the synchronous handlers in a thread.
+"""
+
+import itertools
+
+from adrf.views import APIView as AsyncAPIView
+from asgiref.sync import sync_to_async
+
+from . import views
+from .cache import AsyncCachedListMixin
+from .conditional import AsyncConditionalListMixin, AsyncConditionalObjectMixin
+
+
+class PatientListCreateAPIView(
+    AsyncConditionalListMixin,
+    AsyncCachedListMixin,
+    views.PatientListCreateAPIView,
+    AsyncAPIView,
+):
+    async def post(self, request, *args, **kwargs):
+        return await sync_to_async(super().post)(request, *args, **kwargs)
+
+
+class PatientDetailAPIView(
+    AsyncConditionalObjectMixin, views.PatientDetailAPIView, AsyncAPIView
+):
+    object_select_related = ("address",)
+
+    async def aget_object(self):
+        patient = await super().aget_object()
+        # The ownership check compared the ids, the clinician is the requesting user.
+        patient.clinician = self.request.user
+        return patient
+
+
+class AssessmentListAPIView(
+    AsyncConditionalListMixin,
+    AsyncCachedListMixin,
+    views.AssessmentListAPIView,
+    AsyncAPIView,
+):
+    pass
+
+
+class AssessmentExportAPIView(views.AssessmentExportAPIView, AsyncAPIView):
+    """
+    Streams the export from an async iterator. Django's ASGI handler would collect a
+    synchronous one in full before sending it.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        # Filtersets may query to validate their parameters.
+        values = await sync_to_async(self.get_export_queryset)()
+        header, encode = self.get_line_encoder()
+        # QuerySet.aiterator() runs the query of a values_list() on the event loop,
+        # so the server-side cursor is read a chunk per thread hop instead.
+        rows = self.audit_rows(values.iterator(chunk_size=self.chunk_size))
+        next_chunk = sync_to_async(
+            lambda: list(itertools.islice(rows, self.chunk_size))
+        )
+
+        async def content():
+            for line in header:
+                yield line
+            while chunk := await next_chunk():
+                for row in chunk:
+                    yield encode(self.format_row(row))
+
+        return self.stream(content())
+
+
+class AssessmentDetailAPIView(
+    AsyncConditionalObjectMixin, views.AssessmentDetailAPIView, AsyncAPIView
+):
+    object_select_related = ("clinician", "patient")
+
+
+class PatientAssessmentListAPIView(
+    AsyncConditionalListMixin,
+    AsyncCachedListMixin,
+    views.PatientAssessmentListAPIView,
+    AsyncAPIView,
+):
+    pass
+
+
+class PatientAssessmentDetailAPIView(
+    AsyncConditionalObjectMixin, views.PatientAssessmentDetailAPIView, AsyncAPIView
+):
+    object_select_related = ("clinician", "patient")
@@ -0,0 +1,399 @@
+"""
+Audit trail of who read or changed which patient and assessment (AuditEvent).
+
+Events are recorded in process and written in batches with COPY, so requests do not
+pay for an INSERT each:
+
+- Reads are recorded by AuditedReadMixin for successful GETs of the detail views and
+  of a patient's assessments, and by AuditedListMixin for every patient a list,
+  search or suggestion showed. The export records the patients whose assessments it
+  sent.
+- Changes are recorded by the receivers in patients.signals once the transaction
+  commits, so rolled back writes leave no trace. Bulk inserts and imports record
+  theirs themselves. The acting user and address come from the request
+  AuditMiddleware keeps track of.
+
+With AUDIT_LOG["DURABILITY"] "async" the events wait in a buffer of at most
+MAX_BUFFERED events that a background thread writes every FLUSH_INTERVAL seconds,
+or as soon as BATCH_SIZE events are waiting. Events still buffered when a process
+is killed are lost. When the buffer is full the recording thread writes it itself;
+events that can not be written then, or that are recorded in the event loop of an
+async view, are dropped and counted. With "sync" every event is written before the
+request goes on, async views await the write with arecord().
+"""
+
+import asyncio
+import atexit
+import json
+import logging
+import os
+import threading
+from collections import deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .bulk import copy_rows
+from .models import AuditEvent, Patient
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ENABLED": True,
+    "DURABILITY": "async",
+    "FLUSH_INTERVAL": 1.0,
+    "BATCH_SIZE": 500,
+    "MAX_BUFFERED": 10000,
+}
+
+COLUMNS = [
+    "occurred_at",
+    "user_id",
+    "action",
+    "model",
+    "object_id",
+    "patient_id",
+    "fields",
+    "ip_address",
+]
+
+# The request being handled, for the receivers that record changes.
+current_request = ContextVar("audit_request", default=None)
+
+
+def get_actor(request=None):
+    """
+    Returns the id of the user making the current request and their address.
+    """
+    request = request or current_request.get()
+    if request is None:
+        return None, None
+    user = getattr(request, "user", None)
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    return user_id, request.META.get("REMOTE_ADDR")
+
+
+def make_event(action, model, object_id, patient_id, fields=None, request=None):
+    user_id, ip_address = get_actor(request)
+    return (
+        timezone.now(),
+        user_id,
+        action,
+        model,
+        object_id,
+        patient_id,
+        json.dumps(sorted(fields)) if fields else None,
+        ip_address,
+    )
+
+
+def make_instance_event(action, instance, fields=None, request=None):
+    patient_id = instance.pk if isinstance(instance, Patient) else instance.patient_id
+    return make_event(
+        action, instance._meta.model_name, instance.pk, patient_id, fields, request
+    )
+
+
+def in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class AuditLog:
+    """
+    Buffers audit events and writes them in batches.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Only one thread writes at a time, so events are written in order.
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.buffer = deque()
+        self.pid = None
+        self.thread = None
+        self.written = 0
+        self.dropped = 0
+        self.configure()
+        atexit.register(self.flush)
+
+    def configure(self):
+        options = {**DEFAULTS, **getattr(settings, "AUDIT_LOG", {})}
+        if options["DURABILITY"] not in ("async", "sync"):
+            raise ValueError('AUDIT_LOG["DURABILITY"] is "async" or "sync".')
+        self.enabled = options["ENABLED"]
+        self.durability = options["DURABILITY"]
+        self.flush_interval = options["FLUSH_INTERVAL"]
+        self.batch_size = options["BATCH_SIZE"]
+        self.max_buffered = options["MAX_BUFFERED"]
+        # A running flusher picks up the new interval.
+        self.wakeup.set()
+
+    def record(self, events):
+        if not self.enabled or not events:
+            return
+        if self.durability == "sync":
+            # Async code writes them with arecord(), the ORM refuses to here.
+            self.write(events)
+            return
+        overflow = self.buffer_entries(events)
+        if overflow and not in_event_loop():
+            # The flusher falls behind, the caller writes the buffer and its events
+            # itself.
+            self.flush(overflow)
+        elif overflow:
+            # The event loop of an async view can not wait for the database.
+            self.drop(len(overflow))
+        self.start()
+        if len(self.buffer) >= self.flush_size():
+            self.wakeup.set()
+
+    async def arecord(self, events):
+        """
+        Records events from async code, which awaits the write of "sync" durability
+        in a thread.
+        """
+        if self.enabled and events and self.durability == "sync":
+            await sync_to_async(self.write)(events)
+        else:
+            self.record(events)
+
+    def buffer_entries(self, events):
+        """
+        Buffers as many of `events` as there is room for and returns the rest.
+        """
+        with self.lock:
+            room = max(self.max_buffered - len(self.buffer), 0)
+            self.buffer.extend(events[:room])
+        return events[room:]
+
+    def drop(self, count):
+        with self.lock:
+            self.dropped += count
+        logger.error("The audit log buffer is full, dropped %s events.", count)
+
+    def flush_size(self):
+        return min(self.batch_size, self.max_buffered)
+
+    def record_changes(self, action, instances, fields=None):
+        """
+        Records changes of `instances` when the current transaction commits.
+        """
+        if self.enabled:
+            self.record_on_commit(
+                [
+                    make_instance_event(action, instance, fields)
+                    for instance in instances
+                ]
+            )
+
+    def record_on_commit(self, events, using=None):
+        """
+        Records `events` when the current transaction commits.
+        """
+        if self.enabled and events:
+            transaction.on_commit(lambda: self.record(events), using=using)
+
+    def write(self, events):
+        copy_rows(AuditEvent._meta.db_table, COLUMNS, events)
+
+    def flush(self, overflow=()):
+        """
+        Writes the buffered events and `overflow`. Returns the number of events
+        written.
+        """
+        with self.flush_lock:
+            with self.lock:
+                buffered, self.buffer = self.buffer, deque()
+            events = [*buffered, *overflow]
+            if not events:
+                return 0
+            try:
+                self.write(events)
+            except DatabaseError:
+                logger.exception("Writing %s audit events failed.", len(events))
+                with self.lock:
+                    # They are written with the next flush, as far as they fit.
+                    room = max(self.max_buffered - len(self.buffer), 0)
+                    kept = events[:room]
+                    self.buffer.extendleft(reversed(kept))
+                if len(events) > len(kept):
+                    self.drop(len(events) - len(kept))
+                return 0
+            self.written += len(events)
+            return len(events)
+
+    def start(self):
+        """
+        Starts the flusher of this process, again after a fork.
+        """
+        pid = os.getpid()
+        if self.pid == pid:
+            return
+        with self.lock:
+            if self.pid == pid:
+                return
+            if self.pid is not None:
+                # The parent writes the events it buffered before the fork.
+                self.buffer.clear()
+            self.pid = pid
+            self.thread = thread = threading.Thread(
+                target=self.run, name="audit-log", daemon=True
+            )
+        thread.start()
+
+    def stop(self):
+        """
+        Stops the flusher and writes the buffered events, like before the test
+        databases are destroyed. The next event starts a new flusher.
+        """
+        with self.lock:
+            thread, self.thread, self.pid = self.thread, None, None
+        if thread is not None:
+            self.stopping.set()
+            self.wakeup.set()
+            thread.join()
+            self.stopping.clear()
+        return self.flush()
+
+    def run(self):
+        try:
+            while not self.stopping.is_set():
+                woken = self.wakeup.wait(self.flush_interval)
+                self.wakeup.clear()
+                if self.stopping.is_set():
+                    break
+                # Being woken by configure() only restarts the wait with the new
+                # interval.
+                if not woken or len(self.buffer) >= self.flush_size():
+                    self.flush()
+                # The flusher's connection follows CONN_MAX_AGE like a request's.
+                close_old_connections()
+        finally:
+            connection.close()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "buffered": len(self.buffer),
+                "written": self.written,
+                "dropped": self.dropped,
+            }
+
+
+audit_log = AuditLog()
+
+
+@receiver(setting_changed)
+def reload_audit_log(*, setting, **kwargs):
+    if setting == "AUDIT_LOG":
+        audit_log.configure()
+
+
+def get_patient_events(patient_id):
+    """
+    Returns the audit trail of a patient and their assessments, latest first.
+    """
+    return AuditEvent.objects.filter(patient_id=patient_id).order_by(
+        "-occurred_at", "-id"
+    )
+
+
+class AuditMiddleware:
+    """
+    Makes the request available to the receivers that record changes.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+    async def __acall__(self, request):
+        token = current_request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+
+class AuditedReadMixin:
+    """
+    Records a read of the object a GET responded with.
+
+    The views set `self.object` when they check the permissions of the object (see
+    ConditionalObjectMixin).
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # Async views record in async_dispatch, where they can await the write.
+        if not getattr(self, "view_is_async", False) and self.is_read(
+            request, response
+        ):
+            audit_log.record(self.get_read_events(request, response))
+        return response
+
+    async def async_dispatch(self, request, *args, **kwargs):
+        response = await super().async_dispatch(request, *args, **kwargs)
+        if self.is_read(self.request, response):
+            await audit_log.arecord(self.get_read_events(self.request, response))
+        return response
+
+    def is_read(self, request, response):
+        return request.method == "GET" and response.status_code == 200
+
+    def get_read_events(self, request, response):
+        return [
+            make_instance_event(AuditEvent.Action.READ, self.object, request=request)
+        ]
+
+
+class AuditedListMixin(AuditedReadMixin):
+    """
+    Records a read of every patient a list responded with, also when it came from
+    the response cache.
+
+    Lists of another model set `audit_model` and the `audit_patient_key` of the
+    patient id in their rows, and record one read of that model per patient.
+    """
+
+    audit_model = "patient"
+    audit_patient_key = "id"
+
+    def get_read_events(self, request, response):
+        rows = response.data
+        if isinstance(rows, dict):
+            rows = rows["results"]
+        patient_ids = dict.fromkeys(row[self.audit_patient_key] for row in rows)
+        return [
+            make_event(
+                AuditEvent.Action.READ,
+                self.audit_model,
+                None,
+                patient_id,
+                request=request,
+            )
+            for patient_id in patient_ids
+        ]
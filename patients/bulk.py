@@ -0,0 +1,61 @@
+"""
+Bulk writes through Postgres COPY, for loads too large for bulk_create.
+
+COPY skips Django entirely: no signals are sent and field defaults such as auto_now
+are not applied, so callers pass every column they need. Row level triggers, such
+as the one maintaining Patient.search_vector, still fire.
+"""
+
+from io import StringIO
+
+from django.db import connection
+
+# Characters that have a meaning in COPY's text format.
+ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def format_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return str(value).translate(ESCAPES)
+
+
+def copy_rows(table, columns, rows, using=connection):
+    """
+    Writes `rows`, iterables of values in the order of `columns`, into `table` with
+    a single COPY. Returns the number of rows written.
+    """
+    buffer = StringIO()
+    count = 0
+    for row in rows:
+        buffer.write("\t".join(map(format_value, row)))
+        buffer.write("\n")
+        count += 1
+    if not count:
+        return 0
+    buffer.seek(0)
+    quote = using.ops.quote_name
+    with using.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {quote(table)} ({', '.join(map(quote, columns))}) FROM STDIN",
+            buffer,
+        )
+    return count
+
+
+def allocate_ids(model, count, using=connection):
+    """
+    Reserves `count` primary keys of `model` from its sequence, so rows that refer to
+    each other can be written with COPY before any of them exists.
+    """
+    if not count:
+        return []
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, %s))"
+            " FROM generate_series(1, %s)",
+            [model._meta.db_table, model._meta.pk.column, count],
+        )
+        return [pk for (pk,) in cursor.fetchall()]
@@ -0,0 +1,322 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from rest_framework.response import Response
+
+DEFAULTS = {
+    "ENABLED": True,
+    "CACHE_ALIAS": "default",
+    "TIMEOUT": 300,
+    "LRU_MAXSIZE": 1024,
+    "LRU_TIMEOUT": 30,
+}
+
+# Cache backends that keep their entries in the memory of one process.
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+# Cache backends that query the database on every lookup.
+DATABASE_BACKENDS = (DatabaseCache,)
+
+
+def get_shared_cache(alias, setting):
+    """
+    Returns the Django cache `alias`, which `setting` needs to be shared between the
+    worker processes. A process local backend is refused, unless SINGLE_PROCESS says
+    there is only one process, and so is a database backend, which would turn the
+    lookups of every request into queries.
+    """
+    cache = caches[alias]
+    if isinstance(cache, DATABASE_BACKENDS):
+        raise ImproperlyConfigured(
+            f'{setting}["CACHE_ALIAS"] names the {alias!r} cache, but its '
+            f"{type(cache).__name__} backend queries the database on every lookup. "
+            "Configure redis or memcached in CACHES."
+        )
+    if isinstance(cache, PROCESS_LOCAL_BACKENDS) and not settings.SINGLE_PROCESS:
+        raise ImproperlyConfigured(
+            f'{setting}["CACHE_ALIAS"] names the {alias!r} cache, but its '
+            f"{type(cache).__name__} backend is not shared between processes. "
+            "Configure a shared backend in CACHES, or set SINGLE_PROCESS when the "
+            "site runs in a single process."
+        )
+    return cache
+
+
+class LRUCache:
+    """
+    Thread safe in-process LRU mapping with a bounded number of entries, which
+    expire `timeout` seconds after they were set.
+    """
+
+    def __init__(self, maxsize, timeout=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class ResponseCache:
+    """
+    Caches list response data per clinician.
+
+    Entries are keyed on the clinician, the request path with its normalised query
+    parameters, the clinician's data version and today's date, on which the ages and the
+    age filters depend. Changing any of the clinician's patients, addresses or
+    assessments bumps the version (see patients.signals), so older entries are never
+    read again and age out of both tiers.
+
+    Lookups go to an in-process LRU first and then to the shared Django cache named by
+    RESPONSE_CACHE["CACHE_ALIAS"]. The data version always lives in the shared cache,
+    which therefore has to be shared between the worker processes (see
+    get_shared_cache), and in-process entries expire after LRU_TIMEOUT seconds.
+    """
+
+    def __init__(self):
+        self.configure()
+
+    def configure(self):
+        options = {**DEFAULTS, **getattr(settings, "RESPONSE_CACHE", {})}
+        self.enabled = options["ENABLED"]
+        self.timeout = options["TIMEOUT"]
+        self.shared = get_shared_cache(options["CACHE_ALIAS"], "RESPONSE_CACHE")
+        self.local = LRUCache(options["LRU_MAXSIZE"], options["LRU_TIMEOUT"])
+        self.shared_hits = 0
+
+    @staticmethod
+    def version_key(clinician_id):
+        return f"patients:data-version:{clinician_id}"
+
+    def get_version(self, clinician_id):
+        key = self.version_key(clinician_id)
+        version = self.shared.get(key)
+        if version is None:
+            # Start from a time based value rather than 0, so a version that was evicted
+            # from the shared cache can not collide with entries cached before.
+            self.shared.add(key, time.time_ns(), timeout=None)
+            version = self.shared.get(key)
+        return version
+
+    async def aget_version(self, clinician_id):
+        key = self.version_key(clinician_id)
+        version = await self.shared.aget(key)
+        if version is None:
+            await self.shared.aadd(key, time.time_ns(), timeout=None)
+            version = await self.shared.aget(key)
+        return version
+
+    def bump_version(self, clinician_id):
+        # The version is the time of the last change in nanoseconds, which also
+        # serves as the Last-Modified time of the clinician's lists.
+        self.shared.set(self.version_key(clinician_id), time.time_ns(), timeout=None)
+
+    def bump_versions(self, clinician_ids):
+        version = time.time_ns()
+        self.shared.set_many(
+            {self.version_key(clinician_id): version for clinician_id in clinician_ids},
+            timeout=None,
+        )
+
+    def get_request_version(self, request):
+        """
+        Returns the data version of the requesting clinician, looked up in the shared
+        cache once per request.
+        """
+        if not hasattr(request, "_data_version"):
+            request._data_version = self.get_version(request.user.pk)
+        return request._data_version
+
+    async def aget_request_version(self, request):
+        if not hasattr(request, "_data_version"):
+            request._data_version = await self.aget_version(request.user.pk)
+        return request._data_version
+
+    def make_key(self, request):
+        return self.build_key(request, self.get_request_version(request))
+
+    async def amake_key(self, request):
+        return self.build_key(request, await self.aget_request_version(request))
+
+    def build_key(self, request, version):
+        params = sorted(
+            (name, tuple(sorted(value for value in values if value != "")))
+            for name, values in request.query_params.lists()
+        )
+        query = "&".join(f"{name}={','.join(values)}" for name, values in params)
+        return (
+            f"patients:response:{request.user.pk}:{version}:{date.today()}:"
+            f"{request.get_host()}{request.path}?{query}"
+        )
+
+    def get(self, key):
+        data = self.local.get(key)
+        if data is None:
+            data = self.keep_shared_hit(key, self.shared.get(key))
+        return data
+
+    async def aget(self, key):
+        data = self.local.get(key)
+        if data is None:
+            data = self.keep_shared_hit(key, await self.shared.aget(key))
+        return data
+
+    def keep_shared_hit(self, key, data):
+        if data is not None:
+            self.shared_hits += 1
+            self.local.set(key, data)
+        return data
+
+    def set(self, key, data):
+        self.local.set(key, data)
+        self.shared.set(key, data, timeout=self.timeout)
+
+    async def aset(self, key, data):
+        self.local.set(key, data)
+        await self.shared.aset(key, data, timeout=self.timeout)
+
+    def stats(self):
+        return {**self.local.stats(), "shared_hits": self.shared_hits}
+
+
+response_cache = ResponseCache()
+
+
+@receiver(setting_changed)
+def reload_response_cache(*, setting, **kwargs):
+    if setting in ("RESPONSE_CACHE", "CACHES", "SINGLE_PROCESS"):
+        response_cache.configure()
+
+
+def invalidate_clinician(clinician_id):
+    """
+    Bumps the clinician's data version once the current transaction commits, so no
+    request can cache the old rows under the new version in between.
+    """
+    if clinician_id is not None:
+        transaction.on_commit(lambda: response_cache.bump_version(clinician_id))
+
+
+def invalidate_clinicians(clinician_ids):
+    """
+    invalidate_clinician() for many clinicians at once.
+    """
+    clinician_ids = sorted(set(clinician_ids))
+    if clinician_ids:
+        transaction.on_commit(lambda: response_cache.bump_versions(clinician_ids))
+
+
+class CachedListMixin:
+    """
+    Serves GET list responses of a generic view from the per-clinician response cache.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not response_cache.enabled:
+            return super().list(request, *args, **kwargs)
+
+        key = response_cache.make_key(request)
+        data = response_cache.get(key)
+        if data is not None:
+            return self.cache_hit(data)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            response_cache.set(key, response.data)
+        return self.cache_miss(response)
+
+    def cache_hit(self, data):
+        response = Response(data)
+        response["X-Cache"] = "HIT"
+        return response
+
+    def cache_miss(self, response):
+        response["X-Cache"] = "MISS"
+        return response
+
+
+class AsyncCachedListMixin(CachedListMixin):
+    """
+    CachedListMixin for the async views, listing with the async ORM on a miss and
+    reaching the shared cache through its async API.
+
+    The list is filtered in one thread hop, because filtersets may query to validate
+    their parameters, and then paginated and fetched with the async ORM. Serializing
+    runs on the event loop, where a relation that was not selected raises
+    SynchronousOnlyOperation instead of querying once per row.
+    """
+
+    async def alist(self, request, *args, **kwargs):
+        if not response_cache.enabled:
+            return await self.alist_uncached(request)
+
+        key = await response_cache.amake_key(request)
+        data = await response_cache.aget(key)
+        if data is not None:
+            return self.cache_hit(data)
+        response = await self.alist_uncached(request)
+        if response.status_code == 200:
+            await response_cache.aset(key, response.data)
+        return self.cache_miss(response)
+
+    async def alist_uncached(self, request):
+        queryset = await sync_to_async(self.filter_queryset)(self.get_queryset())
+        page = None
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        if page is None:
+            objects = [obj async for obj in queryset]
+            return Response(self.get_serializer(objects, many=True).data)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
@@ -0,0 +1,234 @@
+from datetime import date, datetime
+from hashlib import md5
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from .cache import response_cache
+
+READ_VALIDATOR_HEADERS = ("HTTP_IF_NONE_MATCH", "HTTP_IF_MODIFIED_SINCE")
+WRITE_VALIDATOR_HEADERS = ("HTTP_IF_MATCH", "HTTP_IF_UNMODIFIED_SINCE")
+
+
+def make_etag(*parts):
+    return '"{}"'.format(md5(":".join(map(str, parts)).encode()).hexdigest())
+
+
+def make_object_validators(label, pk, updated_at):
+    """
+    Returns the ETag and Last-Modified time of an object. Representations include
+    ages, so both also change with the date.
+    """
+    today = date.today()
+    return make_etag(label, pk, updated_at.isoformat(), today), max(
+        updated_at.timestamp(), start_of(today)
+    )
+
+
+def start_of(day):
+    return datetime.combine(day, datetime.min.time()).timestamp()
+
+
+def set_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    patch_vary_headers(response, ["Authorization"])
+    return response
+
+
+class ConditionalObjectMixin:
+    """
+    ETag and Last-Modified support for the RetrieveUpdateDestroy views.
+
+    The validators are derived from the object's updated_at and today's date.
+    Conditional requests are answered from `validator_queryset`, filtered by
+    `validator_lookups` (model lookup to URL keyword argument), with a lookup of
+    clinician_id and updated_at only: a matching If-None-Match or If-Modified-Since gets
+    a 304 without the object being fetched or serialized, and a failing If-Match or
+    If-Unmodified-Since on PUT, PATCH or DELETE gets a 412. For writes the row stays
+    locked until the write is done, so nothing can change it between the check and the
+    update.
+    """
+
+    not_found_message = "Not found."
+    validator_queryset = None
+    validator_lookups = {"pk": "pk"}
+
+    def get_validator_queryset(self):
+        assert self.validator_queryset is not None, (
+            f"'{self.__class__.__name__}' should include a `validator_queryset` "
+            "attribute."
+        )
+        return self.validator_queryset.filter(
+            **{
+                lookup: self.kwargs[kwarg]
+                for lookup, kwarg in self.validator_lookups.items()
+            }
+        )
+
+    def get_validators(self, obj):
+        return make_object_validators(obj._meta.label_lower, obj.pk, obj.updated_at)
+
+    def get_stored_validators(self, lock=False):
+        queryset = self.get_validator_queryset()
+        if lock:
+            queryset = queryset.select_for_update()
+        row = queryset.values("pk", "clinician_id", "updated_at").first()
+        return self.get_row_validators(queryset, row)
+
+    async def aget_stored_validators(self):
+        queryset = self.get_validator_queryset()
+        row = await queryset.values("pk", "clinician_id", "updated_at").afirst()
+        return self.get_row_validators(queryset, row)
+
+    def get_row_validators(self, queryset, row):
+        if row is None:
+            raise NotFound(self.not_found_message)
+        if row["clinician_id"] != self.request.user.pk:
+            self.permission_denied(self.request)
+        return make_object_validators(
+            queryset.model._meta.label_lower, row["pk"], row["updated_at"]
+        )
+
+    def check_object_permissions(self, request, obj):
+        # Every get_object() of these views ends here, which makes it the place to
+        # remember the object the validators of the response are built from.
+        super().check_object_permissions(request, obj)
+        self.object = obj
+
+    def get(self, request, *args, **kwargs):
+        if any(header in request.META for header in READ_VALIDATOR_HEADERS):
+            etag, last_modified = self.get_stored_validators()
+            response = get_conditional_response(
+                request, etag=etag, last_modified=int(last_modified)
+            )
+            if response is not None:
+                return set_validators(response, etag, last_modified)
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_validators(response, *self.get_validators(self.object))
+        return response
+
+    def put(self, request, *args, **kwargs):
+        return self.conditional_write(super().put, request, *args, **kwargs)
+
+    def patch(self, request, *args, **kwargs):
+        return self.conditional_write(super().patch, request, *args, **kwargs)
+
+    def delete(self, request, *args, **kwargs):
+        return self.conditional_write(super().delete, request, *args, **kwargs)
+
+    def conditional_write(self, handler, request, *args, **kwargs):
+        with transaction.atomic():
+            if any(header in request.META for header in WRITE_VALIDATOR_HEADERS):
+                etag, last_modified = self.get_stored_validators(lock=True)
+                response = get_conditional_response(
+                    request, etag=etag, last_modified=int(last_modified)
+                )
+                if response is not None:
+                    return response
+            response = handler(request, *args, **kwargs)
+
+        if response.status_code == 200:
+            set_validators(response, *self.get_validators(self.object))
+        return response
+
+
+class AsyncConditionalObjectMixin(ConditionalObjectMixin):
+    """
+    ConditionalObjectMixin for the async views. GET is answered with the async ORM,
+    the writes run the synchronous handlers in a thread.
+
+    The object is fetched from the validator queryset with the relations in
+    `object_select_related`, so the serializer does not query.
+    """
+
+    object_select_related = ()
+
+    async def aget_object(self):
+        queryset = self.get_validator_queryset().select_related(
+            *self.object_select_related
+        )
+        obj = await queryset.afirst()
+        if obj is None:
+            raise NotFound(self.not_found_message)
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def get(self, request, *args, **kwargs):
+        if any(header in request.META for header in READ_VALIDATOR_HEADERS):
+            etag, last_modified = await self.aget_stored_validators()
+            response = get_conditional_response(
+                request, etag=etag, last_modified=int(last_modified)
+            )
+            if response is not None:
+                return set_validators(response, etag, last_modified)
+
+        instance = await self.aget_object()
+        response = Response(self.get_serializer(instance).data)
+        return set_validators(response, *self.get_validators(instance))
+
+    async def put(self, request, *args, **kwargs):
+        return await sync_to_async(super().put)(request, *args, **kwargs)
+
+    async def patch(self, request, *args, **kwargs):
+        return await sync_to_async(super().patch)(request, *args, **kwargs)
+
+    async def delete(self, request, *args, **kwargs):
+        return await sync_to_async(super().delete)(request, *args, **kwargs)
+
+
+class ConditionalListMixin:
+    """
+    ETag and Last-Modified support for the list views.
+
+    The validators are derived from the clinician's data version kept by the response
+    cache (see patients.cache), together with the normalised query parameters and
+    today's date. A matching conditional GET is answered with a 304 without touching
+    the database.
+    """
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_list_validators(
+            response_cache.make_key(request),
+            response_cache.get_request_version(request),
+        )
+        response = get_conditional_response(
+            request, etag=etag, last_modified=int(last_modified)
+        )
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return self.set_list_validators(response, etag, last_modified)
+
+    def get_list_validators(self, key, version):
+        # The key includes the date already.
+        return make_etag(key), max(version / 10**9, start_of(date.today()))
+
+    def set_list_validators(self, response, etag, last_modified):
+        if response.status_code in (200, 304):
+            set_validators(response, etag, last_modified)
+        return response
+
+
+class AsyncConditionalListMixin(ConditionalListMixin):
+    """
+    ConditionalListMixin for the async views, reading the data version with the
+    async cache API.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_list_validators(
+            await response_cache.amake_key(request),
+            await response_cache.aget_request_version(request),
+        )
+        response = get_conditional_response(
+            request, etag=etag, last_modified=int(last_modified)
+        )
+        if response is None:
+            response = await self.alist(request, *args, **kwargs)
+        return self.set_list_validators(response, etag, last_modified)
@@ -1,6 +1,9 @@
-from django_filters import ChoiceFilter, DateFromToRangeFilter, FilterSet
+from datetime import date
 
-from .models import Assessment, Patient
+from django_filters import ChoiceFilter, DateFromToRangeFilter, FilterSet, NumberFilter
+from rest_framework.filters import OrderingFilter
+
+from .models import Assessment, AssessmentDailyRollup, Patient, years_before
 
 Genders = [
     ("male", "Male"),
@@ -15,14 +18,35 @@ Assessment_type = [
     ("emotional", "Emotional Well-being"),
 ]
 
+# Upper bound of the age filters, in years.
+MAX_AGE = 150
+
 
 class GenderFilter(FilterSet):
+    """
+    Filters patients by gender and age range. The age bounds are turned into
+    date_of_birth range predicates so they can use the date_of_birth index. Both
+    bounds are inclusive and capped so the dates stay representable.
+    """
+
     gender = ChoiceFilter(choices=Genders)
+    min_age = NumberFilter(method="filter_min_age", min_value=0, max_value=MAX_AGE)
+    max_age = NumberFilter(method="filter_max_age", min_value=0, max_value=MAX_AGE)
 
     class Meta:
         model = Patient
         fields = ["gender"]
 
+    def filter_min_age(self, queryset, name, value):
+        return queryset.filter(
+            date_of_birth__lte=years_before(date.today(), int(value))
+        )
+
+    def filter_max_age(self, queryset, name, value):
+        return queryset.filter(
+            date_of_birth__gt=years_before(date.today(), int(value) + 1)
+        )
+
 
 class AssessmentTypeFilter(FilterSet):
     assessment_type = ChoiceFilter(choices=Assessment_type)
@@ -31,3 +55,36 @@ class AssessmentTypeFilter(FilterSet):
     class Meta:
         model = Assessment
         fields = ["assessment_type", "assessment_date", "patient"]
+
+
+class AssessmentSummaryFilter(FilterSet):
+    assessment_type = ChoiceFilter(choices=Assessment_type)
+    day = DateFromToRangeFilter()
+
+    class Meta:
+        model = AssessmentDailyRollup
+        fields = ["assessment_type", "day"]
+
+
+class PatientOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter that accepts `age`, ordering by date of birth in the opposite
+    direction instead of by a computed age, so the date_of_birth index is used.
+    """
+
+    ordering_aliases = {"age": "-date_of_birth"}
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        return [self.resolve_alias(term) for term in ordering]
+
+    def resolve_alias(self, term):
+        descending = term.startswith("-")
+        field = self.ordering_aliases.get(term.lstrip("-"))
+        if field is None:
+            return term
+        if descending:
+            return field[1:] if field.startswith("-") else f"-{field}"
+        return field
@@ -0,0 +1,623 @@
+"""
+Bulk import of patients and assessments from legacy CSV exports, see the
+import_healthtrack command.
+
+The files are loaded with COPY into temporary staging tables of text columns, so a
+malformed value never stops the load. Validation and normalisation are set-wise
+statements on the staging tables: every check marks the rows it fails with a reason,
+and later checks skip rows that already failed. Phone numbers are normalised to
+E.164 in SQL from the row's country (or the default region) and then validated once
+per distinct number with phonenumbers, the library PhoneNumberField validates with.
+
+Valid rows are merged into the real tables with INSERT ... SELECT. Patients are
+matched by their phone number, so importing a file again updates them instead of
+creating duplicates, and assessments that already exist are rejected. COPY and
+INSERT ... SELECT send no signals, so the score rollups, the response cache and the
+audit trail are updated here. Everything runs in the caller's transaction.
+"""
+
+import csv
+import json
+
+import phonenumbers
+from django.db import connection
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django_countries import countries
+
+from users.models import User
+
+from . import rollups
+from .audit import audit_log, make_event
+from .bulk import copy_rows
+from .cache import invalidate_clinician
+from .models import Address, Assessment, AuditEvent, Patient
+
+# Columns of the files, the first row of a file names the ones it has.
+PATIENT_COLUMNS = [
+    # The patient's id in the legacy system, assessments refer to it.
+    "id",
+    # Email of the patient's clinician, or pass a default clinician.
+    "clinician",
+    "first_name",
+    "last_name",
+    "gender",
+    "phone_number",
+    "date_of_birth",
+    "address_one",
+    "address_two",
+    "city",
+    "postal_code",
+    # ISO 3166 code (GB or GBR) or English name.
+    "country",
+]
+PATIENT_REQUIRED = [
+    "first_name",
+    "last_name",
+    "phone_number",
+    "date_of_birth",
+    "address_one",
+]
+ASSESSMENT_COLUMNS = [
+    "id",
+    # Legacy id of the patient, in the patients file.
+    "patient",
+    "assessment_type",
+    "assessment_date",
+    "final_score",
+    "question",
+]
+ASSESSMENT_REQUIRED = ["patient", "assessment_type", "assessment_date", "final_score"]
+
+# Accepted spellings, lower case, of the choices.
+GENDERS = {
+    spelling: value
+    for value, label in Patient.Gender.choices
+    for spelling in (value, label.lower(), value[0])
+}
+ASSESSMENT_TYPES = {
+    spelling: value
+    for value, label in Assessment.TYPES.choices
+    for spelling in (value, label.lower())
+}
+
+STAGING_SQL = """
+DROP TABLE IF EXISTS import_patients, import_assessments, import_invalid_phone_numbers;
+CREATE TEMP TABLE import_patients (
+    line bigint GENERATED ALWAYS AS IDENTITY,
+    {patient_columns},
+    clinician_id bigint,
+    new_gender text,
+    new_phone_number text,
+    new_date_of_birth date,
+    new_country text,
+    patient_id bigint,
+    address_id bigint,
+    owner_id bigint,
+    address_changed boolean,
+    reject text,
+    detail text
+) ON COMMIT DROP;
+CREATE TEMP TABLE import_assessments (
+    line bigint GENERATED ALWAYS AS IDENTITY,
+    {assessment_columns},
+    patient_id bigint,
+    clinician_id bigint,
+    existing_patient boolean,
+    new_assessment_type text,
+    new_assessment_date timestamptz,
+    new_final_score numeric,
+    reject text,
+    detail text
+) ON COMMIT DROP;
+CREATE TEMP TABLE import_invalid_phone_numbers (
+    phone_number text PRIMARY KEY
+) ON COMMIT DROP;
+"""
+
+# Casts that return NULL instead of failing. Dates have to be ISO 8601, other
+# formats depend on DateStyle and are ambiguous.
+CASTS = [
+    ("import_date", "date", r"^\d{4}-\d{2}-\d{2}$"),
+    ("import_timestamp", "timestamptz", r"^\d{4}-\d{2}-\d{2}([ T]|$)"),
+]
+CAST_SQL = """
+CREATE OR REPLACE FUNCTION pg_temp.{name}(value text) RETURNS {type} AS $$
+    SELECT CASE
+        WHEN value ~ '{pattern}' AND pg_input_is_valid(value, '{type}')
+        THEN value::{type}
+    END
+$$ LANGUAGE sql STABLE
+"""
+# pg_input_is_valid() is new in Postgres 16. Before it the failed cast is caught,
+# which costs a subtransaction per value.
+CAST_BEFORE_16_SQL = """
+CREATE OR REPLACE FUNCTION pg_temp.{name}(value text) RETURNS {type} AS $$
+BEGIN
+    IF value !~ '{pattern}' THEN
+        RETURN NULL;
+    END IF;
+    RETURN value::{type};
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql STABLE
+"""
+
+NEW_IDS_SQL = """
+UPDATE import_patients
+SET {column} = nextval(pg_get_serial_sequence(%s, 'id'))
+WHERE reject IS NULL AND {column} IS NULL
+"""
+
+# Marks the rows whose address was created or changed, for MERGE_PATIENTS_SQL.
+MERGE_ADDRESSES_SQL = """
+WITH changed AS (
+    INSERT INTO {table} AS address (
+        id, address_one, address_two, country, city, postal_code
+    )
+    SELECT address_id, address_one, address_two, new_country, city, postal_code
+    FROM import_patients
+    WHERE reject IS NULL
+    ON CONFLICT (id) DO UPDATE SET
+        address_one = EXCLUDED.address_one,
+        address_two = EXCLUDED.address_two,
+        country = EXCLUDED.country,
+        city = EXCLUDED.city,
+        postal_code = EXCLUDED.postal_code
+    WHERE (
+        address.address_one, address.address_two, address.country, address.city,
+        address.postal_code
+    ) IS DISTINCT FROM (
+        EXCLUDED.address_one, EXCLUDED.address_two, EXCLUDED.country, EXCLUDED.city,
+        EXCLUDED.postal_code
+    )
+    RETURNING id
+)
+UPDATE import_patients AS t SET address_changed = true
+FROM changed
+WHERE t.address_id = changed.id
+"""
+
+# Patients whose values and address did not change are left alone, so importing a
+# file again does not touch their updated_at (and ETags).
+MERGE_PATIENTS_SQL = """
+INSERT INTO {table} AS patient (
+    id, clinician_id, address_id, first_name, last_name, gender, phone_number,
+    date_of_birth, created_at, updated_at
+)
+SELECT
+    patient_id, clinician_id, address_id, first_name, last_name, new_gender,
+    new_phone_number, new_date_of_birth, %(now)s, %(now)s
+FROM import_patients
+WHERE reject IS NULL
+ORDER BY patient_id
+ON CONFLICT (id) DO UPDATE SET
+    address_id = EXCLUDED.address_id,
+    first_name = EXCLUDED.first_name,
+    last_name = EXCLUDED.last_name,
+    gender = EXCLUDED.gender,
+    date_of_birth = EXCLUDED.date_of_birth,
+    updated_at = EXCLUDED.updated_at
+WHERE (
+    patient.address_id, patient.first_name, patient.last_name, patient.gender,
+    patient.date_of_birth
+) IS DISTINCT FROM (
+    EXCLUDED.address_id, EXCLUDED.first_name, EXCLUDED.last_name, EXCLUDED.gender,
+    EXCLUDED.date_of_birth
+) OR EXISTS (
+    SELECT FROM import_patients AS t
+    WHERE t.patient_id = patient.id AND t.address_changed
+)
+RETURNING id, xmax = 0
+"""
+
+MERGE_ASSESSMENTS_SQL = """
+INSERT INTO {table} (
+    clinician_id, patient_id, assessment_type, assessment_date, updated_at,
+    question, final_score
+)
+SELECT
+    clinician_id, patient_id, new_assessment_type, new_assessment_date, %s,
+    question, new_final_score
+FROM import_assessments
+WHERE reject IS NULL
+ORDER BY clinician_id, patient_id, new_assessment_date
+RETURNING id, patient_id
+"""
+
+
+def get_countries():
+    """
+    Returns the ISO 3166 codes by lower case alpha-2 code, alpha-3 code and name,
+    and the calling code and trunk prefix of phone numbers by code.
+    """
+    codes, phone_prefixes = {}, {}
+    for country in countries:
+        for name in (country.code, countries.alpha3(country.code), country.name):
+            codes.setdefault(str(name).lower(), country.code)
+        metadata = phonenumbers.PhoneMetadata.metadata_for_region(country.code)
+        if metadata is not None:
+            phone_prefixes[country.code] = [
+                str(metadata.country_code),
+                metadata.national_prefix or "",
+            ]
+    return codes, phone_prefixes
+
+
+def is_valid_phone_number(number):
+    try:
+        return phonenumbers.is_valid_number(phonenumbers.parse(number))
+    except phonenumbers.NumberParseException:
+        return False
+
+
+class LegacyImport:
+    """
+    One import of a patients file and, optionally, an assessments file. Call
+    load_patients() and load_assessments(), then validate() and merge().
+    """
+
+    def __init__(self, clinician=None, region="US", using=connection):
+        if not phonenumbers.country_code_for_region(region):
+            raise ValueError(f"{region} is not a region with phone numbers.")
+        self.clinician = clinician
+        self.region = region
+        self.using = using
+        self.columns = {}
+        quote = using.ops.quote_name
+        with using.cursor() as cursor:
+            cursor.execute(
+                STAGING_SQL.format(
+                    patient_columns=", ".join(
+                        f"{quote(column)} text" for column in PATIENT_COLUMNS
+                    ),
+                    assessment_columns=", ".join(
+                        f"{quote(column)} text" for column in ASSESSMENT_COLUMNS
+                    ),
+                )
+            )
+            cast_sql = CAST_SQL if using.pg_version >= 160000 else CAST_BEFORE_16_SQL
+            for name, kind, pattern in CASTS:
+                cursor.execute(cast_sql.format(name=name, type=kind, pattern=pattern))
+
+    def execute(self, sql, params=None):
+        with self.using.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+    def fetch(self, sql, params=None):
+        with self.using.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def load(self, table, file, known, required):
+        """
+        Copies a CSV file, whose first row names its columns, into a staging table.
+        """
+        header = next(csv.reader([file.readline()]), [])
+        columns = [column.strip().lower() for column in header]
+        unknown = sorted(set(columns) - set(known))
+        if unknown:
+            raise ValueError(
+                f"Unknown columns in the {table[7:]}: {', '.join(unknown)}."
+            )
+        missing = [column for column in required if column not in columns]
+        if missing:
+            raise ValueError(
+                f"Missing columns in the {table[7:]}: {', '.join(missing)}."
+            )
+        if len(set(columns)) != len(columns):
+            raise ValueError(f"Repeated columns in the {table[7:]}.")
+        self.columns[table] = columns
+
+        quote = self.using.ops.quote_name
+        with self.using.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {table} ({', '.join(map(quote, columns))})"
+                " FROM STDIN WITH (FORMAT csv)",
+                file,
+            )
+            count = cursor.rowcount
+        # Blank values are missing values.
+        self.execute(
+            f"UPDATE {table} SET "
+            + ", ".join(f"{quote(c)} = NULLIF(btrim({quote(c)}), '')" for c in columns)
+        )
+        self.execute(f"ANALYZE {table}")
+        return count
+
+    def load_patients(self, file):
+        required = PATIENT_REQUIRED
+        if self.clinician is None:
+            required = [*required, "clinician"]
+        return self.load("import_patients", file, PATIENT_COLUMNS, required)
+
+    def load_assessments(self, file):
+        return self.load(
+            "import_assessments", file, ASSESSMENT_COLUMNS, ASSESSMENT_REQUIRED
+        )
+
+    def reject(self, table, reason, where, params=(), source="", detail="NULL"):
+        """
+        Marks the rows of `table` (aliased as t) matching `where` that did not fail
+        an earlier check as rejected for `reason`.
+        """
+        return self.execute(
+            f"UPDATE {table} AS t SET reject = %s, detail = {detail} {source}"
+            f" WHERE t.reject IS NULL AND ({where})",
+            [reason, *params],
+        )
+
+    def validate(self):
+        self.validate_patients()
+        if "import_assessments" in self.columns:
+            self.validate_assessments()
+
+    def validate_patients(self):
+        table = "import_patients"
+        for column in PATIENT_REQUIRED:
+            self.reject(table, f"missing {column}", f"t.{column} IS NULL")
+
+        # Every row is rewritten by an UPDATE, so all values are normalised by one.
+        with self.using.cursor() as cursor:
+            cursor.execute(
+                f"SELECT DISTINCT lower(clinician) FROM {table}"
+                " WHERE clinician IS NOT NULL"
+            )
+            emails = [email for (email,) in cursor.fetchall()]
+        clinicians = dict(
+            User.objects.annotate(key=Lower("email"))
+            .filter(key__in=emails)
+            .values_list("key", "pk")
+        )
+        codes, self.phone_prefixes = get_countries()
+        self.execute(
+            f"UPDATE {table} AS t SET"
+            " clinician_id = CASE WHEN t.clinician IS NULL THEN %(clinician)s"
+            " ELSE (%(clinicians)s::jsonb ->> lower(t.clinician))::bigint END,"
+            " new_gender = CASE WHEN t.gender IS NULL THEN %(other)s"
+            " ELSE %(genders)s::jsonb ->> lower(t.gender) END,"
+            " new_date_of_birth = pg_temp.import_date(t.date_of_birth),"
+            " new_country = %(codes)s::jsonb ->> lower(t.country),"
+            # Only digits and a leading + or 00 count, a (0) is a trunk prefix written
+            # after the country code (+44 (0)20 ...).
+            r" new_phone_number = regexp_replace(t.phone_number, '\(0\)|[^0-9+]', '',"
+            " 'g') WHERE t.reject IS NULL",
+            {
+                "clinician": self.clinician and self.clinician.pk,
+                "clinicians": json.dumps(clinicians),
+                "other": Patient.Gender.OTHER,
+                "genders": json.dumps(GENDERS),
+                "codes": json.dumps(codes, ensure_ascii=False),
+            },
+        )
+        self.reject(table, "unknown clinician", "t.clinician_id IS NULL")
+        self.reject(table, "invalid gender", "t.new_gender IS NULL")
+        self.reject(
+            table,
+            "invalid date of birth",
+            "t.new_date_of_birth IS NULL OR t.new_date_of_birth > CURRENT_DATE"
+            " OR t.new_date_of_birth < '1900-01-01'",
+        )
+        self.reject(
+            table, "unknown country", "t.country IS NOT NULL AND t.new_country IS NULL"
+        )
+
+        self.normalise_phone_numbers()
+
+        # The first of the rows sharing a value is imported.
+        for column, reason in [
+            ("id", "duplicate id"),
+            ("new_phone_number", "duplicate phone number"),
+        ]:
+            self.reject(
+                table,
+                reason,
+                f"t.{column} = first.value AND t.line > first.line",
+                source=f"FROM (SELECT {column} AS value, min(line) AS line"
+                f" FROM {table} WHERE reject IS NULL AND {column} IS NOT NULL"
+                " GROUP BY 1 HAVING count(*) > 1) AS first",
+                detail="'row ' || first.line",
+            )
+
+        self.execute(
+            f"UPDATE {table} AS t"
+            " SET patient_id = p.id, address_id = p.address_id,"
+            " owner_id = p.clinician_id"
+            f" FROM {Patient._meta.db_table} AS p"
+            " WHERE t.reject IS NULL AND p.phone_number = t.new_phone_number"
+        )
+        self.reject(
+            table,
+            "phone number of another clinician's patient",
+            "t.owner_id <> t.clinician_id",
+        )
+
+        # New patients get their ids now, so assessments can refer to them.
+        for model, column in [(Patient, "patient_id"), (Address, "address_id")]:
+            self.execute(NEW_IDS_SQL.format(column=column), [model._meta.db_table])
+
+    def normalise_phone_numbers(self):
+        table = "import_patients"
+        # National numbers get the calling code of the patient's country, without
+        # the trunk prefix.
+        prefixes = "(%(prefixes)s::jsonb -> COALESCE(t.new_country, %(region)s))"
+        number = "replace(t.new_phone_number, '+', '')"
+        self.execute(
+            f"UPDATE {table} AS t SET new_phone_number = CASE"
+            f" WHEN t.new_phone_number LIKE '+%%' THEN '+' || {number}"
+            f" WHEN t.new_phone_number LIKE '00%%' THEN '+' || substr({number}, 3)"
+            f" ELSE '+' || ({prefixes} ->> 0)"
+            f" || regexp_replace({number}, '^' || ({prefixes} ->> 1), '')"
+            " END WHERE t.reject IS NULL",
+            {"prefixes": json.dumps(self.phone_prefixes), "region": self.region},
+        )
+        self.reject(
+            table, "invalid phone number", r"t.new_phone_number !~ '^\+[1-9]\d{6,14}$'"
+        )
+
+        with self.using.chunked_cursor() as cursor:
+            cursor.execute(
+                f"SELECT DISTINCT new_phone_number FROM {table} WHERE reject IS NULL"
+            )
+            invalid = [
+                [number] for (number,) in cursor if not is_valid_phone_number(number)
+            ]
+        copy_rows(
+            "import_invalid_phone_numbers", ["phone_number"], invalid, using=self.using
+        )
+        self.reject(
+            table,
+            "invalid phone number",
+            "t.new_phone_number = i.phone_number",
+            source="FROM import_invalid_phone_numbers AS i",
+            detail="t.new_phone_number",
+        )
+
+    def validate_assessments(self):
+        table = "import_assessments"
+        for column in ASSESSMENT_REQUIRED:
+            self.reject(table, f"missing {column}", f"t.{column} IS NULL")
+
+        # Decimal commas are accepted, scores are rounded like the API rounds them.
+        self.execute(
+            f"UPDATE {table} AS t SET"
+            " patient_id = p.patient_id,"
+            " clinician_id = p.clinician_id,"
+            " existing_patient = p.owner_id IS NOT NULL,"
+            " new_assessment_type = %s::jsonb ->> lower(t.assessment_type),"
+            " new_assessment_date = pg_temp.import_timestamp(t.assessment_date),"
+            " new_final_score = CASE"
+            r" WHEN t.final_score ~ '^[+-]?(\d+([.,]\d*)?|[.,]\d+)$'"
+            " THEN round(replace(t.final_score, ',', '.')::numeric, 1) END"
+            " FROM import_patients AS p"
+            " WHERE t.reject IS NULL AND p.id = t.patient AND p.reject IS NULL",
+            [json.dumps(ASSESSMENT_TYPES)],
+        )
+        self.reject(
+            table,
+            "patient was rejected",
+            "t.patient_id IS NULL AND p.id = t.patient AND p.reject IS NOT NULL",
+            source="FROM import_patients AS p",
+            detail="'row ' || p.line",
+        )
+        self.reject(table, "unknown patient", "t.patient_id IS NULL")
+        self.reject(table, "invalid assessment type", "t.new_assessment_type IS NULL")
+        self.reject(table, "invalid assessment date", "t.new_assessment_date IS NULL")
+        self.reject(
+            table, "assessment date in the future", "t.new_assessment_date > now()"
+        )
+        self.reject(table, "invalid score", "t.new_final_score IS NULL")
+        self.reject(
+            table,
+            "score out of range",
+            "t.new_final_score NOT BETWEEN 1.0 AND 10.0",
+            detail="t.new_final_score::text",
+        )
+
+        key = ["patient_id", "new_assessment_type", "new_assessment_date"]
+        self.reject(
+            table,
+            "duplicate assessment",
+            " AND ".join(f"t.{column} = first.{column}" for column in key)
+            + " AND t.line > first.line",
+            source=f"FROM (SELECT {', '.join(key)}, min(line) AS line FROM {table}"
+            " WHERE reject IS NULL GROUP BY 1, 2, 3 HAVING count(*) > 1) AS first",
+            detail="'row ' || first.line",
+        )
+        # Only patients that existed before the import can have their assessments.
+        self.reject(
+            table,
+            "already imported",
+            f"t.existing_patient AND EXISTS (SELECT FROM {Assessment._meta.db_table}"
+            " AS a WHERE a.clinician_id = t.clinician_id"
+            " AND a.patient_id = t.patient_id"
+            " AND a.assessment_date = t.new_assessment_date"
+            " AND a.assessment_type = t.new_assessment_type)",
+        )
+
+    def merge(self):
+        """
+        Writes the valid rows. Returns the numbers of created and updated patients
+        and of created assessments.
+        """
+        with self.using.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FILTER (WHERE owner_id IS NULL),"
+                " array_agg(DISTINCT clinician_id)"
+                " FROM import_patients WHERE reject IS NULL"
+            )
+            created, clinicians = cursor.fetchone()
+        self.execute(MERGE_ADDRESSES_SQL.format(table=Address._meta.db_table))
+        now = timezone.now()
+        # xmax is 0 for the inserted rows.
+        patients = self.fetch(
+            MERGE_PATIENTS_SQL.format(table=Patient._meta.db_table), {"now": now}
+        )
+        events = [
+            make_event(
+                AuditEvent.Action.CREATE if inserted else AuditEvent.Action.UPDATE,
+                "patient",
+                pk,
+                pk,
+            )
+            for pk, inserted in patients
+        ]
+
+        assessments = []
+        if "import_assessments" in self.columns:
+            assessments = self.fetch(
+                MERGE_ASSESSMENTS_SQL.format(table=Assessment._meta.db_table), [now]
+            )
+            events += [
+                make_event(AuditEvent.Action.CREATE, "assessment", pk, patient_id)
+                for pk, patient_id in assessments
+            ]
+            with self.using.cursor() as cursor:
+                cursor.execute(
+                    "SELECT array_agg(DISTINCT clinician_id)"
+                    " FROM import_assessments WHERE reject IS NULL"
+                )
+                assessed = cursor.fetchone()[0] or []
+            if assessed:
+                rollups.rebuild(assessed)
+
+        for clinician_id in clinicians or []:
+            invalidate_clinician(clinician_id)
+        audit_log.record_on_commit(events, using=self.using.alias)
+        return created, len(patients) - created, len(assessments)
+
+    def reject_counts(self):
+        """
+        Returns (file, reason, count) rows.
+        """
+        with self.using.cursor() as cursor:
+            cursor.execute(
+                "SELECT 'patients', reject, count(*) FROM import_patients"
+                " WHERE reject IS NOT NULL GROUP BY 2"
+                " UNION ALL"
+                " SELECT 'assessments', reject, count(*) FROM import_assessments"
+                " WHERE reject IS NOT NULL GROUP BY 2"
+                " ORDER BY 1 DESC, 3 DESC, 2"
+            )
+            return cursor.fetchall()
+
+    def rejects(self):
+        """
+        Yields (file, row, reason, detail, values) of the rejected rows, rows being
+        numbered from 1 after the header and values a JSON object of the row.
+        """
+        quote = self.using.ops.quote_name
+        for table in ["import_patients", "import_assessments"]:
+            columns = self.columns.get(table)
+            if not columns:
+                continue
+            values = ", ".join(f"'{column}', {quote(column)}" for column in columns)
+            with self.using.chunked_cursor() as cursor:
+                cursor.execute(
+                    f"SELECT line, reject, detail, json_build_object({values})::text"
+                    f" FROM {table} WHERE reject IS NOT NULL ORDER BY line"
+                )
+                for row in cursor:
+                    yield (table[7:], *row)
@@ -0,0 +1,277 @@
+"""
+Background jobs, kept in the Job table and run by `python manage.py run_jobs`.
+
+A job is a function registered under a name with `register`; `enqueue` inserts a row
+with its keyword arguments, in the current transaction, so a job enqueued by a
+request that rolls back never runs. Workers claim the due job of the highest
+priority with SELECT ... FOR UPDATE SKIP LOCKED, which lets any number of them poll
+the table without waiting on each other or running a job twice.
+
+A claimed job is leased to its worker for JOB_QUEUE["LEASE"] seconds, the worker
+renews the lease while the job runs. A job that raises is retried after an
+exponential backoff until it made `max_attempts` attempts; one whose worker died is
+run again once its lease ran out. Jobs can run more than once, so they have to be
+safe to repeat.
+"""
+
+import io
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "POLL_INTERVAL": 1.0,
+    "LEASE": 300,
+    "MAX_ATTEMPTS": 5,
+    "BACKOFF": 10,
+    "MAX_BACKOFF": 3600,
+}
+
+registry = {}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "JOB_QUEUE", {})}
+
+
+def register(name, *, priority=0, max_attempts=None):
+    """
+    Registers the decorated function as the job `name`, with the default priority and
+    attempts of its jobs.
+    """
+
+    def decorator(func):
+        registry[name] = (func, priority, max_attempts)
+        return func
+
+    return decorator
+
+
+def enqueue(
+    name, *, priority=None, run_at=None, max_attempts=None, user=None, **kwargs
+):
+    """
+    Queues the job `name` to be called with `kwargs`, which have to be JSON
+    serializable. Workers see it once the current transaction commits.
+    """
+    if name not in registry:
+        raise ValueError(f"There is no job {name!r}.")
+    _, default_priority, default_attempts = registry[name]
+    return Job.objects.create(
+        name=name,
+        payload=kwargs,
+        priority=default_priority if priority is None else priority,
+        run_at=run_at or timezone.now(),
+        max_attempts=(
+            max_attempts or default_attempts or get_options()["MAX_ATTEMPTS"]
+        ),
+        user_id=user.pk if user else None,
+    )
+
+
+def get_backoff(attempts):
+    """
+    Returns the delay before retrying a job that failed `attempts` times, doubling
+    with every attempt and spread over its upper half so retries do not bunch up.
+    """
+    options = get_options()
+    delay = min(options["BACKOFF"] * 2 ** (attempts - 1), options["MAX_BACKOFF"])
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def claim(worker):
+    """
+    Takes the next due job for `worker` and marks it as running, or returns None.
+    """
+    lease = timedelta(seconds=get_options()["LEASE"])
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            job = (
+                Job.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=Job.Status.QUEUED, run_at__lte=now)
+                    | Q(status=Job.Status.RUNNING, locked_until__lt=now)
+                )
+                .order_by("-priority", "run_at", "id")
+                .first()
+            )
+            if job is None:
+                return None
+            if job.status == Job.Status.RUNNING and job.attempts >= job.max_attempts:
+                job.status = Job.Status.FAILED
+                job.error = f"The worker running it ({job.locked_by}) stopped."
+                job.finished_at = now
+                job.locked_by = job.locked_until = None
+                job.save()
+                continue
+            job.status = Job.Status.RUNNING
+            job.attempts += 1
+            job.started_at = now
+            job.locked_by = worker
+            job.locked_until = now + lease
+            job.save()
+            return job
+
+
+def execute(job):
+    """
+    Runs a claimed job and records its outcome. Returns whether it succeeded.
+    """
+    try:
+        func = registry[job.name][0]
+    except KeyError:
+        result, error = None, f"There is no job {job.name!r}."
+        attempts_left = False
+    else:
+        try:
+            result, error = func(**job.payload), ""
+        except Exception:
+            logger.exception("Job %s (%s) failed.", job.pk, job.name)
+            result, error = None, traceback.format_exc()
+        attempts_left = job.attempts < job.max_attempts
+
+    now = timezone.now()
+    if not error:
+        changes = {"status": Job.Status.SUCCEEDED, "result": result}
+    elif attempts_left:
+        changes = {
+            "status": Job.Status.QUEUED,
+            "run_at": now + get_backoff(job.attempts),
+        }
+    else:
+        changes = {"status": Job.Status.FAILED}
+    # A worker whose lease ran out does not overwrite the attempt of the worker that
+    # took the job over.
+    Job.objects.filter(
+        pk=job.pk, status=Job.Status.RUNNING, locked_by=job.locked_by
+    ).update(
+        **changes,
+        error=error,
+        finished_at=None if changes["status"] == Job.Status.QUEUED else now,
+        locked_by=None,
+        locked_until=None,
+    )
+    return not error
+
+
+class Worker:
+    """
+    Runs jobs in `concurrency` threads until stopped, or with `burst` until there are
+    no due jobs left.
+    """
+
+    def __init__(self, concurrency=1, burst=False):
+        self.concurrency = concurrency
+        self.burst = burst
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+        self.succeeded = self.failed = 0
+        self.lock = threading.Lock()
+
+    def run(self):
+        heartbeat = threading.Thread(target=self.heartbeat, daemon=True)
+        heartbeat.start()
+        if self.concurrency == 1:
+            self.work(f"{self.name}:0")
+        else:
+            threads = [
+                threading.Thread(
+                    target=self.work_and_close,
+                    args=(f"{self.name}:{index}",),
+                    name=f"jobs-{index}",
+                )
+                for index in range(self.concurrency)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.stopping.set()
+        heartbeat.join()
+
+    def stop(self):
+        """
+        Stops taking jobs, the running ones are finished.
+        """
+        self.stopping.set()
+
+    def work(self, worker):
+        poll_interval = get_options()["POLL_INTERVAL"]
+        while not self.stopping.is_set():
+            # Like a request, a job starts on a connection that is not too old. A
+            # worker run in a transaction, as in tests, keeps its connection.
+            if not connection.in_atomic_block:
+                close_old_connections()
+            job = claim(worker)
+            if job is None:
+                if self.burst:
+                    return
+                self.stopping.wait(poll_interval)
+                continue
+            succeeded = execute(job)
+            with self.lock:
+                if succeeded:
+                    self.succeeded += 1
+                else:
+                    self.failed += 1
+
+    def work_and_close(self, worker):
+        try:
+            self.work(worker)
+        finally:
+            connection.close()
+
+    def heartbeat(self):
+        """
+        Renews the leases of the jobs this process runs.
+        """
+        lease = get_options()["LEASE"]
+        try:
+            while not self.stopping.wait(lease / 3):
+                try:
+                    Job.objects.filter(
+                        status=Job.Status.RUNNING,
+                        locked_by__startswith=f"{self.name}:",
+                    ).update(locked_until=timezone.now() + timedelta(seconds=lease))
+                except DatabaseError:
+                    logger.exception("Renewing the leases of %s failed.", self.name)
+                close_old_connections()
+        finally:
+            connection.close()
+
+
+@register("command")
+def run_command(command, options):
+    """
+    Runs a management command, the commands with a --background option queue
+    themselves as this job.
+    """
+    output = io.StringIO()
+    call_command(command, stdout=output, **options)
+    return {"output": output.getvalue()}
+
+
+@register("patients.bulk_create")
+def bulk_create_patients(clinician, patients):
+    """
+    Creates the patients of a bulk create request too big to wait for, see
+    PatientBulkCreateAPIView.
+    """
+    from .views import PatientBulkCreateAPIView
+
+    return PatientBulkCreateAPIView.create_in_background(clinician, patients)
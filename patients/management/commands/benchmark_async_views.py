@@ -0,0 +1,250 @@
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from argparse import SUPPRESS
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test.client import RequestFactory
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from patients.cache import response_cache
+from patients.models import Address, Assessment, Patient
+from users.models import User
+
+MODES = {
+    # The synchronous views behind a threaded WSGI server, like gunicorn --threads.
+    "wsgi": "",
+    # The async views on one event loop, like a single uvicorn worker.
+    "asgi": "1",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures latency against concurrency of the list and detail endpoints, for "
+        "the sync views under WSGI and the async views under ASGI. Requests are sent "
+        "to the handlers in-process, each mode in its own process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            default="1,4,16,64",
+            help="Comma separated numbers of concurrent clients.",
+        )
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=8,
+            help="Worker threads of the WSGI server.",
+        )
+        # Used by the processes the command starts for each mode.
+        parser.add_argument("--mode", choices=MODES, help=SUPPRESS)
+        parser.add_argument("--token", help=SUPPRESS)
+        parser.add_argument("--paths", help=SUPPRESS)
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options["concurrency"].split(",")]
+        if options["mode"]:
+            results = self.run_mode(options, levels)
+            self.stdout.write(json.dumps(results))
+            return
+
+        clinician, paths = self.seed()
+        token = str(AccessToken.for_user(clinician))
+        try:
+            rows = []
+            for mode, async_views in MODES.items():
+                output = subprocess.run(
+                    [
+                        sys.executable,
+                        *sys.argv[:2],
+                        "--mode",
+                        mode,
+                        "--token",
+                        token,
+                        "--paths",
+                        ",".join(paths),
+                        "--concurrency",
+                        options["concurrency"],
+                        "--requests",
+                        str(options["requests"]),
+                        "--threads",
+                        str(options["threads"]),
+                    ],
+                    env={**os.environ, "ASYNC_VIEWS": async_views},
+                    capture_output=True,
+                    text=True,
+                )
+                if output.returncode:
+                    raise CommandError(output.stderr)
+                rows += json.loads(output.stdout.strip().splitlines()[-1])
+        finally:
+            clinician.delete()
+
+        self.stdout.write(
+            f"{'mode':<6} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'p99 ms':>8}"
+        )
+        for row in rows:
+            self.stdout.write(
+                f"{row['mode']:<6} {row['clients']:>7} {row['throughput']:>8.1f} "
+                f"{row['p50']:>8.1f} {row['p95']:>8.1f} {row['p99']:>8.1f}"
+            )
+
+    def seed(self, patients=50, assessments_per_patient=20):
+        now = timezone.now()
+        clinician = User.objects.create_user(
+            f"benchmark-{time.time_ns()}@healthtrack.com"
+        )
+        addresses = Address.objects.bulk_create(
+            Address(address_one=f"{i} Main Street", city="Springfield")
+            for i in range(patients)
+        )
+        created = Patient.objects.bulk_create(
+            Patient(
+                clinician=clinician,
+                address=address,
+                first_name=f"First{i}",
+                last_name=f"Last{i}",
+                gender="female",
+                phone_number=f"+1415{9000000 + i:07d}",
+                date_of_birth=date(1950, 1, 1) + timedelta(days=i * 97),
+            )
+            for i, address in enumerate(addresses)
+        )
+        assessments = Assessment.objects.bulk_create(
+            Assessment(
+                clinician=clinician,
+                patient=patient,
+                assessment_type="mental",
+                assessment_date=now - timedelta(hours=i * 7),
+                final_score=Decimal(10 + i % 91) / 10,
+            )
+            for patient in created
+            for i in range(assessments_per_patient)
+        )
+        paths = [
+            reverse("assessment-list") + "?page_size=50",
+            reverse("patient-list") + "?page_size=50&pagination=cursor",
+            reverse("patient-detail", args=[created[0].pk]),
+            reverse("assessment-detail", args=[assessments[0].pk]),
+        ]
+        return clinician, paths
+
+    def run_mode(self, options, levels):
+        # Measure the views, not the list response cache.
+        settings.RESPONSE_CACHE = {**settings.RESPONSE_CACHE, "ENABLED": False}
+        response_cache.configure()
+        self.headers = {"HTTP_AUTHORIZATION": f"Bearer {options['token']}"}
+        self.paths = options["paths"].split(",")
+        results = []
+        for clients in levels:
+            if options["mode"] == "wsgi":
+                elapsed, latencies = self.run_wsgi(
+                    clients, options["requests"], options["threads"]
+                )
+            else:
+                elapsed, latencies = asyncio.run(
+                    self.run_asgi(clients, options["requests"])
+                )
+            percentiles = statistics.quantiles(latencies, n=100)
+            results.append(
+                {
+                    "mode": options["mode"],
+                    "clients": clients,
+                    "throughput": len(latencies) / elapsed,
+                    "p50": percentiles[49],
+                    "p95": percentiles[94],
+                    "p99": percentiles[98],
+                }
+            )
+        return results
+
+    def check_status(self, status, headers):
+        if not status.startswith("200"):
+            raise CommandError(f"Request failed with status {status}.")
+
+    def run_wsgi(self, clients, requests, threads):
+        handler = WSGIHandler()
+        factory = RequestFactory(SERVER_NAME="localhost")
+        workers = threading.Semaphore(threads)
+        latencies = []
+
+        def send(number):
+            environ = factory.get(
+                self.paths[number % len(self.paths)], **self.headers
+            ).environ
+            start = time.perf_counter()
+            # Requests wait for a free worker thread like they would in the server.
+            with workers:
+                response = handler(environ, self.check_status)
+                b"".join(response)
+                response.close()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(clients) as executor:
+            list(executor.map(send, range(requests)))
+        return time.perf_counter() - start, latencies
+
+    async def run_asgi(self, clients, requests):
+        handler = ASGIHandler()
+        queue = asyncio.Queue()
+        for number in range(requests):
+            queue.put_nowait(number)
+        latencies = []
+        authorization = self.headers["HTTP_AUTHORIZATION"].encode()
+
+        async def client():
+            while not queue.empty():
+                number = queue.get_nowait()
+                path, _, query = self.paths[number % len(self.paths)].partition("?")
+                scope = {
+                    "type": "http",
+                    "asgi": {"version": "3.0"},
+                    "http_version": "1.1",
+                    "method": "GET",
+                    "scheme": "http",
+                    "path": path,
+                    "raw_path": path.encode(),
+                    "query_string": query.encode(),
+                    "headers": [
+                        (b"host", b"localhost"),
+                        (b"authorization", authorization),
+                    ],
+                    "server": ("localhost", 80),
+                }
+                received = asyncio.Event()
+
+                async def receive():
+                    if received.is_set():
+                        await asyncio.Event().wait()
+                    received.set()
+                    return {"type": "http.request", "body": b"", "more_body": False}
+
+                async def send(message):
+                    if message["type"] == "http.response.start":
+                        self.check_status(str(message["status"]), [])
+
+                start = time.perf_counter()
+                await handler(scope, receive, send)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        return time.perf_counter() - start, latencies
@@ -0,0 +1,92 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from patients.models import Address, Patient
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares creating patients with one POST each to the patient list and with "
+        "batches POSTed to the bulk endpoint. Requests go through the full request "
+        "handling in-process, the benchmark data is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patients", type=int, default=1000)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, patients, batch_size, **options):
+        clinician = User.objects.create_user(
+            f"benchmark-{time.time_ns()}@healthtrack.com"
+        )
+        self.client = Client(
+            SERVER_NAME="localhost",
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(clinician)}",
+        )
+        # Start the phone numbers somewhere else on every run.
+        self.phone_base = time.time_ns() // 1000 % 8000000
+        try:
+            single = self.measure(
+                reverse("patient-list"),
+                [[self.payload(i)] for i in range(patients)],
+                single=True,
+            )
+            bulk = self.measure(
+                reverse("patient-bulk-create"),
+                [
+                    [self.payload(patients + i) for i in range(start, stop)]
+                    for start, stop in self.batches(patients, batch_size)
+                ],
+            )
+        finally:
+            addresses = list(
+                Patient.objects.filter(clinician=clinician).values_list(
+                    "address_id", flat=True
+                )
+            )
+            clinician.delete()
+            Address.objects.filter(pk__in=addresses).delete()
+
+        self.stdout.write(
+            f"{'endpoint':<10} {'patients':>8} {'requests':>8} {'seconds':>8} "
+            f"{'patients/s':>10} {'speedup':>8}"
+        )
+        for name, (requests, elapsed) in [("single", single), ("bulk", bulk)]:
+            self.stdout.write(
+                f"{name:<10} {patients:>8} {requests:>8} {elapsed:>8.2f} "
+                f"{patients / elapsed:>10.1f} {single[1] / elapsed:>7.1f}x"
+            )
+
+    def payload(self, i):
+        return {
+            "first_name": f"Bench{i}",
+            "last_name": f"Mark{i}",
+            "address": {"address_one": f"{i} Bench Street", "city": "Springfield"},
+            "gender": "female",
+            "phone_number": f"+1415{2000000 + (self.phone_base + i) % 8000000}",
+            "date_of_birth": "1980-05-17",
+        }
+
+    def batches(self, total, size):
+        for start in range(0, total, size):
+            yield start, min(start + size, total)
+
+    def measure(self, url, bodies, single=False):
+        start = time.perf_counter()
+        for body in bodies:
+            response = self.client.post(
+                url,
+                body[0] if single else body,
+                content_type="application/json",
+            )
+            if response.status_code != 201:
+                raise CommandError(
+                    f"POST {url} failed with status {response.status_code}: "
+                    f"{response.content[:500]!r}"
+                )
+        return len(bodies), time.perf_counter() - start
@@ -0,0 +1,141 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.models import User
+
+# Runs in a fresh interpreter, timing each step of a worker's start up to the end of
+# its first response.
+WORKER = """
+import io, json, sys, time
+
+start = time.perf_counter()
+import django
+
+django.setup()
+setup = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+
+application = get_wsgi_application()
+loaded = time.perf_counter()
+path, token = sys.argv[1:3]
+statuses = []
+environ = {
+    "REQUEST_METHOD": "GET",
+    "PATH_INFO": path,
+    "QUERY_STRING": "",
+    "SERVER_NAME": "localhost",
+    "SERVER_PORT": "80",
+    "HTTP_HOST": "localhost",
+    "HTTP_AUTHORIZATION": f"Bearer {token}",
+    "wsgi.url_scheme": "http",
+    "wsgi.input": io.BytesIO(),
+}
+response = application(environ, lambda status, headers: statuses.append(status))
+b"".join(response)
+response.close()
+end = time.perf_counter()
+print(
+    json.dumps(
+        {
+            "status": statuses[0],
+            "setup": setup - start,
+            "application": loaded - setup,
+            "first_request": end - loaded,
+            "modules": len(sys.modules),
+            "loaded": [name for name in sys.argv[3:] if name in sys.modules],
+        }
+    )
+)
+"""
+
+# Modules that serving requests should not import.
+DEV_MODULES = ["debug_toolbar", "drf_spectacular", "django.contrib.gis"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the cold start of a worker: the time to import and set up Django, "
+        "to load the WSGI application and to answer the first request, each in a "
+        "fresh interpreter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--settings-modules",
+            default="healthtrack.settings.local,healthtrack.settings.production",
+            help="Comma separated settings modules to compare.",
+        )
+        parser.add_argument("--runs", type=int, default=5)
+
+    def handle(self, *args, settings_modules, runs, **options):
+        clinician = User.objects.create_user(
+            f"benchmark-{time.time_ns()}@healthtrack.com"
+        )
+        token = str(AccessToken.for_user(clinician))
+        path = reverse("patient-list")
+        env = {
+            **os.environ,
+            # The workers use the database this process uses, the test database in
+            # tests.
+            "POSTGRES_DB": connection.settings_dict["NAME"],
+            "ALLOWED_HOSTS": os.environ.get("ALLOWED_HOSTS", "localhost"),
+            # Each worker runs on its own, so without REDIS_URL or MEMCACHED_LOCATION
+            # the production settings can keep their caches in process.
+            "SINGLE_PROCESS": os.environ.get("SINGLE_PROCESS", "1"),
+            "PYTHONPATH": str(settings.BASE_DIR),
+        }
+        try:
+            rows = []
+            for module in settings_modules.split(","):
+                module_env = {**env, "DJANGO_SETTINGS_MODULE": module}
+                results = [
+                    self.start_worker(module_env, path, token) for _ in range(runs)
+                ]
+                rows.append((module, results))
+        finally:
+            clinician.delete()
+
+        self.stdout.write(
+            f"{'settings':<32} {'setup ms':>9} {'app ms':>8} {'first ms':>9} "
+            f"{'total ms':>9} {'modules':>8}  dev modules"
+        )
+        for module, results in rows:
+            setup, application, first = (
+                statistics.median(result[step] * 1000 for result in results)
+                for step in ("setup", "application", "first_request")
+            )
+            self.stdout.write(
+                f"{module:<32} {setup:>9.1f} {application:>8.1f} {first:>9.1f} "
+                f"{setup + application + first:>9.1f} "
+                f"{results[0]['modules']:>8}  "
+                + (", ".join(results[0]["loaded"]) or "-")
+            )
+
+    def run_python(self, env, args):
+        output = subprocess.run(
+            [sys.executable, *args],
+            env=env,
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if output.returncode:
+            raise CommandError(output.stderr)
+        return output.stdout
+
+    def start_worker(self, env, path, token):
+        output = self.run_python(env, ["-c", WORKER, path, token, *DEV_MODULES])
+        result = json.loads(output.strip().splitlines()[-1])
+        if not result["status"].startswith("200"):
+            raise CommandError(f"The first request failed with {result['status']}.")
+        return result
@@ -0,0 +1,158 @@
+import timeit
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from patients.models import Address, Assessment, AssessmentDailyRollup, Patient
+from patients.parsers import FastJSONParser
+from patients.renderers import FastJSONRenderer
+from patients.renderers import JSONEncoder as PhoneNumberJSONEncoder
+from patients.serializers import (
+    AssessmentListSerializer,
+    AssessmentSummarySerializer,
+    PatientDetailSerializer,
+    PatientListSerializer,
+)
+from users.models import User
+
+
+class RawJSONRenderer(JSONRenderer):
+    encoder_class = PhoneNumberJSONEncoder
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares FastJSONRenderer and FastJSONParser with DRF's JSONRenderer and "
+        "JSONParser on realistic API pages, built in memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument("--page-size", type=int, default=100)
+
+    def handle(self, *args, iterations, page_size, **options):
+        self.iterations = iterations
+        pages = self.build_pages(page_size)
+
+        header = f"{'case':<28} {'json (us)':>10} {'fast (us)':>10} {'speedup':>8}"
+        self.stdout.write(f"{header}  identical")
+        for name, data in pages.items():
+            baseline = RawJSONRenderer() if name == "export rows" else JSONRenderer()
+            self.compare(
+                f"render {name}",
+                lambda: baseline.render(data),
+                lambda: FastJSONRenderer().render(data),
+            )
+
+        body = JSONRenderer().render(
+            [
+                {
+                    "first_name": f"First{i}",
+                    "last_name": f"Last{i}",
+                    "address": {
+                        "address_one": f"{i} Main Street",
+                        "city": "Springfield",
+                    },
+                    "gender": "female",
+                    "phone_number": f"+1415{i:07d}",
+                    "date_of_birth": "1980-05-17",
+                }
+                for i in range(page_size)
+            ]
+        )
+        self.compare(
+            "parse bulk patients",
+            lambda: JSONParser().parse(BytesIO(body)),
+            lambda: FastJSONParser().parse(BytesIO(body)),
+        )
+
+    def compare(self, name, baseline, fast):
+        identical = baseline() == fast()
+        slow_time = min(timeit.repeat(baseline, number=self.iterations, repeat=3))
+        fast_time = min(timeit.repeat(fast, number=self.iterations, repeat=3))
+        slow_us = slow_time / self.iterations * 10**6
+        fast_us = fast_time / self.iterations * 10**6
+        style = self.style.SUCCESS if identical else self.style.ERROR
+        self.stdout.write(
+            f"{name:<28} {slow_us:>10.1f} {fast_us:>10.1f} "
+            f"{slow_us / fast_us:>7.1f}x  " + style(str(identical))
+        )
+
+    def build_pages(self, page_size):
+        now = timezone.now()
+        clinician = User(id=1, email="clinician@healthtrack.com")
+        patients = []
+        for i in range(page_size):
+            patient = Patient(
+                id=i + 1,
+                clinician=clinician,
+                address=Address(
+                    id=i + 1, address_one=f"{i} Main Street", city="Springfield"
+                ),
+                first_name=f"First{i}",
+                last_name=f"Lästname{i}",
+                gender="female",
+                phone_number=f"+1415{i:07d}",
+                date_of_birth=date(1940, 1, 1) + timedelta(days=i * 97),
+                created_at=now - timedelta(minutes=i),
+            )
+            patient.age_years = 30 + i % 50
+            patients.append(patient)
+        assessments = [
+            Assessment(
+                id=i + 1,
+                clinician=clinician,
+                patient=patients[i % len(patients)],
+                assessment_type=Assessment.TYPES.choices[i % 4][0],
+                assessment_date=now - timedelta(hours=i * 7),
+                final_score=Decimal(10 + i % 91) / 10,
+            )
+            for i in range(page_size)
+        ]
+        rollups = [
+            AssessmentDailyRollup(
+                clinician=clinician,
+                assessment_type="mental",
+                day=date.today() - timedelta(days=i),
+                count=5,
+                score_sum=Decimal("27.5"),
+                score_sum_squares=Decimal("160.25"),
+                score_min=Decimal("3.5"),
+                score_max=Decimal("7.5"),
+            )
+            for i in range(365)
+        ]
+
+        def page(results):
+            return {
+                "count": 1000,
+                "next": "http://localhost:8000/api/patient/?page=2",
+                "previous": None,
+                "results": results,
+            }
+
+        return {
+            "patient list": page(PatientListSerializer(patients, many=True).data),
+            "assessment list": page(
+                AssessmentListSerializer(assessments, many=True).data
+            ),
+            "patient detail": PatientDetailSerializer(patients[0]).data,
+            "summary (365 days)": AssessmentSummarySerializer(rollups, many=True).data,
+            # Model values as the export reads them: decimals, datetimes and phone
+            # numbers that the encoder converts itself.
+            "export rows": [
+                {
+                    "id": assessment.pk,
+                    "patient": assessment.patient.phone_number,
+                    "assessment_type": assessment.assessment_type,
+                    "assessment_date": assessment.assessment_date,
+                    "final_score": assessment.final_score,
+                }
+                for assessment in assessments
+            ],
+        }
@@ -0,0 +1,137 @@
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from patients import jobs
+from patients.importing import LegacyImport
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports patients and their assessments from legacy CSV files. The files are "
+        "copied into staging tables, validated and normalised there, and the valid "
+        "rows merged in one transaction; patients are matched by phone number, so a "
+        "file can be imported again. Rejected rows are written to --rejects with the "
+        "reason."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patients", required=True, help="CSV file of patients.")
+        parser.add_argument(
+            "--assessments",
+            help="CSV file of assessments, referring to the patients by their id.",
+        )
+        parser.add_argument(
+            "--clinician",
+            help="Email of the clinician of patients without a clinician column.",
+        )
+        parser.add_argument(
+            "--region",
+            default="US",
+            help="Country of phone numbers without a country code whose patient has "
+            "no country.",
+        )
+        parser.add_argument(
+            "--rejects",
+            default="import-rejects.csv",
+            help="CSV file the rejected rows are written to.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Validate and report, without writing anything.",
+        )
+        parser.add_argument(
+            "--background",
+            action="store_true",
+            help="Queue the import for the run_jobs workers, which have to be able "
+            "to read the files.",
+        )
+
+    def handle(self, *args, **options):
+        clinician = None
+        if options["clinician"]:
+            clinician = User.objects.filter(email__iexact=options["clinician"]).first()
+            if clinician is None:
+                raise CommandError(f"There is no clinician {options['clinician']}.")
+        if options["background"]:
+            self.enqueue(clinician, options)
+            return
+
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                self.run(clinician, options)
+                if options["dry_run"]:
+                    transaction.set_rollback(True)
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+        except IntegrityError as e:
+            raise CommandError(
+                f"The import clashed with rows written while it ran, try again: {e}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f"Done in {time.perf_counter() - start:.1f}s.")
+        )
+
+    def enqueue(self, clinician, options):
+        # The workers run in another directory.
+        paths = {
+            name: os.path.abspath(options[name])
+            for name in ("patients", "assessments", "rejects")
+            if options[name]
+        }
+        for name in ("patients", "assessments"):
+            if name in paths and not os.path.isfile(paths[name]):
+                raise CommandError(f"There is no file {paths[name]}.")
+        job = jobs.enqueue(
+            "command",
+            # An import is only retried by hand, once the files are fixed.
+            max_attempts=1,
+            user=clinician,
+            command="import_healthtrack",
+            options={
+                **paths,
+                "clinician": options["clinician"],
+                "region": options["region"],
+                "dry_run": options["dry_run"],
+            },
+        )
+        self.stdout.write(self.style.SUCCESS(f"Queued job {job.pk}."))
+
+    def run(self, clinician, options):
+        legacy = LegacyImport(clinician, options["region"].upper())
+        with open(options["patients"], encoding="utf-8-sig", newline="") as file:
+            patients = legacy.load_patients(file)
+        assessments = 0
+        if options["assessments"]:
+            with open(options["assessments"], encoding="utf-8-sig", newline="") as file:
+                assessments = legacy.load_assessments(file)
+        self.stdout.write(f"Loaded {patients} patients, {assessments} assessments.")
+
+        legacy.validate()
+        created, updated, imported = legacy.merge()
+        self.stdout.write(
+            f"{'Would create' if options['dry_run'] else 'Created'} {created} "
+            f"patients, updated {updated} and imported {imported} assessments."
+        )
+
+        counts = legacy.reject_counts()
+        if not counts:
+            return
+        for name, reason, count in counts:
+            self.stdout.write(f"Rejected {count} {name}: {reason}")
+        with open(options["rejects"], "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["file", "row", "reason", "detail", "values"])
+            writer.writerows(legacy.rejects())
+        self.stdout.write(
+            self.style.WARNING(
+                f"{sum(count for _, _, count in counts)} rows were rejected, see "
+                f"{options['rejects']}."
+            )
+        )
@@ -0,0 +1,341 @@
+import http.client
+import json
+import random
+import statistics
+import subprocess
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+from patients.models import Address, Assessment, Patient
+from users.models import User
+
+PASSWORD = "load-test-password"
+
+# Weighted scenarios, modelled on what clinicians do with the API.
+SCENARIOS = {
+    # Looks a patient up, opens them, reads their assessments and records a new one.
+    "assess_patient": 6,
+    # Browses the latest assessments and the patient list.
+    "review": 3,
+    # Signs in again.
+    "login": 1,
+}
+
+
+def percentile(values, n):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[n - 1]
+
+
+def summarize(samples, elapsed):
+    latencies = [latency for _, latency in samples]
+    errors = sum(1 for ok, _ in samples if not ok)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "throughput": len(samples) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+class VirtualUser:
+    """
+    One clinician sending the requests of randomly picked scenarios, one after the
+    other, over a kept alive connection.
+    """
+
+    def __init__(self, url, clinician, patients, rng, record):
+        self.url = urlsplit(url)
+        self.email = clinician.email
+        self.patients = patients
+        self.rng = rng
+        self.record = record
+        self.connection = None
+        self.token = None
+
+    def send(self, name, method, path, data=None):
+        body = None if data is None else json.dumps(data)
+        headers = {"Accept": "application/json"}
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        start = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(
+                    self.url.hostname, self.url.port or 80, timeout=30
+                )
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+            content = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            # Reconnects with the next request.
+            if self.connection is not None:
+                self.connection.close()
+            self.connection = None
+            content, status = b"", 0
+        latency = (time.perf_counter() - start) * 1000
+        ok = 200 <= status < 400
+        self.record(name, ok, latency)
+        if not ok or not content:
+            return None
+        return json.loads(content)
+
+    def login(self):
+        tokens = self.send(
+            "jwt create",
+            "POST",
+            reverse("jwt-create"),
+            {"email": self.email, "password": PASSWORD},
+        )
+        if tokens is not None:
+            self.token = tokens["access"]
+
+    def assess_patient(self):
+        last_name = self.rng.choice(self.patients)[1]
+        page = self.send(
+            "patient search",
+            "GET",
+            reverse("patient-list") + "?" + urlencode({"search": last_name}),
+        )
+        if page and page["results"]:
+            pk = page["results"][0]["id"]
+        else:
+            pk = self.rng.choice(self.patients)[0]
+        self.send("patient detail", "GET", reverse("patient-detail", args=[pk]))
+        self.send(
+            "patient assessments",
+            "GET",
+            reverse("patient-assessment-list", args=[pk]),
+        )
+        self.send(
+            "assessment create",
+            "POST",
+            reverse("patient-assessment-create", args=[pk]),
+            {
+                "assessment_type": self.rng.choice(Assessment.TYPES.values),
+                "final_score": str(Decimal(self.rng.randint(10, 100)) / 10),
+            },
+        )
+
+    def review(self):
+        self.send(
+            "assessment list", "GET", reverse("assessment-list") + "?page_size=50"
+        )
+        self.send("patient list", "GET", reverse("patient-list") + "?ordering=-age")
+
+    def run(self, deadline):
+        self.login()
+        scenarios, weights = zip(*SCENARIOS.items())
+        try:
+            while time.monotonic() < deadline:
+                getattr(self, self.rng.choices(scenarios, weights)[0])()
+        finally:
+            if self.connection is not None:
+                self.connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs weighted clinician scenarios against a running server, for example "
+        "`manage.py runserver` or gunicorn, and reports latency percentiles, "
+        "throughput and error rates per request. The results are written as JSON so "
+        "runs can be compared across commits with --compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://localhost:8000")
+        parser.add_argument(
+            "--users", type=int, default=10, help="Concurrent virtual users."
+        )
+        parser.add_argument(
+            "--duration", type=float, default=30, help="Seconds to run for."
+        )
+        parser.add_argument(
+            "--clinicians",
+            type=int,
+            default=5,
+            help="Clinicians to seed, the virtual users share them.",
+        )
+        parser.add_argument("--patients", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output", help="Defaults to load-test-<commit>-<timestamp>.json."
+        )
+        parser.add_argument("--compare", help="JSON results of an earlier run.")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as file:
+                baseline = json.load(file)
+
+        clinicians = self.seed(options["clinicians"], options["patients"])
+        samples = {}
+        lock = threading.Lock()
+
+        def record(name, ok, latency):
+            with lock:
+                samples.setdefault(name, []).append((ok, latency))
+
+        try:
+            users = [
+                VirtualUser(
+                    options["url"],
+                    *clinicians[number % len(clinicians)],
+                    random.Random(options["seed"] + number),
+                    record,
+                )
+                for number in range(options["users"])
+            ]
+            started_at = timezone.now()
+            start = time.monotonic()
+            threads = [
+                threading.Thread(target=user.run, args=[start + options["duration"]])
+                for user in users
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.monotonic() - start
+        finally:
+            self.clean_up(clinicians)
+
+        if not samples:
+            raise CommandError(f"No requests were sent to {options['url']}.")
+        commit = self.get_commit()
+        results = {
+            "commit": commit,
+            "started_at": started_at.isoformat(),
+            "url": options["url"],
+            "users": options["users"],
+            "duration": elapsed,
+            "scenarios": SCENARIOS,
+            "total": summarize(
+                [sample for values in samples.values() for sample in values], elapsed
+            ),
+            "requests": {
+                name: summarize(values, elapsed)
+                for name, values in sorted(samples.items())
+            },
+        }
+        output = options["output"] or (
+            f"load-test-{commit or 'unknown'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        with open(output, "w") as file:
+            json.dump(results, file, indent=2)
+
+        self.report(results, baseline)
+        self.stdout.write(f"Results written to {output}.")
+
+    def seed(self, clinicians, patients_per_clinician):
+        """
+        Creates active clinicians that can sign in, with patients and assessments.
+        Returns the clinicians with the (id, last name) of their patients.
+        """
+        now = timezone.now()
+        run = time.time_ns()
+        seeded = []
+        for c in range(clinicians):
+            clinician = User.objects.create_user(
+                f"load-test-{run}-{c}@healthtrack.com", PASSWORD
+            )
+            addresses = Address.objects.bulk_create(
+                Address(address_one=f"{i} Main Street", city="Springfield")
+                for i in range(patients_per_clinician)
+            )
+            patients = Patient.objects.bulk_create(
+                Patient(
+                    clinician=clinician,
+                    address=address,
+                    first_name=f"First{i}",
+                    last_name=f"Last{i}",
+                    gender=Patient.Gender.values[i % len(Patient.Gender.values)],
+                    phone_number=f"+1415{8000000 + c * len(addresses) + i:07d}",
+                    date_of_birth=date(1940, 1, 1) + timedelta(days=i * 97 % 25000),
+                )
+                for i, address in enumerate(addresses)
+            )
+            Assessment.objects.bulk_create(
+                Assessment(
+                    clinician=clinician,
+                    patient=patient,
+                    assessment_type=Assessment.TYPES.values[(patient.pk + i) % 4],
+                    assessment_date=now - timedelta(days=i * 31),
+                    final_score=Decimal(10 + (patient.pk + i * 13) % 91) / 10,
+                )
+                for patient in patients
+                for i in range(5)
+            )
+            seeded.append(
+                (clinician, [(patient.pk, patient.last_name) for patient in patients])
+            )
+        return seeded
+
+    def clean_up(self, clinicians):
+        patients = Patient.objects.filter(
+            clinician__in=[clinician for clinician, _ in clinicians]
+        )
+        addresses = list(patients.values_list("address", flat=True))
+        User.objects.filter(
+            pk__in=[clinician.pk for clinician, _ in clinicians]
+        ).delete()
+        Address.objects.filter(pk__in=addresses).delete()
+
+    def get_commit(self):
+        try:
+            output = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=settings.BASE_DIR,
+                capture_output=True,
+                text=True,
+            )
+        except OSError:
+            return None
+        return output.stdout.strip() or None
+
+    def report(self, results, baseline=None):
+        self.stdout.write(
+            f"{'request':<22} {'count':>7} {'errors':>7} {'req/s':>8} {'p50 ms':>8} "
+            f"{'p95 ms':>8} {'p99 ms':>8}"
+            + (f" {'p95 change':>11}" if baseline else "")
+        )
+        rows = [*results["requests"].items(), ("total", results["total"])]
+        for name, row in rows:
+            line = (
+                f"{name:<22} {row['requests']:>7} {row['error_rate']:>7.1%} "
+                f"{row['throughput']:>8.1f} {row['p50']:>8.1f} {row['p95']:>8.1f} "
+                f"{row['p99']:>8.1f}"
+            )
+            if baseline:
+                before = (
+                    baseline["total"]
+                    if name == "total"
+                    else baseline["requests"].get(name)
+                )
+                change = (
+                    f"{row['p95'] / before['p95'] - 1:+.1%}"
+                    if before and before["p95"]
+                    else "-"
+                )
+                line += f" {change:>11}"
+            self.stdout.write(line)
+        if baseline:
+            self.stdout.write(
+                f"Compared with {baseline['commit']} from {baseline['started_at']}."
+            )
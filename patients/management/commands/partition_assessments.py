@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from patients import jobs, partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintains the monthly partitions of the assessments table: creates the "
+        "partitions of the coming months and detaches old ones. --convert partitions "
+        "the table first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help="Convert the unpartitioned table. Locks it while rows are copied.",
+        )
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=3,
+            help="Number of months after the current one to create partitions for.",
+        )
+        parser.add_argument(
+            "--retain-months",
+            type=int,
+            help="Detach the partitions of months before the last N months.",
+        )
+        parser.add_argument(
+            "--background",
+            action="store_true",
+            help="Queue the maintenance for the run_jobs workers.",
+        )
+
+    def handle(self, *args, convert, months_ahead, retain_months, **options):
+        if months_ahead < 0 or retain_months is not None and retain_months < 1:
+            raise CommandError("--months-ahead and --retain-months must be positive.")
+        if options["background"]:
+            job = jobs.enqueue(
+                "command",
+                command="partition_assessments",
+                options={
+                    "convert": convert,
+                    "months_ahead": months_ahead,
+                    "retain_months": retain_months,
+                },
+            )
+            self.stdout.write(self.style.SUCCESS(f"Queued job {job.pk}."))
+            return
+        if not partitions.is_partitioned():
+            if not convert:
+                raise CommandError(
+                    "The assessments table is not partitioned, run with --convert."
+                )
+            try:
+                partitions.convert(months_ahead)
+            except ValueError as e:
+                raise CommandError(e)
+            self.stdout.write(self.style.SUCCESS("Partitioned the assessments table."))
+
+        for name in partitions.create_partitions(months_ahead):
+            self.stdout.write(f"Created {name}.")
+
+        if retain_months is not None:
+            current = partitions.month_start(timezone.now())
+            before = partitions.add_months(current, 1 - retain_months)
+            for name in partitions.detach_partitions(before):
+                self.stdout.write(f"Detached {name}.")
+
+        count = len(partitions.get_partitions())
+        self.stdout.write(self.style.SUCCESS(f"{count} monthly partitions."))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from patients import jobs, rollups
+from patients.models import AssessmentDailyRollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the daily score rollups from the assessments, for all clinicians "
+        "or only the given ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clinician",
+            type=int,
+            action="append",
+            dest="clinicians",
+            help="Id of a clinician to rebuild. Can be given more than once.",
+        )
+        parser.add_argument(
+            "--background",
+            action="store_true",
+            help="Queue the rebuild for the run_jobs workers.",
+        )
+
+    def handle(self, *args, clinicians=None, **options):
+        if options["background"]:
+            job = jobs.enqueue(
+                "command",
+                command="rebuild_score_rollups",
+                options={"clinicians": clinicians},
+            )
+            self.stdout.write(self.style.SUCCESS(f"Queued job {job.pk}."))
+            return
+        written = rollups.rebuild(clinicians)
+        total = AssessmentDailyRollup.objects.count()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {written} daily rollup rows ({total} in total)."
+            )
+        )
@@ -0,0 +1,44 @@
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the queued background jobs until it receives SIGTERM or SIGINT, which "
+        "let the running jobs finish. Any number of workers can run side by side."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Number of jobs run at the same time, each in its own thread.",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Stop once there are no due jobs, instead of waiting for more.",
+        )
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency must be positive.")
+        worker = Worker(options["concurrency"], options["burst"])
+        if not options["burst"]:
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, lambda signum, frame: worker.stop())
+            self.stdout.write(
+                f"Worker {worker.name} running {options['concurrency']} jobs at a "
+                "time."
+            )
+        worker.run()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Ran {worker.succeeded + worker.failed} jobs, {worker.failed} of "
+                "them failed."
+            )
+        )
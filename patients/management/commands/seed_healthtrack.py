@@ -0,0 +1,166 @@
+import os
+import subprocess
+import sys
+import time
+from argparse import SUPPRESS
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection
+
+from patients import seeding
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates clinicians with realistic patients, addresses and assessment "
+        "histories, deterministically from --seed. Rows are written with COPY in one "
+        "transaction per batch of clinicians; running the command again resumes "
+        "where it stopped. --workers splits the clinicians between processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--clinicians", type=int, default=1000)
+        parser.add_argument(
+            "--patients-per-clinician",
+            type=int,
+            default=50,
+            help="Mean caseload. Caseloads are skewed, a few clinicians have many.",
+        )
+        parser.add_argument("--max-patients", type=int, default=2000)
+        parser.add_argument(
+            "--assessments-per-patient",
+            type=int,
+            default=10,
+            help="Mean number of assessments of a patient.",
+        )
+        parser.add_argument(
+            "--years", type=int, default=5, help="Length of the patients' histories."
+        )
+        parser.add_argument(
+            "--end-date",
+            type=date.fromisoformat,
+            default=date.today(),
+            help="Day the histories end on, today by default. Pass it to reproduce a "
+            "dataset exactly, or to resume on another day.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Clinicians written per transaction.",
+        )
+        parser.add_argument("--workers", type=int, default=1)
+        # Used by the processes --workers starts, "<shard>/<shards>".
+        parser.add_argument("--shard", help=SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options["patients_per_clinician"] < 1 or options["batch_size"] < 1:
+            raise CommandError(
+                "--patients-per-clinician and --batch-size must be positive."
+            )
+        needed = options["clinicians"] * options["max_patients"]
+        if needed > seeding.phone_capacity():
+            raise CommandError(
+                f"{options['clinicians']} clinicians with up to "
+                f"{options['max_patients']} patients need more unique phone numbers "
+                "than there are, lower --max-patients."
+            )
+
+        if (
+            seeding.get_clinicians()
+            .exclude(pk__in=seeding.get_clinicians(options["seed"]))
+            .exists()
+        ):
+            raise CommandError(
+                "The database holds the data of another seed, whose phone numbers "
+                "this one would reuse."
+            )
+
+        start = time.perf_counter()
+        if options["workers"] > 1 and not options["shard"]:
+            self.run_workers(options)
+        else:
+            shard, shards = map(int, (options["shard"] or "0/1").split("/"))
+            self.seed(options, shard, shards)
+        self.stdout.write(
+            self.style.SUCCESS(f"Done in {time.perf_counter() - start:.1f}s.")
+        )
+
+    def seed(self, options, shard, shards):
+        seed = options["seed"]
+        seeded = seeding.get_seeded(seed)
+        if seeded:
+            self.stdout.write(
+                f"Resuming, {len(seeded)} clinicians of seed {seed} already exist."
+            )
+        indexes = [
+            index
+            for index in range(shard, options["clinicians"], shards)
+            if index not in seeded
+        ]
+
+        end = seeding.get_end(options["end_date"])
+        patients = assessments = 0
+        start = time.perf_counter()
+        size = options["batch_size"]
+        for offset in range(0, len(indexes), size):
+            batch = indexes[offset : offset + size]
+            try:
+                written = seeding.seed_clinicians(seed, batch, end, options)
+            except IntegrityError as e:
+                raise CommandError(
+                    f"Clinicians {batch[0]} to {batch[-1]} could not be written, "
+                    f"their rows clash with existing ones: {e}"
+                )
+            patients += written[0]
+            assessments += written[1]
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"[{shard}/{shards}] {offset + len(batch)}/{len(indexes)} clinicians, "
+                f"{patients} patients, {assessments} assessments "
+                f"({assessments / elapsed:.0f} assessments/s)"
+            )
+
+    def run_workers(self, options):
+        argv = [
+            sys.executable,
+            "-m",
+            "django",
+            "seed_healthtrack",
+            "--settings",
+            settings.SETTINGS_MODULE,
+            "--seed",
+            str(options["seed"]),
+            "--clinicians",
+            str(options["clinicians"]),
+            "--patients-per-clinician",
+            str(options["patients_per_clinician"]),
+            "--max-patients",
+            str(options["max_patients"]),
+            "--assessments-per-patient",
+            str(options["assessments_per_patient"]),
+            "--years",
+            str(options["years"]),
+            # Every worker has to end the histories on the same day.
+            "--end-date",
+            options["end_date"].isoformat(),
+            "--batch-size",
+            str(options["batch_size"]),
+        ]
+        # The workers write to the database this process uses, the test database in
+        # tests.
+        env = {**os.environ, "POSTGRES_DB": connection.settings_dict["NAME"]}
+        workers = [
+            subprocess.Popen(
+                [*argv, "--shard", f"{shard}/{options['workers']}"],
+                cwd=settings.BASE_DIR,
+                env=env,
+            )
+            for shard in range(options["workers"])
+        ]
+        failed = [worker for worker in workers if worker.wait()]
+        if failed:
+            raise CommandError(f"{len(failed)} of the workers failed.")
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:17
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, transaction
+
+BACKFILL_BATCH_SIZE = 5000
+
+CREATE_TRIGGER = """
+CREATE FUNCTION patient_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector(
+        'simple', COALESCE(NEW.first_name, '') || ' ' || COALESCE(NEW.last_name, '')
+    );
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER patient_search_vector_update
+    BEFORE INSERT OR UPDATE OF first_name, last_name ON patients_patient
+    FOR EACH ROW EXECUTE FUNCTION patient_search_vector_update();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS patient_search_vector_update ON patients_patient;
+DROP FUNCTION IF EXISTS patient_search_vector_update();
+"""
+
+
+def backfill_search_vector(apps, schema_editor):
+    """
+    Populate search_vector for existing patients in primary key chunks, committing
+    each chunk on its own so large tables are not locked in one long transaction.
+    """
+    Patient = apps.get_model("patients", "Patient")
+    last_pk = 0
+    while True:
+        pks = list(
+            Patient.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:BACKFILL_BATCH_SIZE]
+        )
+        if not pks:
+            break
+        with transaction.atomic():
+            Patient.objects.filter(pk__gt=last_pk, pk__lte=pks[-1]).update(
+                search_vector=SearchVector("first_name", "last_name", config="simple")
+            )
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("patients", "0009_alter_assessment_final_score"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patient",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        migrations.RunPython(backfill_search_vector, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name="patient",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="patient_search_vector_idx"
+            ),
+        ),
+    ]
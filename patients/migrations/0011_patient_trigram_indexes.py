@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:18
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("patients", "0010_patient_search_vector"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name="patient",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("first_name"),
+                    name="gin_trgm_ops",
+                ),
+                name="patient_first_name_trgm_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="patient",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("last_name"),
+                    name="gin_trgm_ops",
+                ),
+                name="patient_last_name_trgm_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="patient",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["phone_number"],
+                name="patient_phone_number_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:40
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("patients", "0011_patient_trigram_indexes"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="assessment",
+            index=models.Index(
+                fields=["clinician", "assessment_date", "id"],
+                name="assess_clin_date_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="assessment",
+            index=models.Index(
+                fields=["clinician", "patient", "assessment_date", "id"],
+                name="assess_clin_patient_date_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="assessment",
+            index=models.Index(
+                fields=["clinician", "assessment_type", "assessment_date", "id"],
+                name="assess_clin_type_date_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="assessment",
+            index=models.Index(
+                fields=["clinician", "final_score", "id"],
+                name="assess_clin_score_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="patient",
+            index=models.Index(
+                fields=["clinician", "created_at", "id"],
+                name="patient_clin_created_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="patient",
+            index=models.Index(
+                fields=["clinician", "date_of_birth", "id"],
+                name="patient_clin_dob_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="patient",
+            index=models.Index(
+                fields=["clinician", "gender", "created_at", "id"],
+                name="patient_clin_gen_created_idx",
+            ),
+        ),
+    ]
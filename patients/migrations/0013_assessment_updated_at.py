@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("patients", "0012_list_composite_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="assessment",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
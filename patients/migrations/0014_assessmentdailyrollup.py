@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BACKFILL_SQL = """
+INSERT INTO patients_assessmentdailyrollup
+    (clinician_id, assessment_type, day, count, score_sum, score_sum_squares,
+     score_min, score_max)
+SELECT
+    clinician_id,
+    assessment_type,
+    (assessment_date AT TIME ZONE %s)::date,
+    COUNT(*),
+    SUM(final_score),
+    SUM(final_score * final_score),
+    MIN(final_score),
+    MAX(final_score)
+FROM patients_assessment
+GROUP BY 1, 2, 3
+"""
+
+
+def backfill_rollups(apps, schema_editor):
+    schema_editor.execute(BACKFILL_SQL, [settings.TIME_ZONE])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patients", "0013_assessment_updated_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AssessmentDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "assessment_type",
+                    models.CharField(
+                        choices=[
+                            ("cognitive", "Cognitive Status"),
+                            ("physical", "Physical Ability"),
+                            ("mental", "Mental Health"),
+                            ("emotional", "Emotional Well-being"),
+                        ],
+                        max_length=50,
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("score_sum", models.DecimalField(decimal_places=1, max_digits=14)),
+                (
+                    "score_sum_squares",
+                    models.DecimalField(decimal_places=2, max_digits=16),
+                ),
+                ("score_min", models.DecimalField(decimal_places=1, max_digits=3)),
+                ("score_max", models.DecimalField(decimal_places=1, max_digits=3)),
+                (
+                    "clinician",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("clinician", "assessment_type", "day"),
+                        name="unique_assessment_daily_rollup",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patients", "0014_assessmentdailyrollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AuditEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("occurred_at", models.DateTimeField()),
+                ("user_id", models.BigIntegerField(null=True)),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("read", "Read"),
+                            ("create", "Create"),
+                            ("update", "Update"),
+                            ("delete", "Delete"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("model", models.CharField(max_length=20)),
+                ("object_id", models.BigIntegerField(null=True)),
+                ("patient_id", models.BigIntegerField(null=True)),
+                ("fields", models.JSONField(null=True)),
+                ("ip_address", models.GenericIPAddressField(null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["patient_id", "occurred_at"], name="audit_patient_idx"
+                    ),
+                    models.Index(
+                        fields=["user_id", "occurred_at"], name="audit_user_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
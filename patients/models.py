@@ -2,14 +2,22 @@ from datetime import date
 from decimal import Decimal
 
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models.functions import Upper
+from django.db.models.signals import post_save, pre_save
 from django.utils import timezone
 from django_countries.fields import CountryField
 from phonenumber_field.modelfields import PhoneNumberField
 
 User = get_user_model()
 
+# Text search configuration used for the patient search vector. "simple" keeps
+# names intact instead of stemming them like an English dictionary would.
+SEARCH_CONFIG = "simple"
+
 
 class Address(models.Model):
     address_one = models.CharField(max_length=400)
@@ -22,6 +30,97 @@ class Address(models.Model):
         return self.address_one
 
 
+def years_before(day, years):
+    """
+    Returns the date `years` years before `day`. February 29th maps to February 28th
+    in non-leap years, which is the last birth date that has reached the age by then.
+    """
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+class Age(models.Func):
+    """
+    Age in whole years of a date expression on `today`, computed by the database.
+    """
+
+    function = "AGE"
+    template = "EXTRACT(YEAR FROM %(function)s(%(expressions)s))::integer"
+    output_field = models.IntegerField()
+
+    def __init__(self, date_of_birth, today=None, **extra):
+        super().__init__(
+            models.Value(today or date.today(), output_field=models.DateField()),
+            date_of_birth,
+            **extra,
+        )
+
+
+class PatientQuerySet(models.QuerySet):
+    def with_age(self):
+        return self.annotate(age_years=Age("date_of_birth"))
+
+
+class AssessmentQuerySet(models.QuerySet):
+    def create_for_patient(self, clinician, patient_id, **fields):
+        """
+        Creates an assessment of the patient only if the patient belongs to the
+        clinician, with a single INSERT ... SELECT that does the ownership check.
+
+        Returns the assessment, or None when the clinician has no such patient.
+        pre_save and post_save are sent like Model.save() would.
+        """
+        assessment = self.model(clinician=clinician, patient_id=patient_id, **fields)
+        pre_save.send(
+            sender=self.model,
+            instance=assessment,
+            raw=False,
+            using=self.db,
+            update_fields=None,
+        )
+        connection = connections[self.db]
+        meta = self.model._meta
+        columns = [field for field in meta.concrete_fields if not field.primary_key]
+        values = [
+            field.get_db_prep_save(field.pre_save(assessment, True), connection)
+            for field in columns
+        ]
+        patient_meta = meta.get_field("patient").related_model._meta
+        sql = (
+            "INSERT INTO {table} ({columns}) SELECT {values} FROM {patients} "
+            "WHERE {patients}.id = %s AND {patients}.clinician_id = %s RETURNING id"
+        ).format(
+            table=connection.ops.quote_name(meta.db_table),
+            columns=", ".join(connection.ops.quote_name(f.column) for f in columns),
+            # Typed placeholders, INSERT ... SELECT does not infer them from the
+            # target columns.
+            values=", ".join(
+                f"CAST(%s AS {field.cast_db_type(connection)})" for field in columns
+            ),
+            patients=connection.ops.quote_name(patient_meta.db_table),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*values, patient_id, clinician.pk])
+            row = cursor.fetchone()
+        if row is None:
+            return None
+
+        assessment.pk = row[0]
+        assessment._state.adding = False
+        assessment._state.db = self.db
+        post_save.send(
+            sender=self.model,
+            instance=assessment,
+            created=True,
+            update_fields=None,
+            raw=False,
+            using=self.db,
+        )
+        return assessment
+
+
 class Patient(models.Model):
     class Gender(models.TextChoices):
         MALE = "male", "Male"
@@ -43,6 +142,45 @@ class Patient(models.Model):
     date_of_birth = models.DateField()
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by the patient_search_vector_update trigger (see migration 0010),
+    # so it is also current for bulk inserts and queryset updates.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = PatientQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=["search_vector"], name="patient_search_vector_idx"),
+            # Trigram indexes for the suggest endpoint. Names are indexed upper-cased
+            # because that is how Django renders istartswith and friends.
+            GinIndex(
+                OpClass(Upper("first_name"), name="gin_trgm_ops"),
+                name="patient_first_name_trgm_idx",
+            ),
+            GinIndex(
+                OpClass(Upper("last_name"), name="gin_trgm_ops"),
+                name="patient_last_name_trgm_idx",
+            ),
+            GinIndex(
+                fields=["phone_number"],
+                opclasses=["gin_trgm_ops"],
+                name="patient_phone_number_trgm_idx",
+            ),
+            # Composite indexes for the clinician scoped list queries, see
+            # GenderFilter and the ordering fields of PatientListCreateAPIView.
+            models.Index(
+                fields=["clinician", "created_at", "id"],
+                name="patient_clin_created_idx",
+            ),
+            models.Index(
+                fields=["clinician", "date_of_birth", "id"],
+                name="patient_clin_dob_idx",
+            ),
+            models.Index(
+                fields=["clinician", "gender", "created_at", "id"],
+                name="patient_clin_gen_created_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -87,6 +225,7 @@ class Assessment(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
     assessment_type = models.CharField(max_length=50, choices=TYPES.choices)
     assessment_date = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
     question = models.TextField(null=True, blank=True)
     final_score = models.DecimalField(
         max_digits=3,
@@ -97,5 +236,153 @@ class Assessment(models.Model):
         ],
     )
 
+    objects = AssessmentQuerySet.as_manager()
+
+    class Meta:
+        # Composite indexes for the clinician scoped list queries, see
+        # AssessmentTypeFilter and the ordering fields of the assessment list views.
+        indexes = [
+            models.Index(
+                fields=["clinician", "assessment_date", "id"],
+                name="assess_clin_date_idx",
+            ),
+            models.Index(
+                fields=["clinician", "patient", "assessment_date", "id"],
+                name="assess_clin_patient_date_idx",
+            ),
+            models.Index(
+                fields=["clinician", "assessment_type", "assessment_date", "id"],
+                name="assess_clin_type_date_idx",
+            ),
+            models.Index(
+                fields=["clinician", "final_score", "id"],
+                name="assess_clin_score_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.patient} - {self.assessment_type}"
+
+
+class AssessmentDailyRollup(models.Model):
+    """
+    Aggregated final scores of a clinician's assessments of one type on one day.
+
+    Kept up to date incrementally as assessments are created, edited and deleted (see
+    patients.rollups), and rebuilt from scratch with the rebuild_score_rollups command.
+    """
+
+    clinician = models.ForeignKey(User, on_delete=models.CASCADE)
+    assessment_type = models.CharField(max_length=50, choices=Assessment.TYPES.choices)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+    score_sum = models.DecimalField(max_digits=14, decimal_places=1)
+    score_sum_squares = models.DecimalField(max_digits=16, decimal_places=2)
+    score_min = models.DecimalField(max_digits=3, decimal_places=1)
+    score_max = models.DecimalField(max_digits=3, decimal_places=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["clinician", "assessment_type", "day"],
+                name="unique_assessment_daily_rollup",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.clinician} - {self.assessment_type} - {self.day}"
+
+    @property
+    def mean(self):
+        return self.score_sum / self.count
+
+    @property
+    def stddev(self):
+        variance = self.score_sum_squares / self.count - self.mean**2
+        return max(variance, Decimal(0)).sqrt()
+
+
+class AuditEvent(models.Model):
+    """
+    One read or change of a patient or assessment, written in batches by
+    patients.audit. The ids are plain columns rather than foreign keys, so the trail
+    outlives the rows it refers to.
+    """
+
+    class Action(models.TextChoices):
+        READ = "read", "Read"
+        CREATE = "create", "Create"
+        UPDATE = "update", "Update"
+        DELETE = "delete", "Delete"
+
+    occurred_at = models.DateTimeField()
+    user_id = models.BigIntegerField(null=True)
+    action = models.CharField(max_length=10, choices=Action.choices)
+    # Model name of the object, "patient" or "assessment".
+    model = models.CharField(max_length=20)
+    # Null for reads of a list, such as a patient's assessments.
+    object_id = models.BigIntegerField(null=True)
+    patient_id = models.BigIntegerField(null=True)
+    # Names of the fields an update wrote, when they are known.
+    fields = models.JSONField(null=True)
+    ip_address = models.GenericIPAddressField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["patient_id", "occurred_at"], name="audit_patient_idx"
+            ),
+            models.Index(fields=["user_id", "occurred_at"], name="audit_user_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.action} {self.model} {self.object_id}"
+
+
+class Job(models.Model):
+    """
+    A unit of background work run by the `run_jobs` workers, see patients.jobs.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        SUCCEEDED = "succeeded", "Succeeded"
+        FAILED = "failed", "Failed"
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.QUEUED
+    )
+    # Higher priorities run first, jobs of the same priority in the order they are
+    # due.
+    priority = models.SmallIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField()
+    # The worker running the job and until when, a job whose worker stopped is run
+    # again once locked_until passed.
+    locked_by = models.CharField(max_length=255, null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    # The user who queued the job. A plain column, deleting a user does not touch
+    # their jobs.
+    user_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                "status",
+                "run_at",
+                name="job_pending_idx",
+                condition=models.Q(status__in=["queued", "running"]),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
@@ -0,0 +1,221 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class OptionalCursorPagination(PageNumberPagination):
+    """
+    Page number pagination by default, keyset (cursor) pagination on request.
+
+    Clients opt in with `?pagination=cursor` and then follow the `next` and `previous`
+    links, which carry an opaque `cursor` parameter. A cursor page is fetched with a
+    range condition on (ordering field, id) instead of an OFFSET and without a COUNT
+    query, so its cost does not depend on how deep the page is.
+
+    The view declares the fields a cursor can be keyed on in `cursor_ordering_fields`
+    and the ordering to use otherwise in `cursor_default_ordering`. The first of those
+    fields the queryset is already ordered by is used, with the id as tiebreaker.
+
+    Both modes take a `page_size` parameter of up to `max_page_size` rows. Async views
+    paginate with `apaginate_queryset()`.
+    """
+
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    mode_query_param = "pagination"
+    invalid_cursor_message = "Invalid cursor."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.is_cursor_request(request)
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        queryset = self.get_cursor_queryset(queryset, request, view)
+        return self.get_cursor_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset() for the async views, reading the page and its count with
+        the async ORM.
+        """
+        self.use_cursor = self.is_cursor_request(request)
+        if self.use_cursor:
+            queryset = self.get_cursor_queryset(queryset, request, view)
+            return self.get_cursor_page([obj async for obj in queryset])
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(
+                self.invalid_page_message.format(
+                    page_number=page_number, message=str(exc)
+                )
+            )
+        # The slice Paginator.page() would take.
+        bottom = (number - 1) * paginator.per_page
+        top = bottom + paginator.per_page
+        if top + paginator.orphans >= paginator.count:
+            top = paginator.count
+        results = [obj async for obj in queryset[bottom:top]]
+        self.page = paginator._get_page(results, number, paginator)
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return results
+
+    def is_cursor_request(self, request):
+        return (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == "cursor"
+        )
+
+    def get_cursor_queryset(self, queryset, request, view):
+        """
+        Returns the query of a cursor page, one row longer than the page to tell
+        whether there are more.
+        """
+        self.display_page_controls = False
+        self.page_size = self.get_page_size(request)
+        self.base_url = remove_query_param(
+            request.build_absolute_uri(), self.page_query_param
+        )
+        self.ordering = self.get_cursor_ordering(queryset, view)
+        field_name = self.ordering.lstrip("-")
+        self.field = queryset.model._meta.get_field(field_name)
+
+        self.cursor = cursor = self.decode_cursor(request)
+        reverse = cursor["r"] if cursor else False
+        descending = self.ordering.startswith("-") != reverse
+        if descending:
+            queryset = queryset.order_by(f"-{field_name}", "-pk")
+        else:
+            queryset = queryset.order_by(field_name, "pk")
+
+        if cursor:
+            lookup = "lt" if descending else "gt"
+            queryset = queryset.filter(
+                Q(**{f"{field_name}__{lookup}e": cursor["v"]}),
+                Q(**{f"{field_name}__{lookup}": cursor["v"]})
+                | Q(**{f"pk__{lookup}": cursor["id"]}),
+            )
+        return queryset[: self.page_size + 1]
+
+    def get_cursor_page(self, results):
+        cursor = self.cursor
+        reverse = cursor["r"] if cursor else False
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.next_position = self.previous_position = None
+        if results:
+            if has_more or reverse:
+                self.next_position = results[-1]
+            if (has_more and reverse) or (cursor and not reverse):
+                self.previous_position = results[0]
+        return results
+
+    def get_cursor_ordering(self, queryset, view):
+        allowed = getattr(view, "cursor_ordering_fields", [])
+        for field in queryset.query.order_by:
+            if isinstance(field, str) and field.lstrip("-") in allowed:
+                return field
+        return view.cursor_default_ordering
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            padded = token + "=" * (-len(token) % 4)
+            cursor = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+            if cursor["o"] != self.ordering:
+                raise ValueError("Cursor was issued for another ordering")
+            cursor["v"] = self.field.to_python(cursor["v"])
+            cursor["id"] = int(cursor["id"])
+            cursor["r"] = bool(cursor["r"])
+        except (
+            binascii.Error,
+            KeyError,
+            TypeError,
+            UnicodeEncodeError,
+            ValueError,
+            ValidationError,
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, obj, reverse):
+        cursor = {
+            "o": self.ordering,
+            "v": self.field.value_to_string(obj),
+            "id": obj.pk,
+            "r": reverse,
+        }
+        token = base64.urlsafe_b64encode(
+            json.dumps(cursor, separators=(",", ":")).encode()
+        ).decode("ascii")
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, token.rstrip("=")
+        )
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.use_cursor:
+            return super().get_previous_link()
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        parameters += [
+            {
+                "name": self.mode_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Set to `cursor` to use cursor pagination.",
+                "schema": {"type": "string", "enum": ["cursor"]},
+            },
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The pagination cursor value.",
+                "schema": {"type": "string"},
+            },
+        ]
+        return parameters
@@ -0,0 +1,62 @@
+import io
+
+import orjson
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import BaseParser, JSONParser
+
+# orjson reads integers beyond 64 bits as floats, json.loads keeps them exact.
+DIGITS_TO_ZERO = bytes.maketrans(b"123456789", b"000000000")
+LONG_NUMBER = b"0" * 19
+
+
+class FastJSONParser(JSONParser):
+    """
+    Drop-in replacement for JSONParser that decodes UTF-8 bodies with orjson.
+
+    Bodies orjson rejects, such as invalid JSON or NaN, and bodies with numbers of 19
+    digits or more are handed to JSONParser, so they are parsed or rejected exactly
+    as before.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if encoding.lower().replace("-", "") != "utf8":
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        if LONG_NUMBER in body.translate(DIGITS_TO_ZERO):
+            return super().parse(io.BytesIO(body), media_type, parser_context)
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
+
+
+class RequestTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "The request body is too large."
+    default_code = "request_too_large"
+
+
+class LargeJSONParser(BaseParser):
+    """
+    FastJSONParser for bodies of up to the view's `max_body_size` bytes.
+
+    DRF reads the body of a JSONParser through request.body, which refuses bodies
+    over DATA_UPLOAD_MAX_MEMORY_SIZE. This parser reads the request stream itself.
+    """
+
+    media_type = "application/json"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        max_size = parser_context["view"].max_body_size
+        request = parser_context["request"]
+        if int(request.META.get("CONTENT_LENGTH") or 0) > max_size:
+            raise RequestTooLarge()
+        body = stream.read(max_size + 1)
+        if len(body) > max_size:
+            raise RequestTooLarge()
+        return FastJSONParser().parse(io.BytesIO(body), media_type, parser_context)
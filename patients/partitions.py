@@ -0,0 +1,222 @@
+"""
+Optional monthly range partitioning of the assessments table.
+
+convert() turns patients_assessment into a table partitioned by assessment_date
+with one partition per calendar month (in settings.TIME_ZONE) and a default
+partition for anything outside of them. The Assessment model does not change: the
+primary key becomes (id, assessment_date), because Postgres requires the partition
+key in it, and ids stay unique through the identity sequence. Queries bounded by
+assessment_date, such as AssessmentTypeFilter's date range, only read the
+partitions of the months they cover.
+
+create_partitions() adds the partitions of the coming months ahead of time and
+detach_partitions() detaches old months, which stay in place as plain tables for
+archiving. See the partition_assessments command.
+"""
+
+import re
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Assessment
+
+TABLE = Assessment._meta.db_table
+PARTITION_KEY = "assessment_date"
+DEFAULT_PARTITION = f"{TABLE}_default"
+PARTITION_NAME = re.compile(rf"^{TABLE}_p(\d{{4}})_(\d{{2}})$")
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def month_start(value):
+    """
+    Returns the start of the month of `value` as an aware datetime.
+    """
+    local = timezone.localtime(value)
+    return timezone.make_aware(datetime(local.year, local.month, 1))
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month:%Y_%m}"
+
+
+def quote(name):
+    return connection.ops.quote_name(name)
+
+
+def is_partitioned():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", [TABLE])
+        return cursor.fetchone()[0] == "p"
+
+
+def get_partitions():
+    """
+    Returns the names of the monthly partitions by the start of their month.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits"
+            " JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+            " WHERE pg_inherits.inhparent = %s::regclass",
+            [TABLE],
+        )
+        names = [name for (name,) in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            month = datetime(int(match[1]), int(match[2]), 1)
+            partitions[timezone.make_aware(month)] = name
+    return dict(sorted(partitions.items()))
+
+
+def create_partition(cursor, month):
+    """
+    Creates and attaches the partition of one month. Rows of that month that ended
+    up in the default partition are moved into it first.
+    """
+    name = partition_name(month)
+    bounds = [month, add_months(month, 1)]
+    cursor.execute(
+        f"CREATE TABLE {quote(name)}"
+        f" (LIKE {quote(TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+    )
+    cursor.execute("SELECT to_regclass(%s)", [DEFAULT_PARTITION])
+    if cursor.fetchone()[0] is not None:
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {quote(DEFAULT_PARTITION)}"
+            f" WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s RETURNING *)"
+            f" INSERT INTO {quote(name)} SELECT * FROM moved",
+            bounds,
+        )
+    # Attaching creates the partition's indexes, primary key and foreign keys.
+    cursor.execute(
+        f"ALTER TABLE {quote(TABLE)} ATTACH PARTITION {quote(name)}"
+        " FOR VALUES FROM (%s) TO (%s)",
+        bounds,
+    )
+    return name
+
+
+def create_partitions(months_ahead):
+    """
+    Creates the missing partitions from the current month up to `months_ahead`
+    months after it. Returns the names of the created partitions.
+    """
+    current = month_start(timezone.now())
+    with transaction.atomic(), connection.cursor() as cursor:
+        existing = get_partitions()
+        return [
+            create_partition(cursor, month)
+            for month in (add_months(current, i) for i in range(months_ahead + 1))
+            if month not in existing
+        ]
+
+
+def detach_partitions(before):
+    """
+    Detaches the partitions of the months before `before`. The detached tables keep
+    their rows but lose their foreign keys, so they do not block deleting patients.
+    Returns the names of the detached partitions.
+    """
+    detached = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for month, name in get_partitions().items():
+            if month >= before:
+                break
+            cursor.execute(f"ALTER TABLE {quote(TABLE)} DETACH PARTITION {quote(name)}")
+            cursor.execute(
+                "SELECT conname FROM pg_constraint"
+                " WHERE conrelid = %s::regclass AND contype = 'f'",
+                [name],
+            )
+            for (constraint,) in cursor.fetchall():
+                cursor.execute(
+                    f"ALTER TABLE {quote(name)} DROP CONSTRAINT {quote(constraint)}"
+                )
+            detached.append(name)
+    return detached
+
+
+def convert(months_ahead):
+    """
+    Converts the unpartitioned assessments table into a partitioned one, with
+    partitions for every month from the oldest assessment up to `months_ahead`
+    months from now. The table is locked while its rows are copied.
+    """
+    staging = f"{TABLE}_partitioned"
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Runs the checks of deferred foreign keys that are still pending, the table
+        # can not be dropped while it has any.
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"LOCK TABLE {quote(TABLE)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint"
+            " WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f')",
+            [TABLE],
+        )
+        constraints = cursor.fetchall()
+        if any(contype == "u" for _, contype, _ in constraints):
+            raise ValueError(
+                f"{TABLE} has unique constraints, which a partitioned table only "
+                f"allows when they include {PARTITION_KEY}."
+            )
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN"
+            " (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)",
+            [TABLE, TABLE],
+        )
+        indexes = [definition for (definition,) in cursor.fetchall()]
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f"SELECT MIN({PARTITION_KEY}) FROM {quote(TABLE)}")
+        oldest = cursor.fetchone()[0] or timezone.now()
+
+        cursor.execute(
+            f"CREATE TABLE {quote(staging)} (LIKE {quote(TABLE)} INCLUDING DEFAULTS"
+            " INCLUDING IDENTITY INCLUDING CONSTRAINTS INCLUDING STORAGE)"
+            f" PARTITION BY RANGE ({PARTITION_KEY})"
+        )
+        cursor.execute(
+            f"CREATE TABLE {quote(DEFAULT_PARTITION)} PARTITION OF {quote(staging)}"
+            " DEFAULT"
+        )
+        month = month_start(oldest)
+        last = add_months(month_start(timezone.now()), months_ahead)
+        while month <= last:
+            cursor.execute(
+                f"CREATE TABLE {quote(partition_name(month))}"
+                f" PARTITION OF {quote(staging)} FOR VALUES FROM (%s) TO (%s)",
+                [month, add_months(month, 1)],
+            )
+            month = add_months(month, 1)
+
+        # The rows go straight into their partitions, the indexes are built after.
+        cursor.execute(f"INSERT INTO {quote(staging)} SELECT * FROM {quote(TABLE)}")
+        cursor.execute(f"DROP TABLE {quote(TABLE)}")
+        cursor.execute(f"ALTER TABLE {quote(staging)} RENAME TO {quote(TABLE)}")
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        cursor.execute(
+            f"ALTER SEQUENCE {cursor.fetchone()[0]}"
+            f" RENAME TO {sequence.rpartition('.')[2]}"
+        )
+        cursor.execute(
+            f"SELECT setval(%s, (SELECT COALESCE(MAX(id), 0) + 1 FROM {quote(TABLE)}),"
+            " false)",
+            [sequence],
+        )
+
+        for name, contype, definition in constraints:
+            if contype == "p":
+                definition = f"PRIMARY KEY (id, {PARTITION_KEY})"
+            cursor.execute(
+                f"ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote(name)} {definition}"
+            )
+        for definition in indexes:
+            cursor.execute(definition)
@@ -7,4 +7,5 @@ class IsOwner(permissions.IsAuthenticated):
     """
 
     def has_object_permission(self, request, view, obj):
-        return obj.clinician == request.user
+        # Compares ids, so the clinician row does not have to be fetched.
+        return obj.clinician_id == request.user.pk
@@ -0,0 +1,114 @@
+import csv
+import io
+import json
+
+import orjson
+from phonenumber_field.phonenumber import PhoneNumber
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+# orjson writes floats in exponent notation as "1e16" and small ones as "0.00001",
+# where json.dumps writes "1e+16" and "1e-05". Output with a digit followed by "e" or
+# with "0.0000" in it is rendered again by json.dumps; strings can trigger this as
+# well, which only costs the speedup. Mapping all digits to "0" first turns the check
+# into two substring searches.
+DIGITS_TO_ZERO = bytes.maketrans(b"123456789", b"000000000")
+LINE_SEPARATORS = [
+    ("\u2028".encode(), b"\\u2028"),
+    ("\u2029".encode(), b"\\u2029"),
+]
+
+
+def may_contain_exponent(ret):
+    return b"0.0000" in ret or b"0e" in ret.translate(DIGITS_TO_ZERO)
+
+
+class JSONEncoder(encoders.JSONEncoder):
+    """
+    DRF's JSONEncoder, which also encodes phone numbers as their string form.
+    """
+
+    def default(self, obj):
+        if isinstance(obj, PhoneNumber):
+            return str(obj)
+        return super().default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in replacement for JSONRenderer that encodes with orjson.
+
+    The output is byte for byte what JSONRenderer with the default COMPACT_JSON,
+    UNICODE_JSON and STRICT_JSON settings produces. Dates and times, decimals and
+    everything else orjson has no native encoding for go through the same encoder as
+    JSONRenderer. Indented output (the browsable API, `; indent=` in Accept), other
+    settings, data orjson refuses and output that may contain floats are left to
+    JSONRenderer. Unlike JSONRenderer, NaN and infinite floats are encoded as null
+    instead of raising.
+    """
+
+    encoder_class = JSONEncoder
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def __init__(self):
+        super().__init__()
+        self.default = self.encoder_class().default
+        self.fast = self.compact and not self.ensure_ascii and self.strict
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent or not self.fast:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if may_contain_exponent(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped like JSONRenderer does, to keep the output a strict JavaScript subset.
+        for separator, escaped in LINE_SEPARATORS:
+            if separator in ret:
+                ret = ret.replace(separator, escaped)
+        return ret
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Selects CSV for the export views through content negotiation (Accept: text/csv or
+    ?format=csv). Rows are streamed by the view itself; this renderer only renders
+    error responses, as one header line and one row.
+    """
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if not isinstance(data, dict):
+            data = {"detail": data}
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(data.keys())
+        writer.writerow(data.values())
+        return buffer.getvalue().encode(self.charset)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Selects newline delimited JSON for the export views through content negotiation
+    (Accept: application/x-ndjson or ?format=ndjson). Like CSVRenderer it only renders
+    error responses, as a single line.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return (json.dumps(data, default=str) + "\n").encode(self.charset)
@@ -0,0 +1,229 @@
+"""
+Maintenance of the daily score rollups (AssessmentDailyRollup).
+
+Every rollup row holds the count, sum, sum of squares, minimum and maximum of the
+final scores of one clinician's assessments of one type on one day, so summaries
+over any range of days read one row per day instead of every assessment.
+
+Adding scores is a single additive upsert per batch. Removing a score subtracts it
+again; only when it was the minimum or maximum of its day are those recomputed from
+the assessments of that day, which the (clinician, assessment_type, assessment_date)
+index serves directly. Deleting a patient recomputes the days its assessments were
+on instead of removing them one by one.
+
+Single saves and deletes are applied by the receivers in patients.signals, bulk
+inserts have to call add_assessments() themselves. Writes that bypass both, such as
+QuerySet.update(), are repaired by the rebuild_score_rollups command. Recomputing
+and rebuilding rows invalidate the cached summaries of their clinicians.
+"""
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F, Max, Min
+from django.utils import timezone
+
+from .cache import invalidate_clinician, invalidate_clinicians
+from .models import Assessment, AssessmentDailyRollup
+
+ROLLUP_COLUMNS = (
+    "clinician_id",
+    "assessment_type",
+    "day",
+    "count",
+    "score_sum",
+    "score_sum_squares",
+    "score_min",
+    "score_max",
+)
+
+UPSERT_SQL = """
+INSERT INTO {table} AS rollup ({columns})
+VALUES {values}
+ON CONFLICT (clinician_id, assessment_type, day) DO UPDATE SET
+    count = rollup.count + EXCLUDED.count,
+    score_sum = rollup.score_sum + EXCLUDED.score_sum,
+    score_sum_squares = rollup.score_sum_squares + EXCLUDED.score_sum_squares,
+    score_min = LEAST(rollup.score_min, EXCLUDED.score_min),
+    score_max = GREATEST(rollup.score_max, EXCLUDED.score_max)
+"""
+
+REBUILD_SQL = """
+INSERT INTO {table} ({columns})
+SELECT
+    clinician_id,
+    assessment_type,
+    (assessment_date AT TIME ZONE %s)::date,
+    COUNT(*),
+    SUM(final_score),
+    SUM(final_score * final_score),
+    MIN(final_score),
+    MAX(final_score)
+FROM {source}
+{where}
+GROUP BY 1, 2, 3
+"""
+
+
+def get_group(clinician_id, assessment_type, assessment_date, final_score):
+    """
+    Returns the rollup group of an assessment and its score, normalising values that
+    were assigned to a model instance without being converted.
+    """
+    assessment_date = Assessment._meta.get_field("assessment_date").to_python(
+        assessment_date
+    )
+    if timezone.is_naive(assessment_date):
+        assessment_date = timezone.make_aware(assessment_date)
+    group = (clinician_id, assessment_type, timezone.localdate(assessment_date))
+    return group, Decimal(str(final_score))
+
+
+def get_assessment_group(assessment):
+    return get_group(
+        assessment.clinician_id,
+        assessment.assessment_type,
+        assessment.assessment_date,
+        assessment.final_score,
+    )
+
+
+def add_scores(scores):
+    """
+    Adds (group, score) pairs to the rollups with one upsert.
+    """
+    totals = {}
+    for group, score in scores:
+        count, total, squares, low, high = totals.get(group, (0, 0, 0, score, score))
+        totals[group] = (
+            count + 1,
+            total + score,
+            squares + score * score,
+            min(low, score),
+            max(high, score),
+        )
+    if not totals:
+        return
+
+    sql = UPSERT_SQL.format(
+        table=AssessmentDailyRollup._meta.db_table,
+        columns=", ".join(ROLLUP_COLUMNS),
+        values=", ".join(
+            ["({})".format(", ".join(["%s"] * len(ROLLUP_COLUMNS)))] * len(totals)
+        ),
+    )
+    # Rows are written in a fixed order so concurrent batches can not deadlock.
+    params = [
+        value for group, row in sorted(totals.items()) for value in (*group, *row)
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def add_assessments(assessments):
+    add_scores(get_assessment_group(assessment) for assessment in assessments)
+
+
+def remove_score(group, score):
+    """
+    Removes one score from its rollup row, deleting the row when it was the last one.
+    """
+    clinician_id, assessment_type, day = group
+    rollups = AssessmentDailyRollup.objects.filter(
+        clinician_id=clinician_id, assessment_type=assessment_type, day=day
+    )
+    with transaction.atomic():
+        rollup = rollups.select_for_update().first()
+        if rollup is None:
+            return
+        if rollup.count <= 1:
+            rollup.delete()
+            return
+
+        rollup.count = F("count") - 1
+        rollup.score_sum = F("score_sum") - score
+        rollup.score_sum_squares = F("score_sum_squares") - score * score
+        update_fields = ["count", "score_sum", "score_sum_squares"]
+        if score in (rollup.score_min, rollup.score_max):
+            start = timezone.make_aware(datetime.combine(day, time.min))
+            bounds = Assessment.objects.filter(
+                clinician_id=clinician_id,
+                assessment_type=assessment_type,
+                assessment_date__gte=start,
+                assessment_date__lt=start + timedelta(days=1),
+            ).aggregate(score_min=Min("final_score"), score_max=Max("final_score"))
+            if bounds["score_min"] is not None:
+                rollup.score_min = bounds["score_min"]
+                rollup.score_max = bounds["score_max"]
+                update_fields += ["score_min", "score_max"]
+        rollup.save(update_fields=update_fields)
+
+
+def insert_from_assessments(where, params):
+    sql = REBUILD_SQL.format(
+        table=AssessmentDailyRollup._meta.db_table,
+        columns=", ".join(ROLLUP_COLUMNS),
+        source=Assessment._meta.db_table,
+        where=where,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [timezone.get_current_timezone_name(), *params])
+        return cursor.rowcount
+
+
+def recompute_days(clinician_id, days):
+    """
+    Recomputes all of a clinician's rollups on the given days, for changes that
+    remove many assessments at once.
+    """
+    days = sorted(set(days))
+    if not days:
+        return
+    with transaction.atomic():
+        AssessmentDailyRollup.objects.filter(
+            clinician_id=clinician_id, day__in=days
+        ).delete()
+        insert_from_assessments(
+            "WHERE clinician_id = %s AND (assessment_date AT TIME ZONE %s)::date"
+            " = ANY(%s)",
+            [clinician_id, timezone.get_current_timezone_name(), days],
+        )
+        invalidate_clinician(clinician_id)
+
+
+def rebuild(clinician_ids=None):
+    """
+    Recomputes the rollups of the given clinicians, or of everybody, from the
+    assessments. Returns the number of rollup rows written.
+
+    The cached summaries of the clinicians whose rollups were rebuilt are
+    invalidated once the transaction commits.
+    """
+    rollups = AssessmentDailyRollup.objects.all()
+    where, params = "", []
+    if clinician_ids is not None:
+        rollups = rollups.filter(clinician_id__in=clinician_ids)
+        where, params = "WHERE clinician_id = ANY(%s)", [list(clinician_ids)]
+
+    with transaction.atomic():
+        if clinician_ids is None:
+            # Everybody's rebuild touches the clinicians that had rollups before
+            # and those that have some after.
+            touched = set(get_clinician_ids())
+        else:
+            touched = set(clinician_ids)
+        rollups.delete()
+        written = insert_from_assessments(where, params)
+        if clinician_ids is None:
+            touched.update(get_clinician_ids())
+        invalidate_clinicians(touched)
+        return written
+
+
+def get_clinician_ids():
+    return (
+        AssessmentDailyRollup.objects.order_by()
+        .values_list("clinician_id", flat=True)
+        .distinct()
+    )
@@ -0,0 +1,440 @@
+"""
+Deterministic synthetic data for benchmarks and index work, see the
+seed_healthtrack command.
+
+Clinician number `index` of a seed always gets the same patients, addresses and
+assessment history: everything about it is drawn from its own random generator, and
+its patients' phone numbers are derived from their position, so they are unique
+without coordinating with other batches or processes. Caseloads are skewed (log
+normal), patients live in several countries with matching phone numbers, and their
+assessments spread over years with a per patient baseline and trend.
+
+Rows are written with COPY (see patients.bulk), one transaction per batch of
+clinicians, so an interrupted run can be resumed by skipping the clinicians that
+already exist. Different seeds give their patients the same phone numbers, so a
+database can only hold the data of one seed.
+"""
+
+import math
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import User
+
+from . import rollups
+from .bulk import allocate_ids, copy_rows
+from .models import Address, Assessment, Patient
+
+# Countries with their share of the patients (in slots out of the total), cities,
+# postal code patterns (9 is a digit, A a letter) and phone numbers. A number is a
+# prefix followed by `digits` digits, counted from `lowest`. All of them are valid
+# mobile or geographic numbers of the country.
+COUNTRIES = [
+    {
+        "code": "US",
+        "slots": 10,
+        "cities": [
+            "New York",
+            "Chicago",
+            "Boston",
+            "Seattle",
+            "Denver",
+            "Austin",
+            "Miami",
+            "Atlanta",
+            "Phoenix",
+            "Las Vegas",
+        ],
+        "postal_code": "99999",
+        "prefixes": [
+            f"+1{area}" for area in (212, 312, 617, 206, 303, 512, 305, 404, 602, 702)
+        ],
+        "digits": 7,
+        "lowest": 2000000,
+    },
+    {
+        "code": "CA",
+        "slots": 2,
+        "cities": ["Toronto", "Vancouver", "Montreal", "Calgary", "Ottawa"],
+        "postal_code": "A9A 9A9",
+        "prefixes": [f"+1{area}" for area in (416, 604, 514, 403, 613)],
+        "digits": 7,
+        "lowest": 2000000,
+    },
+    {
+        "code": "GB",
+        "slots": 3,
+        "cities": ["London", "Manchester", "Birmingham", "Leeds", "Glasgow"],
+        "postal_code": "AA9 9AA",
+        "prefixes": [f"+44{block}" for block in range(7400, 7457)],
+        "digits": 6,
+        "lowest": 0,
+    },
+    {
+        "code": "DE",
+        "slots": 2,
+        "cities": ["Berlin", "Hamburg", "Munich", "Cologne", "Frankfurt"],
+        "postal_code": "99999",
+        "prefixes": [f"+49{block}" for block in (151, 160, 170, 171, 176)],
+        "digits": 8,
+        "lowest": 0,
+    },
+    {
+        "code": "FR",
+        "slots": 2,
+        "cities": ["Paris", "Lyon", "Marseille", "Toulouse", "Nice"],
+        "postal_code": "99999",
+        "prefixes": [f"+33{block}" for block in (60, 61, 62, 64, 65, 66, 67, 68)],
+        "digits": 7,
+        "lowest": 0,
+    },
+    {
+        "code": "AU",
+        "slots": 1,
+        "cities": ["Sydney", "Melbourne", "Brisbane", "Perth", "Adelaide"],
+        "postal_code": "9999",
+        "prefixes": [f"+614{block}" for block in (0, 1, 2, 3, 6)],
+        "digits": 7,
+        "lowest": 0,
+    },
+]
+
+# Country of every slot, and the rank of the slot among the country's slots.
+SLOTS = [(country, rank) for country in COUNTRIES for rank in range(country["slots"])]
+
+FIRST_NAMES = {
+    Patient.Gender.FEMALE: [
+        "Mary",
+        "Patricia",
+        "Jennifer",
+        "Linda",
+        "Elizabeth",
+        "Susan",
+        "Margaret",
+        "Dorothy",
+        "Sarah",
+        "Karen",
+        "Emma",
+        "Olivia",
+        "Sophie",
+        "Hannah",
+        "Léa",
+        "Chloé",
+        "Anna",
+        "Grace",
+        "Ruth",
+        "Helen",
+    ],
+    Patient.Gender.MALE: [
+        "James",
+        "John",
+        "Robert",
+        "Michael",
+        "William",
+        "David",
+        "Richard",
+        "Joseph",
+        "Thomas",
+        "Charles",
+        "Oliver",
+        "Lukas",
+        "Jonas",
+        "Hugo",
+        "Louis",
+        "Jack",
+        "Noah",
+        "Liam",
+        "George",
+        "Henry",
+    ],
+    Patient.Gender.OTHER: ["Alex", "Sam", "Charlie", "Robin", "Jordan", "Taylor"],
+}
+
+LAST_NAMES = [
+    "Smith",
+    "Johnson",
+    "Williams",
+    "Brown",
+    "Jones",
+    "Garcia",
+    "Miller",
+    "Davis",
+    "Wilson",
+    "Taylor",
+    "Anderson",
+    "Thomas",
+    "Moore",
+    "Martin",
+    "Jackson",
+    "Thompson",
+    "White",
+    "Harris",
+    "Clark",
+    "Lewis",
+    "Müller",
+    "Schmidt",
+    "Schneider",
+    "Fischer",
+    "Weber",
+    "Bernard",
+    "Dubois",
+    "Durand",
+    "Lefebvre",
+    "Moreau",
+    "O'Brien",
+    "Nguyen",
+    "Patel",
+    "Singh",
+    "Kim",
+    "Walker",
+    "Young",
+    "King",
+    "Wright",
+    "Scott",
+]
+
+STREETS = [
+    "Main",
+    "Oak",
+    "Maple",
+    "Cedar",
+    "Elm",
+    "Park",
+    "Lake",
+    "Hill",
+    "Church",
+    "Mill",
+    "Station",
+    "High",
+    "Victoria",
+    "King",
+    "Queen",
+]
+
+STREET_SUFFIXES = ["Street", "Avenue", "Road", "Lane", "Drive", "Way"]
+
+GENDERS = [Patient.Gender.FEMALE, Patient.Gender.MALE, Patient.Gender.OTHER]
+GENDER_WEIGHTS = [50, 47, 3]
+
+ASSESSMENT_TYPES = list(Assessment.TYPES.values)
+
+ADDRESS_COLUMNS = [
+    "id",
+    "address_one",
+    "address_two",
+    "country",
+    "city",
+    "postal_code",
+]
+PATIENT_COLUMNS = [
+    "id",
+    "clinician_id",
+    "address_id",
+    "first_name",
+    "last_name",
+    "gender",
+    "phone_number",
+    "date_of_birth",
+    "created_at",
+    "updated_at",
+]
+ASSESSMENT_COLUMNS = [
+    "clinician_id",
+    "patient_id",
+    "assessment_type",
+    "assessment_date",
+    "updated_at",
+    "final_score",
+]
+
+
+def phone_capacity():
+    """
+    Returns how many patient numbers there are before phone numbers would repeat.
+    """
+    return min(
+        len(country["prefixes"])
+        * (10 ** country["digits"] - country["lowest"])
+        * len(SLOTS)
+        // country["slots"]
+        for country in COUNTRIES
+    )
+
+
+def get_country(number):
+    return SLOTS[number % len(SLOTS)][0]
+
+
+def phone_number(number):
+    """
+    Returns the phone number of the patient with the given patient number, in E.164.
+    Different patient numbers always get different phone numbers.
+    """
+    country, rank = SLOTS[number % len(SLOTS)]
+    # Position among the patient numbers of this country.
+    position = number // len(SLOTS) * country["slots"] + rank
+    prefixes = country["prefixes"]
+    local = country["lowest"] + position // len(prefixes)
+    return f"{prefixes[position % len(prefixes)]}{local:0{country['digits']}d}"
+
+
+def postal_code(rng, pattern):
+    characters = []
+    for char in pattern:
+        if char == "9":
+            char = str(rng.randrange(10))
+        elif char == "A":
+            char = chr(ord("A") + rng.randrange(26))
+        characters.append(char)
+    return "".join(characters)
+
+
+def caseload(rng, mean, maximum):
+    """
+    Log normal number of patients, most clinicians have a few and some very many.
+    """
+    sigma = 1.0
+    mu = math.log(mean) - sigma**2 / 2
+    return max(1, min(maximum, round(rng.lognormvariate(mu, sigma))))
+
+
+class ClinicianGenerator:
+    """
+    Generates the rows of one clinician from its own random generator.
+    """
+
+    def __init__(self, seed, index, end, options):
+        self.rng = random.Random(f"{seed}-{index}")
+        self.index = index
+        self.end = end
+        self.options = options
+
+    def patients(self):
+        """
+        Yields the address, patient and assessment values of every patient, without
+        ids.
+        """
+        rng = self.rng
+        options = self.options
+        count = caseload(
+            rng, options["patients_per_clinician"], options["max_patients"]
+        )
+        history = timedelta(days=365 * options["years"])
+        for i in range(count):
+            number = self.index * options["max_patients"] + i
+            country = get_country(number)
+            gender = rng.choices(GENDERS, GENDER_WEIGHTS)[0]
+            age = int(rng.triangular(0, 100, 70))
+            created_at = self.end - history * rng.random() ** 0.5
+            address = [
+                f"{rng.randint(1, 9999)} {rng.choice(STREETS)} "
+                f"{rng.choice(STREET_SUFFIXES)}",
+                f"Apt {rng.randint(1, 40)}" if rng.random() < 0.2 else None,
+                country["code"],
+                rng.choice(country["cities"]),
+                postal_code(rng, country["postal_code"]),
+            ]
+            patient = [
+                rng.choice(FIRST_NAMES[gender]),
+                rng.choice(LAST_NAMES),
+                gender.value,
+                phone_number(number),
+                (created_at - timedelta(days=age * 365 + rng.randrange(365))).date(),
+                created_at,
+            ]
+            yield address, patient, self.assessments(created_at)
+
+    def assessments(self, since):
+        """
+        Returns the (type, date, score) of a patient's assessments since `since`.
+        """
+        rng = self.rng
+        mean = self.options["assessments_per_patient"]
+        count = min(int(rng.expovariate(1 / mean)), mean * 10) if mean else 0
+        # Most patients are assessed on one or two things.
+        types = rng.sample(ASSESSMENT_TYPES, rng.choice([1, 1, 2, 2, 3, 4]))
+        baseline = rng.uniform(2, 9)
+        trend = rng.gauss(0, 0.5)
+        span = (self.end - since).total_seconds()
+        assessments = []
+        for _ in range(count):
+            offset = rng.random() * span
+            years = offset / (365 * 86400)
+            score = baseline + trend * years + rng.gauss(0, 0.8)
+            score = min(max(round(score, 1), 1.0), 10.0)
+            assessments.append(
+                (
+                    rng.choice(types),
+                    since + timedelta(seconds=offset),
+                    Decimal(str(score)),
+                )
+            )
+        return sorted(assessments, key=lambda assessment: assessment[1])
+
+
+def clinician_email(seed, index):
+    return f"seed-{seed}-{index}@healthtrack.com"
+
+
+def get_clinicians(seed=None):
+    """
+    Returns the clinicians generated for `seed`, or for any seed.
+    """
+    prefix = "seed-[0-9]+-" if seed is None else f"seed-{seed}-"
+    return User.objects.filter(email__regex=rf"^{prefix}[0-9]+@healthtrack\.com$")
+
+
+def get_seeded(seed):
+    """
+    Returns the indexes of the clinicians of `seed` that already exist.
+    """
+    emails = get_clinicians(seed).values_list("email", flat=True)
+    return {int(email.split("@")[0].rpartition("-")[2]) for email in emails}
+
+
+def get_end(day):
+    return timezone.make_aware(datetime.combine(day, time()))
+
+
+def seed_clinicians(seed, indexes, end, options):
+    """
+    Creates the clinicians with the given indexes and everything they own in one
+    transaction. Returns the numbers of patients and assessments written.
+    """
+    generators = [ClinicianGenerator(seed, index, end, options) for index in indexes]
+    rows = [list(generator.patients()) for generator in generators]
+    now = timezone.now()
+    with transaction.atomic():
+        clinicians = User.objects.bulk_create(
+            User(
+                email=clinician_email(seed, index),
+                first_name=f"Clinician{index}",
+                last_name=f"Seed{seed}",
+                password=make_password(None),
+            )
+            for index in indexes
+        )
+        total = sum(len(patients) for patients in rows)
+        address_ids = iter(allocate_ids(Address, total))
+        patient_ids = iter(allocate_ids(Patient, total))
+        addresses, patients, assessments = [], [], []
+        for clinician, clinician_rows in zip(clinicians, rows):
+            for address, patient, history in clinician_rows:
+                address_id = next(address_ids)
+                patient_id = next(patient_ids)
+                addresses.append([address_id, *address])
+                patients.append([patient_id, clinician.pk, address_id, *patient, now])
+                assessments.extend(
+                    [clinician.pk, patient_id, kind, date, now, score]
+                    for kind, date, score in history
+                )
+        copy_rows(Address._meta.db_table, ADDRESS_COLUMNS, addresses)
+        copy_rows(Patient._meta.db_table, PATIENT_COLUMNS, patients)
+        copy_rows(Assessment._meta.db_table, ASSESSMENT_COLUMNS, assessments)
+        rollups.rebuild([clinician.pk for clinician in clinicians])
+    return len(patients), len(assessments)
@@ -1,9 +1,24 @@
+from phonenumber_field.validators import validate_international_phonenumber
 from rest_framework import serializers
 
-from patients.models import Address, Assessment, Patient
+from healthtrack.metrics import MeasuredSerializerMixin
+from patients.models import (
+    Address,
+    Assessment,
+    AssessmentDailyRollup,
+    AuditEvent,
+    Job,
+    Patient,
+)
 
 
-class AddressSerializer(serializers.ModelSerializer):
+class ModelSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
+    """
+    Reports its time to the request metrics, see healthtrack/metrics.py.
+    """
+
+
+class AddressSerializer(ModelSerializer):
     country = serializers.SerializerMethodField()
 
     class Meta:
@@ -17,10 +32,14 @@ class AddressSerializer(serializers.ModelSerializer):
         ]
 
     def get_country(self, obj):
-        return obj.country.name
+        # The country is optional and can not be set through this serializer.
+        return obj.country.name if obj.country else None
 
 
-class PatientListSerializer(serializers.ModelSerializer):
+class PatientListSerializer(ModelSerializer):
+    # Annotated by PatientQuerySet.with_age() instead of the per-row age property.
+    age = serializers.IntegerField(source="age_years", read_only=True)
+
     class Meta:
         model = Patient
         fields = [
@@ -34,7 +53,23 @@ class PatientListSerializer(serializers.ModelSerializer):
         ]
 
 
-class PatientCreateSerializer(serializers.ModelSerializer):
+class PatientSuggestSerializer(ModelSerializer):
+    """
+    Minimal patient representation for typeahead suggestions.
+    """
+
+    class Meta:
+        model = Patient
+        fields = [
+            "id",
+            "first_name",
+            "last_name",
+            "phone_number",
+            "date_of_birth",
+        ]
+
+
+class PatientCreateSerializer(ModelSerializer):
     """
     Serializer for creating a new Patient instance.
 
@@ -60,7 +95,22 @@ class PatientCreateSerializer(serializers.ModelSerializer):
         ]
 
 
-class PatientDetailSerializer(serializers.ModelSerializer):
+class PatientBulkCreateSerializer(PatientCreateSerializer):
+    """
+    Serializer for one item of a bulk patient creation.
+
+    The phone number UniqueValidator is dropped, keeping the number format check,
+    because the view checks the phone numbers of the whole batch with a single query
+    instead.
+    """
+
+    class Meta(PatientCreateSerializer.Meta):
+        extra_kwargs = {
+            "phone_number": {"validators": [validate_international_phonenumber]}
+        }
+
+
+class PatientDetailSerializer(ModelSerializer):
     clinician = serializers.ReadOnlyField(source="clinician.email")
     address = AddressSerializer()
 
@@ -81,7 +131,14 @@ class PatientDetailSerializer(serializers.ModelSerializer):
         ]
 
 
-class PatientUpdateSerializer(serializers.ModelSerializer):
+class PatientUpdateSerializer(ModelSerializer):
+    """
+    Serializer for updating a Patient instance.
+
+    The phone number is only checked for uniqueness when it changes, instead of on
+    every update that sends it. Its format is always checked.
+    """
+
     address = AddressSerializer()
 
     class Meta:
@@ -94,15 +151,31 @@ class PatientUpdateSerializer(serializers.ModelSerializer):
             "phone_number",
             "date_of_birth",
         ]
+        extra_kwargs = {
+            "phone_number": {"validators": [validate_international_phonenumber]}
+        }
+
+    def validate_phone_number(self, value):
+        if self.instance is not None and self.instance.phone_number == value:
+            return value
+        patients = Patient.objects.filter(phone_number=value)
+        if self.instance is not None:
+            patients = patients.exclude(pk=self.instance.pk)
+        if patients.exists():
+            raise serializers.ValidationError(
+                "patient with this phone number already exists."
+            )
+        return value
 
 
-class AssessmentListSerializer(serializers.ModelSerializer):
+class AssessmentListSerializer(ModelSerializer):
     patient = serializers.ReadOnlyField(source="patient.full_name")
 
     class Meta:
         model = Assessment
         fields = [
             "id",
+            "patient_id",
             "patient",
             "assessment_type",
             "assessment_date",
@@ -110,7 +183,7 @@ class AssessmentListSerializer(serializers.ModelSerializer):
         ]
 
 
-class AssessmentCreateSerializer(serializers.ModelSerializer):
+class AssessmentCreateSerializer(ModelSerializer):
     clinician = serializers.HiddenField(default=serializers.CurrentUserDefault())
 
     class Meta:
@@ -123,7 +196,19 @@ class AssessmentCreateSerializer(serializers.ModelSerializer):
         ]
 
 
-class AssessmentDetailSerializer(serializers.ModelSerializer):
+class AssessmentIngestSerializer(AssessmentCreateSerializer):
+    """
+    Serializer for one line of an assessment ingestion. The patient is given by id,
+    its existence and ownership are checked by the view for a whole chunk at once.
+    """
+
+    patient = serializers.IntegerField(min_value=1)
+
+    class Meta(AssessmentCreateSerializer.Meta):
+        fields = AssessmentCreateSerializer.Meta.fields + ["patient"]
+
+
+class AssessmentDetailSerializer(ModelSerializer):
     class Meta:
         model = Assessment
         fields = [
@@ -131,3 +216,60 @@ class AssessmentDetailSerializer(serializers.ModelSerializer):
             "assessment_date",
             "final_score",
         ]
+
+
+class AssessmentSummarySerializer(ModelSerializer):
+    mean = serializers.DecimalField(max_digits=4, decimal_places=2, read_only=True)
+    stddev = serializers.DecimalField(max_digits=4, decimal_places=2, read_only=True)
+    min = serializers.DecimalField(
+        source="score_min", max_digits=3, decimal_places=1, read_only=True
+    )
+    max = serializers.DecimalField(
+        source="score_max", max_digits=3, decimal_places=1, read_only=True
+    )
+
+    class Meta:
+        model = AssessmentDailyRollup
+        fields = [
+            "day",
+            "assessment_type",
+            "count",
+            "mean",
+            "stddev",
+            "min",
+            "max",
+        ]
+
+
+class AuditEventSerializer(ModelSerializer):
+    class Meta:
+        model = AuditEvent
+        fields = [
+            "id",
+            "occurred_at",
+            "user_id",
+            "action",
+            "model",
+            "object_id",
+            "fields",
+            "ip_address",
+        ]
+
+
+class JobSerializer(ModelSerializer):
+    class Meta:
+        model = Job
+        fields = [
+            "id",
+            "name",
+            "status",
+            "priority",
+            "attempts",
+            "max_attempts",
+            "run_at",
+            "created_at",
+            "started_at",
+            "finished_at",
+            "result",
+            "error",
+        ]
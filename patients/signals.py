@@ -1,10 +1,120 @@
-from django.db.models.signals import post_delete
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
-from patients.models import Patient
+from patients import rollups
+from patients.audit import audit_log
+from patients.cache import invalidate_clinician
+from patients.models import Address, Assessment, AuditEvent, Patient
+from users.models import User
 
 
 @receiver(post_delete, sender=Patient)
 def delete_address(sender, instance, **kwargs):
     if instance.address:
         instance.address.delete()
+
+
+@receiver([post_save, post_delete], sender=Patient)
+@receiver([post_save, post_delete], sender=Assessment)
+def invalidate_cached_responses(sender, instance, **kwargs):
+    invalidate_clinician(instance.clinician_id)
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_save, sender=Assessment)
+def audit_save(
+    sender, instance, created=False, update_fields=None, raw=False, **kwargs
+):
+    if raw:
+        return
+    if created:
+        audit_log.record_changes(AuditEvent.Action.CREATE, [instance])
+    else:
+        audit_log.record_changes(AuditEvent.Action.UPDATE, [instance], update_fields)
+
+
+@receiver(post_delete, sender=Patient)
+@receiver(post_delete, sender=Assessment)
+def audit_delete(sender, instance, **kwargs):
+    audit_log.record_changes(AuditEvent.Action.DELETE, [instance])
+
+
+@receiver([post_save, pre_delete], sender=Address)
+def invalidate_cached_address_responses(sender, instance, created=False, **kwargs):
+    # A new address is saved before the patient that points to it.
+    if created:
+        return
+    try:
+        clinician_id = instance.patient.clinician_id
+    except Patient.DoesNotExist:
+        return
+    invalidate_clinician(clinician_id)
+
+
+@receiver(post_save, sender=Address)
+def audit_address_save(sender, instance, created=False, raw=False, **kwargs):
+    # An address is audited as part of its patient, a new one with the patient.
+    if created or raw:
+        return
+    try:
+        patient = instance.patient
+    except Patient.DoesNotExist:
+        return
+    audit_log.record_changes(AuditEvent.Action.UPDATE, [patient], ["address"])
+
+
+@receiver(pre_save, sender=Assessment)
+def remember_rollup_group(sender, instance, raw=False, **kwargs):
+    # An edit may move the assessment to another day or type, so the score has to
+    # come off the rollup it was counted in before.
+    instance._previous_rollup_group = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    previous = (
+        Assessment.objects.filter(pk=instance.pk)
+        .values_list(
+            "clinician_id", "assessment_type", "assessment_date", "final_score"
+        )
+        .first()
+    )
+    if previous is not None:
+        instance._previous_rollup_group = rollups.get_group(*previous)
+
+
+@receiver(post_save, sender=Assessment)
+def update_rollup(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_previous_rollup_group", None)
+    if previous is not None:
+        rollups.remove_score(*previous)
+    rollups.add_assessments([instance])
+
+
+@receiver(post_delete, sender=Assessment)
+def remove_from_rollup(sender, instance, origin=None, **kwargs):
+    # Assessments deleted along with their patient are handled per patient below, and
+    # the rollups of a deleted clinician go away with the clinician.
+    if getattr(origin, "model", type(origin)) is not Assessment:
+        return
+    rollups.remove_score(*rollups.get_assessment_group(instance))
+
+
+@receiver(pre_delete, sender=Patient)
+def remember_rollup_days(sender, instance, origin=None, **kwargs):
+    if getattr(origin, "model", type(origin)) is User:
+        return
+    instance._rollup_days = list(
+        Assessment.objects.filter(patient=instance)
+        .annotate(day=TruncDate("assessment_date"))
+        .values_list("day", flat=True)
+        .distinct()
+    )
+
+
+@receiver(post_delete, sender=Patient)
+def recompute_rollup_days(sender, instance, origin=None, **kwargs):
+    if getattr(origin, "model", type(origin)) is User:
+        return
+    rollups.recompute_days(instance.clinician_id, getattr(instance, "_rollup_days", []))
@@ -1,3 +1,3088 @@
-from django.test import TestCase
+import csv
+import itertools
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    DatabaseError,
+    connection,
+    connections,
+    transaction,
+)
+from django.db.models import CharField, Count, Max, Min, Sum, Value
+from django.db.models.functions import MD5, Cast, Concat, Left
+from django.db.models.signals import post_save, pre_save
+from django.test import LiveServerTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy
+from phonenumber_field.phonenumber import PhoneNumber
+from phonenumbers import region_code_for_number
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import (
+    APIClient,
+    APIRequestFactory,
+    APITestCase,
+    force_authenticate,
+)
+from rest_framework_simplejwt.tokens import AccessToken
+
+from healthtrack.metrics import (
+    CONTENT_TYPE,
+    MeasuredListSerializer,
+    RequestStats,
+    metrics,
+    request_stats,
+)
+from healthtrack.replicas import (
+    ReplicaRouter,
+    ReplicaRoutingMiddleware,
+    RequestRouting,
+    is_pinned,
+    pin_key,
+    replica_pool,
+    request_routing,
+)
+from patients import async_views, audit, jobs, partitions, rollups, views
+from patients.audit import audit_log
+from patients.cache import LRUCache, ResponseCache, response_cache
+from patients.models import (
+    Address,
+    Assessment,
+    AssessmentDailyRollup,
+    AuditEvent,
+    Job,
+    Patient,
+    years_before,
+)
+from patients.parsers import FastJSONParser
+from patients.renderers import FastJSONRenderer
+from patients.serializers import PatientListSerializer
+from users.authentication import user_cache
+from users.models import User
+
+
+def seed_clinicians(clinicians, patients_per_clinician, assessments_per_patient):
+    """
+    Bulk creates clinicians with their patients, addresses and assessments. Values
+    are spread deterministically so filters and orderings select realistic slices.
+    """
+    genders = [choice for choice, _ in Patient.Gender.choices]
+    types = [choice for choice, _ in Assessment.TYPES.choices]
+    now = timezone.now()
+
+    users = User.objects.bulk_create(
+        User(email=f"clinician{i}@healthtrack.com") for i in range(clinicians)
+    )
+    addresses = iter(
+        Address.objects.bulk_create(
+            Address(address_one=f"{i} Main Street", country="US", city="Springfield")
+            for i in range(clinicians * patients_per_clinician)
+        )
+    )
+    patients = Patient.objects.bulk_create(
+        Patient(
+            clinician=user,
+            address=next(addresses),
+            first_name=f"First{i}",
+            last_name=f"Last{i}",
+            gender=genders[i % len(genders)],
+            phone_number=f"+1415{c * patients_per_clinician + i:07d}",
+            date_of_birth=date(1940, 1, 1) + timedelta(days=(i * 37) % 25000),
+            created_at=now - timedelta(minutes=i * 17),
+        )
+        for c, user in enumerate(users)
+        for i in range(patients_per_clinician)
+    )
+    Assessment.objects.bulk_create(
+        Assessment(
+            clinician_id=patient.clinician_id,
+            patient=patient,
+            assessment_type=types[(patient.pk + i) % len(types)],
+            assessment_date=now - timedelta(days=(patient.pk * 7 + i * 31) % 1500),
+            final_score=Decimal(10 + (patient.pk + i * 13) % 91) / 10,
+        )
+        for patient in patients
+        for i in range(assessments_per_patient)
+    )
+    return users
+
+
+@contextmanager
+def frozen_today(day):
+    """
+    Makes date.today() return `day` in the modules that compute patient ages or
+    depend on them.
+    """
+
+    class FrozenDate(date):
+        @classmethod
+        def today(cls):
+            return day
+
+    with (
+        mock.patch("patients.cache.date", FrozenDate),
+        mock.patch("patients.conditional.date", FrozenDate),
+        mock.patch("patients.filters.date", FrozenDate),
+        mock.patch("patients.models.date", FrozenDate),
+    ):
+        yield
+
+
+def run_production_python(code, **env):
+    """
+    Runs `code` in a fresh interpreter with the production settings. Variables of
+    `env` that are None are removed from the environment.
+    """
+    env = {
+        **os.environ,
+        "DJANGO_SETTINGS_MODULE": "healthtrack.settings.production",
+        **env,
+    }
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        env={name: value for name, value in env.items() if value is not None},
+        cwd=settings.BASE_DIR,
+        capture_output=True,
+        text=True,
+    )
+
+
+def make_patient_payload(i):
+    return {
+        "first_name": f"New{i}",
+        "last_name": f"Patient{i}",
+        "address": {"address_one": f"{i} Side Street", "city": "Springfield"},
+        "gender": "female",
+        "phone_number": f"+1415{5000000 + i:07d}",
+        "date_of_birth": "1980-05-17",
+    }
+
+
+class QueryBudgetMixin:
+    """
+    Measures the SQL queries and wall time of API requests.
+
+    Every request is checked against the budget of its endpoint in `query_budgets`,
+    keyed "<url name> <method>". `assert_constant_queries` sends the request once per
+    data size and fails when the number of queries changes with the size, which is
+    how N+1 queries show up. The measurements are reported on stderr once the test
+    class is done.
+    """
+
+    sizes = [1, 10, 100]
+    query_budgets = {}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.measurements = []
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.report_measurements()
+        super().tearDownClass()
+
+    @classmethod
+    def report_measurements(cls):
+        if not cls.measurements:
+            return
+        lines = [
+            "",
+            f"{cls.__name__}: SQL queries and wall time per request",
+            f"{'endpoint':<42} {'size':>5} {'queries':>7} {'ms':>8}",
+        ]
+        for label, size, queries, elapsed in cls.measurements:
+            size = "-" if size is None else size
+            lines.append(f"{label:<42} {size:>5} {queries:>7} {elapsed:>8.1f}")
+        sys.stderr.write("\n".join(lines) + "\n")
+
+    def measure(self, label, send, size=None):
+        # Budgets hold for a cold user cache, every request pays for the user lookup.
+        user_cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = send()
+            if response.streaming:
+                content = b"".join(response.streaming_content)
+            else:
+                content = response.content
+            elapsed = (time.perf_counter() - start) * 1000
+        queries = len(context.captured_queries)
+        self.measurements.append((label, size, queries, elapsed))
+
+        self.assertLess(response.status_code, 400, f"{label} (size {size}): {content}")
+        self.assertLessEqual(
+            queries,
+            self.query_budgets[label],
+            f"{label} (size {size}) ran {queries} queries:\n"
+            + "\n".join(query["sql"] for query in context.captured_queries),
+        )
+        return queries
+
+    def assert_constant_queries(self, label, send, sizes=None, prepare=None):
+        """
+        Sends `send(size)` for every size, after calling `prepare(size)` outside of the
+        measurement if given.
+        """
+        counts = {}
+        for size in sizes or self.sizes:
+            if prepare is not None:
+                prepare(size)
+            counts[size] = self.measure(label, lambda: send(size), size)
+        self.assertEqual(
+            len(set(counts.values())),
+            1,
+            f"The number of queries of {label} grows with the size: {counts}",
+        )
+
+
+TRIGRAM_INDEXES = [
+    "patient_first_name_trgm_idx",
+    "patient_last_name_trgm_idx",
+    "patient_phone_number_trgm_idx",
+]
+
+
+def iter_plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from iter_plan_nodes(child)
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class ListQueryPlanTests(APITestCase):
+    """
+    Seeds a realistic volume of rows and runs EXPLAIN on every query the list endpoints
+    issue. None of them may fall back to a sequential scan of, or a sort over, a
+    patients table; the composite clinician indexes have to serve them.
+    """
+
+    clinicians = 20
+    patients_per_clinician = 1000
+    assessments_per_patient = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        users = seed_clinicians(
+            cls.clinicians, cls.patients_per_clinician, cls.assessments_per_patient
+        )
+        cls.clinician = users[0]
+        cls.patient = Patient.objects.filter(clinician=cls.clinician).first()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def setUp(self):
+        self.client.force_authenticate(self.clinician)
+
+    def assert_plans_use_indexes(self, url, indexes=(), sort=False):
+        """
+        Asserts the queries of `url` scan no patients table sequentially and, unless
+        `sort`, do not sort. With `indexes`, one of them has to be used.
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+
+        queries = [
+            query["sql"]
+            for query in context.captured_queries
+            if "patients_" in query["sql"] and query["sql"].startswith("SELECT")
+        ]
+        self.assertTrue(queries, url)
+        for sql in queries:
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            nodes = list(iter_plan_nodes(plan[0]["Plan"]))
+            for node in nodes:
+                with self.subTest(url=url, sql=sql):
+                    self.assertFalse(
+                        node["Node Type"] == "Seq Scan"
+                        and node["Relation Name"].startswith("patients_"),
+                        f"Sequential scan on {node.get('Relation Name')}",
+                    )
+                    if not sort:
+                        self.assertNotIn(
+                            node["Node Type"], ["Sort", "Incremental Sort"]
+                        )
+            if indexes:
+                used = {node.get("Index Name") for node in nodes}
+                self.assertTrue(used & set(indexes), f"{url} used {used}")
+
+    def test_patient_list_plans(self):
+        url = reverse("patient-list")
+        for query in [
+            "",
+            "?gender=female",
+            "?ordering=-created_at",
+            "?ordering=date_of_birth",
+            "?gender=male&ordering=-created_at",
+            "?ordering=age",
+            "?min_age=30&max_age=40&ordering=-age",
+            "?pagination=cursor",
+            "?pagination=cursor&ordering=date_of_birth",
+        ]:
+            self.assert_plans_use_indexes(url + query)
+
+    def test_patient_suggest_plans(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT lanname FROM pg_proc JOIN pg_language l ON l.oid = prolang "
+                "WHERE proname = 'similarity_op'"
+            )
+            if cursor.fetchone()[0] != "c":
+                self.skipTest("The pg_trgm % operator is not indexable in this build.")
+        # One clinician owns every patient, so the clinician index can't narrow the
+        # search down. The seeded names share most trigrams; hashes make them distinct.
+        Patient.objects.update(
+            clinician=self.clinician,
+            first_name=Left(MD5(Concat(Value("first"), Cast("id", CharField()))), 8),
+            last_name=Left(MD5(Concat(Value("last"), Cast("id", CharField()))), 10),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE patients_patient")
+        patient = Patient.objects.get(pk=self.patient.pk)
+        url = reverse("patient-suggest")
+        for query in [
+            patient.first_name[:4],
+            patient.last_name,
+            f"{patient.first_name} {patient.last_name[:2]}",
+            str(patient.phone_number)[-4:],
+        ]:
+            self.assert_plans_use_indexes(
+                f"{url}?q={query}", indexes=TRIGRAM_INDEXES, sort=True
+            )
+
+    def test_assessment_list_plans(self):
+        url = reverse("assessment-list")
+        for query in [
+            "",
+            "?ordering=-assessment_date",
+            "?ordering=-final_score",
+            "?assessment_type=mental&ordering=-assessment_date",
+            "?assessment_date_after=2024-01-01&assessment_date_before=2024-03-01"
+            "&ordering=-assessment_date",
+            f"?patient={self.patient.pk}&ordering=-assessment_date",
+            "?pagination=cursor",
+            "?pagination=cursor&ordering=final_score",
+        ]:
+            self.assert_plans_use_indexes(url + query)
+
+    def test_patient_assessment_list_plans(self):
+        url = reverse("patient-assessment-list", args=[self.patient.pk])
+        for query in [
+            "",
+            "?ordering=-assessment_date",
+            "?pagination=cursor",
+        ]:
+            self.assert_plans_use_indexes(url + query)
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class EndpointQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """
+    Sends a request to every route of patients/urls.py, authenticated with a real
+    access token, and holds each to its query budget. List endpoints are requested at
+    growing page sizes, writes with growing batches, and patient deletion for patients
+    with growing numbers of assessments.
+    """
+
+    query_budgets = {
+        "patient-list GET": 3,
+        "patient-list POST": 4,
+        "patient-bulk-create POST": 6,
+        "patient-suggest GET": 2,
+        "patient-detail GET": 2,
+        "patient-detail PATCH": 5,
+        "patient-detail DELETE": 14,
+        "patient-assessment-list GET": 3,
+        "patient-assessment-detail GET": 2,
+        "patient-assessment-detail PATCH": 12,
+        "patient-assessment-detail DELETE": 10,
+        "patient-assessment-create POST": 3,
+        "assessment-list GET": 3,
+        "assessment-export GET": 2,
+        "assessment-ingest POST": 6,
+        "assessment-summary GET": 2,
+        "assessment-detail GET": 2,
+        "assessment-detail PATCH": 12,
+        "assessment-detail DELETE": 10,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        users = seed_clinicians(2, 150, 3)
+        cls.clinician = users[0]
+
+        # One patient per size with exactly that many assessments.
+        patients = Patient.objects.filter(clinician=cls.clinician).order_by("pk")
+        cls.patients = dict(zip(cls.sizes, patients))
+        Assessment.objects.filter(patient__in=cls.patients.values()).delete()
+        now = timezone.now()
+        Assessment.objects.bulk_create(
+            Assessment(
+                clinician=cls.clinician,
+                patient=patient,
+                assessment_type="physical",
+                assessment_date=now - timedelta(days=i),
+                final_score=Decimal(10 + i % 91) / 10,
+            )
+            for size, patient in cls.patients.items()
+            for i in range(size)
+        )
+        rollups.rebuild()
+        cls.patient = cls.patients[10]
+        cls.assessment = Assessment.objects.filter(patient=cls.patient).first()
+
+    def setUp(self):
+        token = AccessToken.for_user(self.clinician)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_list_endpoints(self):
+        big_patient = self.patients[100]
+        for label, url in [
+            ("patient-list GET", reverse("patient-list")),
+            ("patient-list GET", reverse("patient-list") + "?pagination=cursor"),
+            ("assessment-list GET", reverse("assessment-list")),
+            ("assessment-list GET", reverse("assessment-list") + "?pagination=cursor"),
+            (
+                "patient-assessment-list GET",
+                reverse("patient-assessment-list", args=[big_patient.pk]),
+            ),
+        ]:
+            separator = "&" if "?" in url else "?"
+            self.assert_constant_queries(
+                label,
+                lambda size: self.client.get(f"{url}{separator}page_size={size}"),
+            )
+
+    def test_suggest(self):
+        url = reverse("patient-suggest")
+        self.assert_constant_queries(
+            "patient-suggest GET",
+            lambda size: self.client.get(url, {"q": "Fir", "limit": size}),
+            sizes=[1, 10, 25],
+        )
+
+    def test_export_and_summary(self):
+        today = timezone.localdate()
+        for label, field, params in [
+            ("assessment-export GET", "assessment_date", {"format": "csv"}),
+            ("assessment-export GET", "assessment_date", {"format": "ndjson"}),
+            ("assessment-summary GET", "day", {}),
+        ]:
+            url = reverse(label.split()[0])
+            self.assert_constant_queries(
+                label,
+                lambda size: self.client.get(
+                    url, {**params, f"{field}_after": today - timedelta(days=size)}
+                ),
+            )
+
+    def test_bulk_writes(self):
+        url = reverse("patient-bulk-create")
+        self.assert_constant_queries(
+            "patient-bulk-create POST",
+            lambda size: self.client.post(
+                url,
+                [make_patient_payload(size * 1000 + i) for i in range(size)],
+                format="json",
+            ),
+        )
+
+        url = reverse("assessment-ingest")
+        lines = (
+            json.dumps(
+                {
+                    "patient": self.patient.pk,
+                    "assessment_type": "mental",
+                    "final_score": str(Decimal(10 + i % 91) / 10),
+                }
+            )
+            for i in itertools.count()
+        )
+        self.assert_constant_queries(
+            "assessment-ingest POST",
+            lambda size: self.client.post(
+                url,
+                "\n".join(itertools.islice(lines, size)),
+                content_type="application/x-ndjson",
+            ),
+        )
+
+    def test_patient_delete(self):
+        self.assert_constant_queries(
+            "patient-detail DELETE",
+            lambda size: self.client.delete(
+                reverse("patient-detail", args=[self.patients[size].pk])
+            ),
+        )
+
+    def test_single_object_endpoints(self):
+        patient_url = reverse("patient-detail", args=[self.patient.pk])
+        patient_assessment_url = reverse(
+            "patient-assessment-detail", args=[self.patient.pk, self.assessment.pk]
+        )
+        assessment_url = reverse("assessment-detail", args=[self.assessment.pk])
+        assessment = {"assessment_type": "cognitive", "final_score": "5.5"}
+
+        for label, send in [
+            (
+                "patient-list POST",
+                lambda: self.client.post(
+                    reverse("patient-list"), make_patient_payload(1), format="json"
+                ),
+            ),
+            ("patient-detail GET", lambda: self.client.get(patient_url)),
+            (
+                "patient-detail PATCH",
+                lambda: self.client.patch(
+                    patient_url, {"first_name": "Renamed"}, format="json"
+                ),
+            ),
+            (
+                "patient-assessment-create POST",
+                lambda: self.client.post(
+                    reverse("patient-assessment-create", args=[self.patient.pk]),
+                    assessment,
+                    format="json",
+                ),
+            ),
+            (
+                "patient-assessment-detail GET",
+                lambda: self.client.get(patient_assessment_url),
+            ),
+            (
+                "patient-assessment-detail PATCH",
+                lambda: self.client.patch(
+                    patient_assessment_url, {"final_score": "7.5"}, format="json"
+                ),
+            ),
+            ("assessment-detail GET", lambda: self.client.get(assessment_url)),
+            (
+                "assessment-detail PATCH",
+                lambda: self.client.patch(
+                    assessment_url, {"final_score": "2.5"}, format="json"
+                ),
+            ),
+            ("assessment-detail DELETE", lambda: self.client.delete(assessment_url)),
+        ]:
+            self.measure(label, send)
+
+        other = Assessment.objects.filter(patient=self.patient).first()
+        self.measure(
+            "patient-assessment-detail DELETE",
+            lambda: self.client.delete(
+                reverse("patient-assessment-detail", args=[self.patient.pk, other.pk])
+            ),
+        )
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class WritePathTests(APITestCase):
+    """
+    Patient updates only write the columns that change and assessments are created
+    with one statement that also checks the patient belongs to the clinician.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinician, cls.other = seed_clinicians(2, 2, 1)
+        cls.patient, cls.second = Patient.objects.filter(
+            clinician=cls.clinician
+        ).order_by("pk")
+        cls.patient.phone_number = "+14155000999"
+        cls.patient.save()
+        cls.second.phone_number = "+14155000998"
+        cls.second.save()
+        cls.foreign = Patient.objects.filter(clinician=cls.other).first()
+
+    def setUp(self):
+        self.client.force_authenticate(self.clinician)
+
+    def patch(self, data, queries):
+        url = reverse("patient-detail", args=[self.patient.pk])
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(url, data, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        statements = [query["sql"].split()[0] for query in context.captured_queries]
+        self.assertEqual(statements, queries)
+        return response
+
+    def test_update_writes_changed_columns(self):
+        read = ["SAVEPOINT", "SELECT"]
+        self.patch({"first_name": "Renamed"}, read + ["UPDATE", "RELEASE"])
+        self.patch({"first_name": "Renamed"}, read + ["RELEASE"])
+        # The address is part of the patient, whose updated_at moves with it.
+        updated_at = Patient.objects.get(pk=self.patient.pk).updated_at
+        self.patch(
+            {"address": {"city": "Shelbyville"}}, read + ["UPDATE", "UPDATE", "RELEASE"]
+        )
+        self.assertGreater(
+            Patient.objects.get(pk=self.patient.pk).updated_at, updated_at
+        )
+        self.patch({"address": {"city": "Shelbyville"}}, read + ["RELEASE"])
+        # The phone number is only checked for uniqueness when it changes.
+        phone_number = str(self.patient.phone_number)
+        self.patch({"phone_number": phone_number}, read + ["RELEASE"])
+        self.patch(
+            {"phone_number": "+14155550199"}, read + ["SELECT", "UPDATE", "RELEASE"]
+        )
+
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.first_name, "Renamed")
+        self.assertEqual(self.patient.address.city, "Shelbyville")
+        self.assertEqual(self.patient.phone_number, "+14155550199")
+
+    def test_address_update_changes_validators(self):
+        url = reverse("patient-detail", args=[self.patient.pk])
+        etag = self.client.get(url)["ETag"]
+        response = self.client.patch(
+            url, {"address": {"city": "Shelbyville"}}, format="json"
+        )
+        self.assertNotEqual(response["ETag"], etag)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["address"]["city"], "Shelbyville")
+        response = self.client.patch(
+            url,
+            {"address": {"city": "Ogdenville"}},
+            format="json",
+            HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 412)
+
+    def test_update_rejects_invalid_phone_number(self):
+        response = self.client.patch(
+            reverse("patient-detail", args=[self.patient.pk]),
+            {"phone_number": "+14150000000"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("phone_number", response.data)
+
+    def test_update_rejects_taken_phone_number(self):
+        response = self.client.patch(
+            reverse("patient-detail", args=[self.patient.pk]),
+            {"phone_number": str(self.second.phone_number)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("phone_number", response.data)
+
+    def test_create_assessment(self):
+        url = reverse("patient-assessment-create", args=[self.patient.pk])
+        data = {"assessment_type": "mental", "final_score": "5.5"}
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(context.captured_queries), 2)
+
+        assessment = Assessment.objects.latest("pk")
+        self.assertEqual(assessment.patient, self.patient)
+        self.assertEqual(assessment.clinician, self.clinician)
+        self.assertEqual(assessment.final_score, Decimal("5.5"))
+        self.assertEqual(response.data["final_score"], "5.5")
+
+    def test_other_clinicians_patient_is_not_found(self):
+        for pk in [self.foreign.pk, 0]:
+            url = reverse("patient-detail", args=[pk])
+            for method, headers in [
+                (self.client.get, {}),
+                (self.client.get, {"HTTP_IF_NONE_MATCH": '"etag"'}),
+                (self.client.patch, {}),
+                (self.client.delete, {"HTTP_IF_MATCH": '"etag"'}),
+            ]:
+                with self.subTest(pk=pk, method=method.__name__, headers=headers):
+                    with CaptureQueriesContext(connection) as context:
+                        response = method(url, **headers)
+                    self.assertEqual(response.status_code, 404)
+                    self.assertEqual(str(response.data["detail"]), "Patient not found.")
+                    # Not counting the savepoints of the writes.
+                    queries = [
+                        query
+                        for query in context.captured_queries
+                        if "patients_patient" in query["sql"]
+                    ]
+                    self.assertEqual(len(queries), 1)
+        self.assertTrue(Patient.objects.filter(pk=self.foreign.pk).exists())
+
+    def test_create_assessment_sends_save_signals(self):
+        received = []
+
+        def receiver(signal, instance, **kwargs):
+            received.append((signal, instance.pk))
+
+        pre_save.connect(receiver, sender=Assessment)
+        post_save.connect(receiver, sender=Assessment)
+        try:
+            assessment = Assessment.objects.create_for_patient(
+                self.clinician, self.patient.pk, assessment_type="mental", final_score=5
+            )
+        finally:
+            pre_save.disconnect(receiver, sender=Assessment)
+            post_save.disconnect(receiver, sender=Assessment)
+        self.assertEqual(received, [(pre_save, None), (post_save, assessment.pk)])
+
+    def test_create_assessment_for_other_clinicians_patient(self):
+        count = Assessment.objects.count()
+        for pk in [self.foreign.pk, 0]:
+            response = self.client.post(
+                reverse("patient-assessment-create", args=[pk]),
+                {"assessment_type": "mental", "final_score": "5.5"},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 404)
+        self.assertEqual(Assessment.objects.count(), count)
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class PatientSearchTests(APITestCase):
+    """
+    The search parameter of the patient list matches whole names in the stored
+    search vector and lists the best matches first.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinician, cls.other = seed_clinicians(2, 0, 0)
+        now = timezone.now()
+        names = [
+            (cls.clinician, "Ann", "Lee"),
+            (cls.clinician, "Lee", "Lee"),
+            (cls.clinician, "Ann", "Smith"),
+            (cls.clinician, "Leeroy", "Jones"),
+            (cls.other, "Lee", "Other"),
+        ]
+        cls.patients = {
+            f"{first} {last}": Patient.objects.create(
+                clinician=clinician,
+                first_name=first,
+                last_name=last,
+                phone_number=f"+1415666{i:04d}",
+                date_of_birth=date(1980, 1, 1),
+                created_at=now - timedelta(minutes=i),
+            )
+            for i, (clinician, first, last) in enumerate(names)
+        }
+
+    def setUp(self):
+        self.client.force_authenticate(self.clinician)
+
+    def search(self, query):
+        response = self.client.get(reverse("patient-list"), {"search": query})
+        self.assertEqual(response.status_code, 200)
+        return [
+            f"{patient['first_name']} {patient['last_name']}"
+            for patient in response.data["results"]
+        ]
+
+    def test_matches_whole_names_of_own_patients(self):
+        self.assertEqual(self.search("ann"), ["Ann Lee", "Ann Smith"])
+        self.assertEqual(self.search("SMITH"), ["Ann Smith"])
+        self.assertEqual(self.search("ann lee"), ["Ann Lee"])
+        self.assertEqual(self.search("nobody"), [])
+
+    def test_best_matches_first(self):
+        # Ties keep the newest patient first.
+        self.assertEqual(self.search("lee"), ["Lee Lee", "Ann Lee"])
+
+    def test_follows_renames(self):
+        patient = self.patients["Ann Smith"]
+        response = self.client.patch(
+            reverse("patient-detail", args=[patient.pk]),
+            {"last_name": "Lee"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.search("smith"), [])
+        self.assertEqual(self.search("lee"), ["Lee Lee", "Ann Lee", "Ann Lee"])
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class PatientAgeTests(APITestCase):
+    """
+    Ages are whole years on today's date. The age filters include both bounds and
+    the age ordering follows the date of birth.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinician = seed_clinicians(1, 0, 0)[0]
+        births = [
+            ("Before", date(1994, 6, 14)),
+            ("Today", date(1994, 6, 15)),
+            ("After", date(1994, 6, 16)),
+            ("Leap", date(2000, 2, 29)),
+        ]
+        for i, (name, date_of_birth) in enumerate(births):
+            Patient.objects.create(
+                clinician=cls.clinician,
+                first_name=name,
+                last_name="Age",
+                phone_number=f"+1415777{i:04d}",
+                date_of_birth=date_of_birth,
+            )
+
+    def setUp(self):
+        self.client.force_authenticate(self.clinician)
+
+    def ages(self, today, **params):
+        with frozen_today(today):
+            response = self.client.get(reverse("patient-list"), params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return {
+            patient["first_name"]: patient["age"]
+            for patient in response.data["results"]
+        }
+
+    def test_birthdays(self):
+        self.assertEqual(
+            self.ages(date(2024, 6, 15)),
+            {"Before": 30, "Today": 30, "After": 29, "Leap": 24},
+        )
+
+    def test_age_bounds_are_inclusive(self):
+        today = date(2024, 6, 15)
+        self.assertEqual(self.ages(today, min_age=30), {"Before": 30, "Today": 30})
+        self.assertEqual(self.ages(today, min_age=29, max_age=29), {"After": 29})
+        self.assertEqual(
+            self.ages(today, max_age=30),
+            {"Before": 30, "Today": 30, "After": 29, "Leap": 24},
+        )
+        self.assertEqual(self.ages(today, min_age=31), {})
+
+    def test_leap_day_birthday(self):
+        # Born on February 29th, the age is reached on March 1st in common years.
+        self.assertEqual(self.ages(date(2025, 2, 28), min_age=24)["Leap"], 24)
+        self.assertNotIn("Leap", self.ages(date(2025, 2, 28), min_age=25))
+        self.assertEqual(self.ages(date(2025, 3, 1), min_age=25)["Leap"], 25)
+        self.assertEqual(self.ages(date(2028, 2, 29), max_age=28)["Leap"], 28)
+
+    def test_out_of_range_ages(self):
+        for params in [{"min_age": 5000}, {"max_age": 151}, {"min_age": -1}]:
+            response = self.client.get(reverse("patient-list"), params)
+            self.assertEqual(response.status_code, 400, params)
+        self.assertEqual(self.ages(date(2024, 6, 15), min_age=150), {})
+
+    def test_ordering_by_age(self):
+        today = date(2024, 6, 15)
+        self.assertEqual(
+            list(self.ages(today, ordering="age")), ["Leap", "After", "Today", "Before"]
+        )
+        self.assertEqual(
+            list(self.ages(today, ordering="-age")),
+            ["Before", "Today", "After", "Leap"],
+        )
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class PatientSuggestTests(APITestCase):
+    """
+    Suggestions match name prefixes, similar names and phone number digits, with the
+    closest names first.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinician, cls.other = seed_clinicians(2, 0, 0)
+        names = [
+            (cls.clinician, "Jonathan", "Smith", "+14155550123"),
+            (cls.clinician, "Joanna", "Smyth", "+14155550456"),
+            (cls.clinician, "Mary", "Jones", "+14155550789"),
+            (cls.clinician, "Peter", "Brown", "+14155559999"),
+            (cls.other, "Joe", "Other", "+14155550124"),
+        ]
+        for clinician, first, last, phone_number in names:
+            Patient.objects.create(
+                clinician=clinician,
+                first_name=first,
+                last_name=last,
+                phone_number=phone_number,
+                date_of_birth=date(1980, 1, 1),
+            )
+
+    def setUp(self):
+        self.client.force_authenticate(self.clinician)
+
+    def suggest(self, query, **params):
+        response = self.client.get(reverse("patient-suggest"), {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [
+            f"{patient['first_name']} {patient['last_name']}"
+            for patient in response.data
+        ]
+
+    def test_matches_name_prefixes(self):
+        self.assertCountEqual(
+            self.suggest("jo"), ["Jonathan Smith", "Joanna Smyth", "Mary Jones"]
+        )
+        self.assertEqual(self.suggest("BRO"), ["Peter Brown"])
+
+    def test_matches_similar_names_closest_first(self):
+        self.assertEqual(self.suggest("Jonathon"), ["Jonathan Smith"])
+        self.assertEqual(self.suggest("smyth"), ["Joanna Smyth", "Jonathan Smith"])
+
+    def test_every_term_has_to_match(self):
+        self.assertEqual(self.suggest("jo jones"), ["Mary Jones"])
+        self.assertEqual(self.suggest("peter smith"), [])
+
+    def test_matches_phone_number_digits(self):
+        self.assertEqual(self.suggest("555-0123"), ["Jonathan Smith"])
+        self.assertCountEqual(
+            self.suggest("5550"), ["Jonathan Smith", "Joanna Smyth", "Mary Jones"]
+        )
+
+    def test_short_queries_and_limit(self):
+        self.assertEqual(self.suggest("j"), [])
+        self.assertEqual(self.suggest(""), [])
+        self.assertEqual(len(self.suggest("jo", limit=2)), 2)
+        self.assertEqual(len(self.suggest("jo", limit="many")), 3)
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class CursorPaginationTests(APITestCase):
+    """
+    Following the cursor links visits every row once, in order, also across rows
+    with the same value of the ordering field.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        (cls.clinician,) = seed_clinicians(1, 9, 0)
+        patients = list(Patient.objects.order_by("pk"))
+        now = timezone.now()
+        for i, patient in enumerate(patients):
+            # Groups of three patients share a date of birth and a creation time.
+            patient.date_of_birth = date(1980, 1, 1) + timedelta(days=i // 3)
+            patient.created_at = now - timedelta(minutes=i // 3)
+        Patient.objects.bulk_update(patients, ["date_of_birth", "created_at"])
+
+    def setUp(self):
+        self.client.force_authenticate(self.clinician)
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def walk(self, url, link, **params):
+        pages = []
+        data = self.get(url, **params)
+        while True:
+            pages.append([patient["id"] for patient in data["results"]])
+            if not data[link]:
+                return pages
+            data = self.get(data[link])
+
+    def test_pages_in_order(self):
+        url = reverse("patient-list")
+        for ordering, expected in [
+            (None, ["-created_at", "-pk"]),
+            ("date_of_birth", ["date_of_birth", "pk"]),
+            ("-date_of_birth", ["-date_of_birth", "-pk"]),
+            ("age", ["-date_of_birth", "-pk"]),
+        ]:
+            with self.subTest(ordering=ordering):
+                params = {"pagination": "cursor", "page_size": 2}
+                if ordering:
+                    params["ordering"] = ordering
+                pages = self.walk(url, "next", **params)
+                ids = list(
+                    Patient.objects.order_by(*expected).values_list("pk", flat=True)
+                )
+                self.assertEqual([len(page) for page in pages], [2, 2, 2, 2, 1])
+                self.assertEqual(sum(pages, []), ids)
+
+    def test_previous_links_return_the_same_pages(self):
+        url = reverse("patient-list")
+        pages = self.walk(url, "next", pagination="cursor", page_size=2)
+        data = self.get(url, pagination="cursor", page_size=2)
+        self.assertIsNone(data["previous"])
+        while data["next"]:
+            data = self.get(data["next"])
+        backwards = [[patient["id"] for patient in data["results"]]]
+        while data["previous"]:
+            data = self.get(data["previous"])
+            backwards.append([patient["id"] for patient in data["results"]])
+        self.assertEqual(backwards[::-1], pages)
+
+    def test_rows_added_before_the_cursor_do_not_shift_pages(self):
+        url = reverse("patient-list")
+        first = self.get(url, pagination="cursor", page_size=3)
+        self.client.post(url, make_patient_payload(1), format="json")
+        second = self.get(first["next"])
+        seen = [patient["id"] for patient in first["results"] + second["results"]]
+        self.assertEqual(
+            seen,
+            list(
+                Patient.objects.filter(first_name__startswith="First")
+                .order_by("-created_at", "-pk")
+                .values_list("pk", flat=True)[:6]
+            ),
+        )
+
+    def test_invalid_cursors(self):
+        url = reverse("patient-list")
+        cursor = self.get(url, pagination="cursor", page_size=2)["next"]
+        token = cursor.split("cursor=")[1]
+        for params in [
+            {"cursor": "garbage"},
+            # A cursor only applies to the ordering it was issued for.
+            {"cursor": token, "ordering": "date_of_birth"},
+        ]:
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 404)
+
+
+class ResponseCacheTests(APITestCase):
+    """
+    Cached list responses are served until the clinician's data changes, by a write
+    in this or any other worker process.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinician, cls.other = seed_clinicians(2, 3, 1)
+
+    def setUp(self):
+        cache.clear()
+        response_cache.local.clear()
+        self.client.force_authenticate(self.clinician)
+
+    def list_patients(self, cache_status):
+        response = self.client.get(reverse("patient-list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Cache"], cache_status)
+        return response.data
+
+    def test_writes_invalidate_cached_lists(self):
+        data = self.list_patients("MISS")
+        self.assertEqual(self.list_patients("HIT"), data)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("patient-list"), make_patient_payload(1), format="json"
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        data = self.list_patients("MISS")
+        self.assertEqual(data["count"], 4)
+
+        patient = data["results"][0]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse("patient-detail", args=[patient["id"]]),
+                {"first_name": "Renamed"},
+                format="json",
+            )
+        for cache_status in ["MISS", "HIT"]:
+            names = {
+                result["id"]: result["first_name"]
+                for result in self.list_patients(cache_status)["results"]
+            }
+            self.assertEqual(names[patient["id"]], "Renamed")
+
+    def test_writes_of_other_clinicians_keep_the_cache(self):
+        self.list_patients("MISS")
+        patient = Patient.objects.filter(clinician=self.other).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.first_name = "Renamed"
+            patient.save()
+        self.list_patients("HIT")
+
+    def test_writes_of_other_processes_invalidate_cached_lists(self):
+        self.list_patients("MISS")
+        self.list_patients("HIT")
+        # Another worker process has its own ResponseCache on the same shared cache.
+        ResponseCache().bump_version(self.clinician.pk)
+        self.list_patients("MISS")
+
+    def test_async_views(self):
+        factory = APIRequestFactory(SERVER_NAME="localhost")
+        token = AccessToken.for_user(self.clinician)
+        view = async_views.PatientListCreateAPIView.as_view()
+
+        def send(**headers):
+            request = factory.get(
+                reverse("patient-list"), HTTP_AUTHORIZATION=f"Bearer {token}", **headers
+            )
+            return async_to_sync(view)(request)
+
+        response = send()
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(send()["X-Cache"], "HIT")
+        self.assertEqual(send(HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        ResponseCache().bump_version(self.clinician.pk)
+        response = send(HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Cache"], "MISS")
+
+    def test_local_entries_expire(self):
+        local = LRUCache(maxsize=10, timeout=30)
+        with mock.patch("patients.cache.time.monotonic", return_value=100):
+            local.set("key", "value")
+        with mock.patch("patients.cache.time.monotonic", return_value=129):
+            self.assertEqual(local.get("key"), "value")
+        with mock.patch("patients.cache.time.monotonic", return_value=130):
+            self.assertIsNone(local.get("key"))
+        self.assertEqual(local.stats()["size"], 0)
+
+    def test_process_local_cache_refused(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "RESPONSE_CACHE"):
+            with override_settings(SINGLE_PROCESS=False):
+                pass
+        with self.assertRaisesMessage(ImproperlyConfigured, "queries the database"):
+            with override_settings(
+                CACHES={
+                    "default": {
+                        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+                        "LOCATION": "django_cache",
+                    }
+                }
+            ):
+                pass
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(
+                CACHES={
+                    "default": {
+                        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                        "LOCATION": directory,
+                    }
+                },
+                SINGLE_PROCESS=False,
+            ):
+                self.list_patients("MISS")
+                self.list_patients("HIT")
+
+
+class ConditionalRequestTests(APITestCase):
+    """
+    ETags and Last-Modified dates answer conditional reads with 304 and refuse
+    writes based on an outdated copy with 412.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinician = seed_clinicians(1, 2, 1)[0]
+        cls.patient = Patient.objects.filter(clinician=cls.clinician).first()
+        cls.assessment = Assessment.objects.filter(patient=cls.patient).first()
+
+    def setUp(self):
+        cache.clear()
+        response_cache.local.clear()
+        self.client.force_authenticate(self.clinician)
+
+    def test_detail_read(self):
+        url = reverse("patient-detail", args=[self.patient.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+        self.client.patch(url, {"first_name": "Renamed"}, format="json")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["first_name"], "Renamed")
+
+    def test_detail_write(self):
+        url = reverse("patient-detail", args=[self.patient.pk])
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.patch(
+            url, {"first_name": "First"}, format="json", HTTP_IF_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        new_etag = response["ETag"]
+        self.assertNotEqual(new_etag, etag)
+
+        # A second client still holding the first ETag would overwrite the change.
+        for method, headers in [
+            (self.client.patch, {"HTTP_IF_MATCH": etag}),
+            (self.client.put, {"HTTP_IF_MATCH": etag}),
+            (self.client.delete, {"HTTP_IF_MATCH": etag}),
+            (self.client.patch, {"HTTP_IF_UNMODIFIED_SINCE": http_date(10**9)}),
+        ]:
+            with self.subTest(method=method.__name__, headers=headers):
+                response = method(
+                    url, {"first_name": "Second"}, format="json", **headers
+                )
+                self.assertEqual(response.status_code, 412)
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.first_name, "First")
+
+        response = self.client.delete(url, HTTP_IF_MATCH=new_etag)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Patient.objects.filter(pk=self.patient.pk).exists())
+
+    def test_nested_detail(self):
+        url = reverse(
+            "patient-assessment-detail", args=[self.patient.pk, self.assessment.pk]
+        )
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        other_patient = Patient.objects.exclude(pk=self.patient.pk).first()
+        response = self.client.get(
+            reverse(
+                "patient-assessment-detail",
+                args=[other_patient.pk, self.assessment.pk],
+            ),
+            HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_ages_change_with_the_date(self):
+        # Days ahead of the data version, so Last-Modified moves on with them.
+        birthday = date.today() + timedelta(days=2)
+        Patient.objects.filter(pk=self.patient.pk).update(
+            date_of_birth=years_before(birthday, 30)
+        )
+        detail_url = reverse("patient-detail", args=[self.patient.pk])
+        list_url = reverse("patient-list")
+
+        def get_age(url, **headers):
+            response = self.client.get(url, **headers)
+            if response.status_code != 200:
+                return response, None
+            if url == detail_url:
+                return response, response.data["age"]
+            ages = {row["id"]: row["age"] for row in response.data["results"]}
+            return response, ages[self.patient.pk]
+
+        with frozen_today(birthday - timedelta(days=1)):
+            responses = {url: get_age(url) for url in [detail_url, list_url]}
+            for url, (response, age) in responses.items():
+                self.assertEqual(age, 29)
+                response, _ = get_age(url, HTTP_IF_NONE_MATCH=response["ETag"])
+                self.assertEqual(response.status_code, 304)
+
+        with frozen_today(birthday):
+            for url, (response, _) in responses.items():
+                for headers in [
+                    {"HTTP_IF_NONE_MATCH": response["ETag"]},
+                    {"HTTP_IF_MODIFIED_SINCE": response["Last-Modified"]},
+                ]:
+                    with self.subTest(url=url, headers=headers):
+                        new_response, age = get_age(url, **headers)
+                        self.assertEqual(new_response.status_code, 200)
+                        self.assertEqual(age, 30)
+
+    def test_list(self):
+        url = reverse("assessment-list")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Other parameters are another list.
+        response = self.client.get(url, {"ordering": "final_score"})
+        self.assertEqual(response.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("patient-assessment-create", args=[self.patient.pk]),
+                {"assessment_type": "mental", "final_score": "5.5"},
+                format="json",
+            )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["count"], 3)
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class BulkCreateTests(APITestCase):
+    """
+    Bulk creation inserts the valid patients and reports the errors of the others by
+    their position in the request.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinician = seed_clinicians(1, 1, 0)[0]
+        cls.existing = Patient.objects.get()
+
+    def setUp(self):
+        self.client.force_authenticate(self.clinician)
+
+    def post(self, data, status_code):
+        response = self.client.post(reverse("patient-bulk-create"), data, format="json")
+        self.assertEqual(response.status_code, status_code, response.data)
+        return response.data
+
+    def test_creates_all(self):
+        data = self.post([make_patient_payload(i) for i in range(3)], 201)
+        self.assertEqual(data["errors"], [])
+        self.assertEqual([item["index"] for item in data["created"]], [0, 1, 2])
+        for i, item in enumerate(data["created"]):
+            patient = Patient.objects.select_related("address").get(pk=item["id"])
+            self.assertEqual(patient.clinician, self.clinician)
+            self.assertEqual(patient.first_name, f"New{i}")
+            self.assertEqual(patient.address.address_one, f"{i} Side Street")
+
+    def test_reports_per_item_errors(self):
+        items = [make_patient_payload(i) for i in range(7)]
+        del items[1]["first_name"]
+        items[2]["phone_number"] = "not a number"
+        items[3]["phone_number"] = str(self.existing.phone_number)
+        items[4]["phone_number"] = items[0]["phone_number"]
+        items[5]["gender"] = "unknown"
+        count = Patient.objects.count()
+
+        data = self.post(items, 207)
+        self.assertEqual([item["index"] for item in data["created"]], [0, 6])
+        errors = {item["index"]: item["errors"] for item in data["errors"]}
+        self.assertEqual(list(errors), [1, 2, 3, 4, 5])
+        self.assertIn("first_name", errors[1])
+        self.assertIn("phone_number", errors[2])
+        self.assertIn("phone_number", errors[3])
+        self.assertIn("phone_number", errors[4])
+        self.assertIn("gender", errors[5])
+        self.assertEqual(Patient.objects.count(), count + 2)
+
+    def test_rejects_invalid_batches(self):
+        count = Patient.objects.count()
+        item = make_patient_payload(0)
+        item["date_of_birth"] = "yesterday"
+        data = self.post([item], 400)
+        self.assertEqual(data["created"], [])
+        self.assertIn("date_of_birth", data["errors"][0]["errors"])
+        self.post(make_patient_payload(0), 400)
+        with mock.patch.object(
+            views.PatientBulkCreateAPIView, "max_background_size", 2
+        ):
+            self.post([make_patient_payload(i) for i in range(3)], 400)
+        self.assertEqual(Patient.objects.count(), count)
+
+    def test_bodies_over_the_upload_limit(self):
+        items = [make_patient_payload(i) for i in range(10)]
+        with override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=1000):
+            self.post(items, 201)
+        with mock.patch.object(views.PatientBulkCreateAPIView, "max_body_size", 1000):
+            response = self.client.post(
+                reverse("patient-bulk-create"), items, format="json"
+            )
+        self.assertEqual(response.status_code, 413)
+        response = self.client.post(
+            reverse("patient-bulk-create"), "[{", content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch.object(views.PatientBulkCreateAPIView, "max_batch_size", 2)
+    def test_large_batches_are_queued(self):
+        items = [make_patient_payload(i) for i in range(5)]
+        items[3]["phone_number"] = str(self.existing.phone_number)
+        count = Patient.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("patient-bulk-create"), items, format="json"
+            )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response["Location"], response.data["url"])
+        self.assertEqual(Patient.objects.count(), count)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("run_jobs", burst=True, stdout=StringIO())
+        job = self.client.get(response.data["url"]).data
+        self.assertEqual(job["status"], "succeeded")
+        self.assertEqual(
+            [item["index"] for item in job["result"]["created"]], [0, 1, 2, 4]
+        )
+        self.assertEqual([item["index"] for item in job["result"]["errors"]], [3])
+        self.assertEqual(
+            set(
+                Patient.objects.filter(
+                    pk__in=[item["id"] for item in job["result"]["created"]],
+                    clinician=self.clinician,
+                ).values_list("first_name", flat=True)
+            ),
+            {"New0", "New1", "New2", "New4"},
+        )
+
+    def test_phone_number_taken_after_the_check(self):
+        items = [make_patient_payload(i) for i in range(3)]
+        check_phone_numbers = views.PatientBulkCreateAPIView.check_phone_numbers
+        calls = []
+
+        def check_then_race(view, valid, errors):
+            check_phone_numbers(view, valid, errors)
+            if not calls:
+                # Another request creates a patient with the number of item 1.
+                Patient.objects.create(
+                    clinician=self.clinician,
+                    first_name="Other",
+                    last_name="Request",
+                    phone_number=items[1]["phone_number"],
+                    date_of_birth=date(1980, 1, 1),
+                )
+            calls.append(len(valid))
+
+        with mock.patch.object(
+            views.PatientBulkCreateAPIView, "check_phone_numbers", check_then_race
+        ):
+            data = self.post(items, 207)
+        self.assertEqual(calls, [3, 2])
+        self.assertEqual([item["index"] for item in data["created"]], [0, 2])
+        self.assertEqual([item["index"] for item in data["errors"]], [1])
+        self.assertIn("phone_number", data["errors"][0]["errors"])
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class IngestTests(APITestCase):
+    """
+    Ingestion creates the valid lines and reports the others by line number.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinician, cls.other = seed_clinicians(2, 1, 0)
+        cls.patient = Patient.objects.get(clinician=cls.clinician)
+        cls.foreign = Patient.objects.get(clinician=cls.other)
+
+    def setUp(self):
+        self.client.force_authenticate(self.clinician)
+
+    def ingest(self, lines):
+        response = self.client.post(
+            reverse("assessment-ingest"),
+            "\n".join(
+                line if isinstance(line, str) else json.dumps(line) for line in lines
+            ),
+            content_type="application/x-ndjson",
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def assessment(self, patient=None, **fields):
+        return {
+            "patient": (patient or self.patient).pk,
+            "assessment_type": "mental",
+            "assessment_date": "2024-03-01T09:00:00Z",
+            "final_score": "5.5",
+            **fields,
+        }
+
+    def test_creates_valid_lines_and_reports_the_others(self):
+        summary = self.ingest(
+            [
+                self.assessment(),
+                "{not json",
+                "",
+                self.assessment(final_score="11.0"),
+                self.assessment(assessment_type="dental"),
+                {"assessment_type": "mental", "final_score": "5.0"},
+                self.assessment(patient=self.foreign),
+                self.assessment(patient=Patient(pk=10**9)),
+                self.assessment(assessment_type="physical", final_score="7.0"),
+            ]
+        )
+        self.assertEqual(
+            {key: summary[key] for key in ["lines", "created", "rejected"]},
+            {"lines": 8, "created": 2, "rejected": 6},
+        )
+        rejects = {reject["line"]: reject["errors"] for reject in summary["rejects"]}
+        self.assertEqual(list(rejects), [2, 4, 5, 6, 7, 8])
+        self.assertEqual(rejects[2], {"non_field_errors": ["Invalid JSON."]})
+        self.assertIn("final_score", rejects[4])
+        self.assertIn("assessment_type", rejects[5])
+        self.assertIn("patient", rejects[6])
+        self.assertEqual(rejects[7], {"patient": ["Patient not found."]})
+        self.assertEqual(rejects[8], {"patient": ["Patient not found."]})
+
+        self.assertEqual(
+            sorted(
+                Assessment.objects.filter(patient=self.patient).values_list(
+                    "assessment_type", "final_score", "clinician"
+                )
+            ),
+            [
+                ("mental", Decimal("5.5"), self.clinician.pk),
+                ("physical", Decimal("7.0"), self.clinician.pk),
+            ],
+        )
+        self.assertFalse(Assessment.objects.filter(patient=self.foreign).exists())
+        self.assertEqual(
+            AssessmentDailyRollup.objects.filter(clinician=self.clinician).count(), 2
+        )
+
+    def test_line_numbers_across_chunks(self):
+        lines = [
+            self.assessment(patient=self.foreign if i % 3 == 0 else None)
+            for i in range(10)
+        ]
+        with mock.patch.object(views.AssessmentIngestAPIView, "chunk_size", 4):
+            summary = self.ingest(lines)
+        self.assertEqual(summary["created"], 6)
+        self.assertEqual(
+            [reject["line"] for reject in summary["rejects"]], [1, 4, 7, 10]
+        )
+
+    def test_reported_rejects_are_limited(self):
+        with mock.patch.object(
+            views.AssessmentIngestAPIView, "max_reported_rejects", 2
+        ):
+            summary = self.ingest(["{"] * 5 + [self.assessment()])
+        self.assertEqual(summary["rejected"], 5)
+        self.assertEqual(summary["created"], 1)
+        self.assertEqual([reject["line"] for reject in summary["rejects"]], [1, 2])
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class ExportTests(APITestCase):
+    """
+    The export streams every assessment of the clinician that matches the filters,
+    with the same content from the sync and the async view.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinician = seed_clinicians(2, 3, 4)[0]
+
+    def setUp(self):
+        self.client.force_authenticate(self.clinician)
+
+    def expected_rows(self, **filters):
+        return [
+            [
+                str(assessment.pk),
+                str(assessment.patient_id),
+                f"{assessment.patient.first_name} {assessment.patient.last_name}",
+                assessment.assessment_type,
+                assessment.assessment_date.isoformat().replace("+00:00", "Z"),
+                str(assessment.final_score),
+            ]
+            for assessment in Assessment.objects.filter(
+                clinician=self.clinician, **filters
+            )
+            .select_related("patient")
+            .order_by("assessment_date", "id")
+        ]
+
+    def export(self, **params):
+        response = self.client.get(reverse("assessment-export"), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response, content = self.export(format="csv")
+        self.assertEqual(
+            response["Content-Disposition"], 'attachment; filename="assessments.csv"'
+        )
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows[0], views.AssessmentExportAPIView.columns)
+        self.assertEqual(rows[1:], self.expected_rows())
+        self.assertEqual(len(rows), 13)
+
+        _, content = self.export(format="csv", assessment_type="mental")
+        self.assertEqual(
+            list(csv.reader(StringIO(content)))[1:],
+            self.expected_rows(assessment_type="mental"),
+        )
+
+    def test_ndjson(self):
+        _, content = self.export(format="ndjson")
+        lines = [json.loads(line) for line in content.splitlines()]
+        columns = views.AssessmentExportAPIView.columns
+        self.assertEqual(
+            [[str(line[column]) for column in columns] for line in lines],
+            self.expected_rows(),
+        )
+
+    def test_async_view_streams_the_same_content(self):
+        factory = APIRequestFactory(SERVER_NAME="localhost")
+        request = factory.get(
+            reverse("assessment-export") + "?format=csv",
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.clinician)}",
+        )
+        user_cache.clear()
+
+        async def export():
+            response = await async_views.AssessmentExportAPIView.as_view()(request)
+            self.assertTrue(response.is_async)
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        content = async_to_sync(export)().decode()
+        self.assertEqual(self.export(format="csv")[1], content)
+
+
+class RollupTests(APITestCase):
+    """
+    The rollups kept up to date change by change equal a rebuild from the
+    assessments, and rebuilding them invalidates the cached summaries.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinician = seed_clinicians(2, 3, 4)[0]
+        rollups.rebuild()
+        cls.patient, cls.second = Patient.objects.filter(
+            clinician=cls.clinician
+        ).order_by("pk")[:2]
+
+    def setUp(self):
+        cache.clear()
+        response_cache.local.clear()
+        self.client.force_authenticate(self.clinician)
+
+    def snapshot(self):
+        return list(
+            AssessmentDailyRollup.objects.order_by(
+                "clinician_id", "assessment_type", "day"
+            ).values_list(
+                "clinician_id",
+                "assessment_type",
+                "day",
+                "count",
+                "score_sum",
+                "score_sum_squares",
+                "score_min",
+                "score_max",
+            )
+        )
+
+    def assert_matches_rebuild(self):
+        incremental = self.snapshot()
+        rollups.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_incremental_updates_match_a_rebuild(self):
+        day = "2024-03-01T09:00:00Z"
+        created = []
+        for score in ["2.0", "9.5", "5.5"]:
+            response = self.client.post(
+                reverse("patient-assessment-create", args=[self.patient.pk]),
+                {
+                    "assessment_type": "mental",
+                    "assessment_date": day,
+                    "final_score": score,
+                },
+                format="json",
+            )
+            self.assertEqual(response.status_code, 201, response.data)
+            created.append(Assessment.objects.latest("pk"))
+        self.assert_matches_rebuild()
+
+        # Lower the maximum of the day, then move the minimum to another day.
+        url = reverse("assessment-detail", args=[created[1].pk])
+        self.client.patch(url, {"final_score": "3.0"}, format="json")
+        self.assert_matches_rebuild()
+        url = reverse("assessment-detail", args=[created[0].pk])
+        self.client.patch(
+            url, {"assessment_date": "2024-03-05T09:00:00Z"}, format="json"
+        )
+        self.assert_matches_rebuild()
+        self.client.patch(url, {"assessment_type": "physical"}, format="json")
+        self.assert_matches_rebuild()
+
+        self.client.delete(reverse("assessment-detail", args=[created[2].pk]))
+        self.assert_matches_rebuild()
+        self.client.delete(reverse("patient-detail", args=[self.second.pk]))
+        self.assert_matches_rebuild()
+
+    def test_rebuild_invalidates_summaries(self):
+        url = reverse("assessment-summary")
+        response = self.client.get(url)
+        etag = response["ETag"]
+        data = response.data
+        # A write the rollups do not see, repaired by a rebuild.
+        Assessment.objects.filter(patient=self.patient).update(
+            final_score=Decimal("1.0")
+        )
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        for rebuild in [
+            lambda: rollups.rebuild([self.clinician.pk]),
+            lambda: rollups.rebuild(),
+            lambda: call_command("rebuild_score_rollups", stdout=StringIO()),
+        ]:
+            with self.captureOnCommitCallbacks(execute=True):
+                rebuild()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["X-Cache"], "MISS")
+            self.assertNotEqual(response.data, data)
+            self.assertIn("1.0", [row["min"] for row in response.data])
+            etag = response["ETag"]
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class PartitionTests(APITestCase):
+    """
+    The assessments table keeps working through the API once it is partitioned, and
+    date bounded queries only read the partitions of their months.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinician = seed_clinicians(1, 20, 5)[0]
+        cls.patient = Patient.objects.filter(clinician=cls.clinician).first()
+
+    def setUp(self):
+        self.client.force_authenticate(self.clinician)
+
+    def partition(self, *args):
+        call_command("partition_assessments", *args, stdout=StringIO())
+
+    def scanned_partitions(self, queryset):
+        plan = queryset.explain()
+        names = rf"{partitions.TABLE}_(?:p\d{{4}}_\d{{2}}|default)"
+        return sorted(set(re.findall(rf"\bon ({names})\b", plan)))
+
+    def test_background(self):
+        stdout = StringIO()
+        call_command(
+            "partition_assessments", "--convert", "--background", stdout=stdout
+        )
+        self.assertFalse(partitions.is_partitioned())
+        job = Job.objects.get()
+        self.assertIn(f"Queued job {job.pk}.", stdout.getvalue())
+        call_command("run_jobs", burst=True, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.SUCCEEDED)
+        self.assertIn("Partitioned the assessments table.", job.result["output"])
+        self.assertTrue(partitions.is_partitioned())
+
+    def test_partitioned_table(self):
+        count = Assessment.objects.count()
+        with self.assertRaises(CommandError):
+            self.partition()
+        self.partition("--convert")
+        self.assertTrue(partitions.is_partitioned())
+        self.assertEqual(Assessment.objects.count(), count)
+
+        current = partitions.month_start(timezone.now())
+        months = list(partitions.get_partitions())
+        self.assertEqual(months[-1], partitions.add_months(current, 3))
+        self.assertEqual(
+            self.scanned_partitions(
+                Assessment.objects.filter(
+                    clinician=self.clinician,
+                    assessment_date__gte=current,
+                    assessment_date__lt=partitions.add_months(current, 1),
+                )
+            ),
+            [partitions.partition_name(current)],
+        )
+
+        response = self.client.get(
+            reverse("assessment-list"),
+            {"assessment_date_after": current.date(), "page_size": 100},
+        )
+        self.assertEqual(
+            response.data["count"],
+            Assessment.objects.filter(assessment_date__gte=current).count(),
+        )
+
+        # Assessments outside of the partitions land in the default partition and
+        # are moved once their month gets one.
+        response = self.client.post(
+            reverse("patient-assessment-create", args=[self.patient.pk]),
+            {
+                "assessment_type": "mental",
+                "assessment_date": partitions.add_months(current, 5),
+                "final_score": "5.5",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.partition("--months-ahead", "6")
+        month = partitions.add_months(current, 5)
+        later = Assessment.objects.filter(
+            assessment_date__gte=month,
+            assessment_date__lt=partitions.add_months(month, 1),
+        )
+        self.assertEqual(later.count(), 1)
+        self.assertEqual(
+            self.scanned_partitions(later), [partitions.partition_name(month)]
+        )
+
+        # Moving an assessment to another month moves its row.
+        assessment = Assessment.objects.filter(patient=self.patient).first()
+        response = self.client.patch(
+            reverse("assessment-detail", args=[assessment.pk]),
+            {"assessment_date": months[0]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        assessment.refresh_from_db()
+        self.assertEqual(assessment.assessment_date, months[0])
+
+        self.partition("--retain-months", "12")
+        kept = Assessment.objects.filter(
+            assessment_date__gte=partitions.add_months(current, -11)
+        )
+        self.assertEqual(Assessment.objects.count(), kept.count())
+        self.assertEqual(
+            self.client.delete(
+                reverse("patient-detail", args=[self.patient.pk])
+            ).status_code,
+            204,
+        )
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class AsyncViewTests(APITestCase):
+    """
+    The async views answer exactly like the synchronous ones, with the same queries.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinician = seed_clinicians(2, 30, 3)[0]
+        cls.patient = Patient.objects.filter(clinician=cls.clinician).first()
+        cls.assessment = Assessment.objects.filter(patient=cls.patient).first()
+        cls.foreign = Assessment.objects.exclude(clinician=cls.clinician).first()
+
+    def send(self, view_class, method, path, data=None, **kwargs):
+        factory = APIRequestFactory(SERVER_NAME="localhost")
+        token = AccessToken.for_user(self.clinician)
+        request = getattr(factory, method)(
+            path, data, format="json", HTTP_AUTHORIZATION=f"Bearer {token}"
+        )
+        view = view_class.as_view()
+        user_cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            if view_class.view_is_async:
+                response = async_to_sync(view)(request, **kwargs)
+            else:
+                response = view(request, **kwargs)
+            response.render()
+        return response, len(context.captured_queries)
+
+    def assert_same(self, name, method="get", data=None, query="", **kwargs):
+        path = reverse(name, kwargs=kwargs) + query
+        view_name = resolve(reverse(name, kwargs=kwargs)).func.view_class.__name__
+        sync_view = getattr(views, view_name)
+        async_view = getattr(async_views, view_name)
+        expected, expected_queries = self.send(sync_view, method, path, data, **kwargs)
+        response, queries = self.send(async_view, method, path, data, **kwargs)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(queries, expected_queries)
+        return response
+
+    def test_reads(self):
+        patient = {"pk": self.patient.pk}
+        for name, kwargs, query in [
+            ("patient-list", {}, "?page_size=25&ordering=-age&gender=male"),
+            ("patient-list", {}, "?pagination=cursor&page_size=5"),
+            ("patient-list", {}, "?page=2"),
+            ("patient-list", {}, "?page=100"),
+            ("patient-detail", patient, ""),
+            ("patient-detail", {"pk": 0}, ""),
+            ("assessment-list", {}, f"?patient={self.patient.pk}"),
+            ("assessment-list", {}, "?pagination=cursor&ordering=final_score"),
+            ("assessment-list", {}, "?cursor=invalid"),
+            ("assessment-detail", {"pk": self.assessment.pk}, ""),
+            ("assessment-detail", {"pk": self.foreign.pk}, ""),
+            ("patient-assessment-list", patient, "?assessment_type=mental"),
+            (
+                "patient-assessment-detail",
+                {"patient_pk": self.patient.pk, "assessment_pk": self.assessment.pk},
+                "",
+            ),
+        ]:
+            with self.subTest(name=name, kwargs=kwargs, query=query):
+                self.assert_same(name, query=query, **kwargs)
+
+    def test_writes(self):
+        path = reverse("assessment-detail", args=[self.assessment.pk])
+        response, _ = self.send(
+            async_views.AssessmentDetailAPIView,
+            "patch",
+            path,
+            {"final_score": "7.5"},
+            pk=self.assessment.pk,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assessment.refresh_from_db()
+        self.assertEqual(self.assessment.final_score, Decimal("7.5"))
+
+        response, _ = self.send(
+            async_views.AssessmentDetailAPIView, "delete", path, pk=self.assessment.pk
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Assessment.objects.filter(pk=self.assessment.pk).exists())
+
+    def test_conditional_get(self):
+        url = reverse("patient-detail", args=[self.patient.pk])
+        request = APIRequestFactory(SERVER_NAME="localhost").get(url)
+        force_authenticate(request, self.clinician)
+        view = async_views.PatientDetailAPIView.as_view()
+        response = async_to_sync(view)(request, pk=self.patient.pk)
+        self.assertEqual(response.status_code, 200)
+
+        request = APIRequestFactory(SERVER_NAME="localhost").get(
+            url, HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        force_authenticate(request, self.clinician)
+        response = async_to_sync(view)(request, pk=self.patient.pk)
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class FastJSONTests(APITestCase):
+    """
+    FastJSONRenderer and FastJSONParser have to produce exactly what DRF's JSONRenderer
+    and JSONParser do.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinician = seed_clinicians(1, 30, 3)[0]
+        rollups.rebuild()
+        cls.patient = Patient.objects.filter(clinician=cls.clinician).first()
+
+    def assert_renders_identically(self, data):
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_api_responses(self):
+        self.client.force_authenticate(self.clinician)
+        assessment = Assessment.objects.filter(patient=self.patient).first()
+        for url in [
+            reverse("patient-list") + "?page_size=100",
+            reverse("patient-detail", args=[self.patient.pk]),
+            reverse("patient-suggest") + "?q=Fir",
+            reverse("assessment-list") + "?pagination=cursor",
+            reverse("assessment-detail", args=[assessment.pk]),
+            reverse("assessment-summary"),
+            reverse("patient-assessment-list", args=[self.patient.pk]),
+        ]:
+            response = self.client.get(url)
+            with self.subTest(url=url):
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_values(self):
+        now = timezone.now()
+        for value in [
+            {"score": Decimal("7.5"), "at": now, "on": now.date(), "time": now.time()},
+            {"naive": now.replace(tzinfo=None), "delta": timedelta(hours=1)},
+            [1e16, 1.5e-7, 0.1, -0.0, 2**63 - 1, 10**30, Decimal("1E-7")],
+            ["line\u2028break", "paragraph\u2029break", "ümlaut \x01 \U0001f600"],
+            {1: "non string key", None: "null key"},
+            {"lazy": gettext_lazy("Patient not found.")},
+        ]:
+            with self.subTest(value=value):
+                self.assert_renders_identically(value)
+
+        phone_number = PhoneNumber.from_string("+14155550111")
+        self.assertEqual(
+            FastJSONRenderer().render({"phone_number": phone_number}),
+            b'{"phone_number":"+14155550111"}',
+        )
+        self.assertEqual(
+            FastJSONRenderer().render([1], "application/json; indent=4"),
+            JSONRenderer().render([1], "application/json; indent=4"),
+        )
+
+    def test_parser(self):
+        for body in [
+            b'{"a": [1, 2.5, "\\u00fc", null, true], "b": {"c": 1e400}}',
+            b'{"big": 123456789012345678901234567890, "dup": 1, "dup": 2}',
+            b'"\\ud800"',
+        ]:
+            with self.subTest(body=body):
+                self.assertEqual(
+                    FastJSONParser().parse(BytesIO(body)),
+                    JSONParser().parse(BytesIO(body)),
+                )
+        for body in [b"", b"{", b'{"a": NaN}', b"[1,]"]:
+            with self.subTest(body=body):
+                with self.assertRaises(ParseError) as fast:
+                    FastJSONParser().parse(BytesIO(body))
+                with self.assertRaises(ParseError) as slow:
+                    JSONParser().parse(BytesIO(body))
+                self.assertEqual(str(fast.exception), str(slow.exception))
+
+
+@override_settings(REPLICA_ROUTING={"DATABASES": ["default"]})
+class ReplicaRoutingTests(APITestCase):
+    """
+    ReplicaRoutingMiddleware only lets authenticated safe requests of clinicians that
+    did not just write read from a replica.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinician = seed_clinicians(1, 1, 0)[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def send(self, method, status=200, authenticated=True):
+        seen = {}
+
+        def get_response(request):
+            seen["use_replica"] = request_routing.get().use_replica
+            return Response(status=status)
+
+        headers = {}
+        if authenticated:
+            token = AccessToken.for_user(self.clinician)
+            headers["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+        request = getattr(APIRequestFactory(), method)("/api/patient/", **headers)
+        ReplicaRoutingMiddleware(get_response)(request)
+        self.assertIsNone(request_routing.get())
+        return seen["use_replica"]
+
+    def test_safe_requests(self):
+        self.assertTrue(self.send("get"))
+        self.assertTrue(self.send("head"))
+        self.assertFalse(self.send("get", authenticated=False))
+        self.assertFalse(self.send("post", status=400))
+        self.assertFalse(is_pinned(self.clinician.pk))
+
+        with override_settings(REPLICA_ROUTING={"DATABASES": []}):
+            self.assertFalse(self.send("get"))
+
+    def test_writes_pin_to_primary(self):
+        self.assertFalse(self.send("patch"))
+        self.assertTrue(is_pinned(self.clinician.pk))
+        self.assertFalse(self.send("get"))
+
+        cache.clear()
+        self.assertTrue(self.send("get"))
+
+    def test_pins_of_other_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backend = {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": directory,
+            }
+            with override_settings(CACHES={"default": backend}), mock.patch.object(
+                settings, "SINGLE_PROCESS", False
+            ):
+                # The cache of another process, writing to the same directory.
+                other = FileBasedCache(directory, {})
+                other.set(pin_key(self.clinician.pk), True)
+                self.assertTrue(is_pinned(self.clinician.pk))
+                self.assertFalse(self.send("get"))
+
+    def test_process_local_cache_refused(self):
+        with mock.patch.object(settings, "SINGLE_PROCESS", False):
+            with self.assertRaisesMessage(ImproperlyConfigured, "REPLICA_ROUTING"):
+                self.send("get")
+
+    def test_transactions_read_from_primary(self):
+        token = request_routing.set(RequestRouting(use_replica=True))
+        try:
+            # Test cases run in a transaction.
+            self.assertEqual(ReplicaRouter().db_for_read(Patient), DEFAULT_DB_ALIAS)
+        finally:
+            request_routing.reset(token)
+        self.assertEqual(ReplicaRouter().db_for_write(Patient), DEFAULT_DB_ALIAS)
+
+
+@skipUnless(settings.REPLICA_ROUTING["DATABASES"], "No replicas are configured.")
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class ReplicaFailoverTests(TransactionTestCase):
+    """
+    Runs against the replicas of POSTGRES_REPLICAS, which mirror the test database.
+    """
+
+    client_class = APIClient
+    databases = "__all__"
+
+    def setUp(self):
+        self.clinician = seed_clinicians(1, 3, 2)[0]
+        self.alias = settings.REPLICA_ROUTING["DATABASES"][0]
+        token = AccessToken.for_user(self.clinician)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+        cache.clear()
+        user_cache.clear()
+        replica_pool.down_until.clear()
+        self.addCleanup(replica_pool.down_until.clear)
+
+    def get_patients(self):
+        with CaptureQueriesContext(connection) as primary:
+            response = self.client.get(reverse("patient-list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 3)
+        return len(primary.captured_queries)
+
+    def assert_reads_from_replica(self):
+        with CaptureQueriesContext(connections[self.alias]) as replica:
+            primary_queries = self.get_patients()
+        self.assertGreater(len(replica.captured_queries), 0)
+        self.assertEqual(primary_queries, 0)
+
+    @override_settings(REPLICA_ROUTING={**settings.REPLICA_ROUTING, "DATABASES": []})
+    def test_without_replicas(self):
+        self.assertGreater(self.get_patients(), 0)
+
+    def test_reads_and_writes(self):
+        self.assert_reads_from_replica()
+
+        patient = Patient.objects.filter(clinician=self.clinician).first()
+        response = self.client.patch(
+            reverse("patient-detail", args=[patient.pk]),
+            {"first_name": "Changed"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        # Pinned to the primary right after the write.
+        self.assertGreater(self.get_patients(), 0)
+
+        cache.clear()
+        self.assert_reads_from_replica()
+
+    def test_unavailable_replica(self):
+        replica = connections[self.alias]
+        settings_dict = replica.settings_dict
+        replica.close()
+        replica.settings_dict = {**settings_dict, "PORT": 1}
+        try:
+            with self.assertLogs("healthtrack.replicas", "WARNING"):
+                self.assertGreater(self.get_patients(), 0)
+            self.assertIn(self.alias, replica_pool.down_until)
+            # Skipped without trying to connect until RETRY_SECONDS passed.
+            with self.assertNoLogs("healthtrack.replicas", "WARNING"):
+                self.assertGreater(self.get_patients(), 0)
+        finally:
+            replica.close()
+            replica.settings_dict = settings_dict
+
+
+class ColdStartTests(TransactionTestCase):
+    """
+    Workers started with the production settings do not import development only code.
+    """
+
+    def test_production_workers(self):
+        output = StringIO()
+        call_command(
+            "benchmark_cold_start",
+            runs=1,
+            settings_modules="healthtrack.settings.production",
+            stdout=output,
+        )
+        row = output.getvalue().splitlines()[-1].split()
+        self.assertEqual(row[0], "healthtrack.settings.production")
+        # No development modules were loaded.
+        self.assertEqual(row[-1], "-")
+        self.assertFalse(User.objects.exists())
+
+    def test_production_requires_shared_cache(self):
+        output = run_production_python(
+            "import django; django.setup()",
+            REDIS_URL=None,
+            MEMCACHED_LOCATION=None,
+            SINGLE_PROCESS=None,
+            METRICS_TOKEN="secret",
+        )
+        self.assertNotEqual(output.returncode, 0)
+        self.assertIn("Set REDIS_URL or MEMCACHED_LOCATION", output.stderr)
+
+    def test_docs_are_imported_on_first_request(self):
+        response = self.client.get(reverse("schema"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"openapi", response.content)
+        self.assertEqual(self.client.get(reverse("swagger-ui")).status_code, 200)
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class LoadTestTests(LiveServerTestCase):
+    def test_load_test(self):
+        output = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/results.json"
+            call_command(
+                "load_test",
+                url=self.live_server_url,
+                users=2,
+                duration=1,
+                clinicians=1,
+                patients=5,
+                output=path,
+                stdout=output,
+            )
+            with open(path) as file:
+                results = json.load(file)
+            call_command(
+                "load_test",
+                url=self.live_server_url,
+                users=1,
+                duration=0.5,
+                clinicians=1,
+                patients=5,
+                output=f"{directory}/again.json",
+                compare=path,
+                stdout=output,
+            )
+
+        self.assertEqual(results["total"]["errors"], 0)
+        self.assertIn("jwt create", results["requests"])
+        for name, row in results["requests"].items():
+            with self.subTest(name=name):
+                self.assertGreater(row["requests"], 0)
+                self.assertLessEqual(row["p50"], row["p95"])
+                self.assertLessEqual(row["p95"], row["p99"])
+        self.assertIn("p95 change", output.getvalue())
+        # The seeded clinicians are removed again.
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Address.objects.exists())
+
+
+class SeedTests(TransactionTestCase):
+    """
+    seed_healthtrack generates the same valid data for a seed, however it is split
+    into batches and processes.
+    """
+
+    options = {
+        "seed": 3,
+        "clinicians": 6,
+        "patients_per_clinician": 8,
+        "assessments_per_patient": 4,
+        "end_date": date(2026, 1, 1),
+        "batch_size": 4,
+        "stdout": StringIO(),
+    }
+
+    def snapshot(self):
+        return list(
+            Patient.objects.order_by("phone_number").values_list(
+                "clinician__email",
+                "first_name",
+                "last_name",
+                "phone_number",
+                "date_of_birth",
+                "address__country",
+                "address__postal_code",
+                "created_at",
+            )
+        ), list(
+            Assessment.objects.order_by(
+                "patient__phone_number", "assessment_date"
+            ).values_list("assessment_type", "assessment_date", "final_score")
+        )
+
+    def test_deterministic(self):
+        call_command("seed_healthtrack", **self.options)
+        patients, assessments = self.snapshot()
+        self.assertEqual(User.objects.count(), 6)
+        self.assertGreater(len(assessments), len(patients))
+
+        # Resumes with the clinicians that are missing.
+        User.objects.get(email="seed-3-4@healthtrack.com").delete()
+        call_command("seed_healthtrack", **self.options)
+        self.assertEqual(self.snapshot(), (patients, assessments))
+
+        User.objects.all().delete()
+        call_command("seed_healthtrack", **{**self.options, "workers": 2})
+        self.assertEqual(self.snapshot(), (patients, assessments))
+
+        with self.assertRaises(CommandError):
+            call_command("seed_healthtrack", **{**self.options, "seed": 4})
+
+    def test_generated_values(self):
+        call_command("seed_healthtrack", **self.options)
+        for patient in Patient.objects.select_related("address"):
+            with self.subTest(phone_number=patient.phone_number):
+                self.assertTrue(patient.phone_number.is_valid())
+                self.assertEqual(
+                    region_code_for_number(patient.phone_number),
+                    patient.address.country.code,
+                )
+                self.assertLess(patient.date_of_birth, patient.created_at.date())
+        self.assertFalse(Patient.objects.filter(search_vector__isnull=True).exists())
+
+        scores = Assessment.objects.aggregate(
+            count=Count("id"), low=Min("final_score"), high=Max("final_score")
+        )
+        self.assertGreaterEqual(scores["low"], Decimal("1.0"))
+        self.assertLessEqual(scores["high"], Decimal("10.0"))
+        self.assertEqual(
+            AssessmentDailyRollup.objects.aggregate(count=Sum("count"))["count"],
+            scores["count"],
+        )
+
+
+class ImportTests(APITestCase):
+    """
+    import_healthtrack normalises messy legacy files, rejects what it can not import
+    with a reason, and can import the same files again.
+    """
+
+    patients = """id,Clinician,first_name,last_name,gender,phone_number,date_of_birth,\
+address_one,address_two,city,postal_code,country
+1,A@healthtrack.com,  Ann ,Smith,F,(415) 555-0101,1980-05-17,1 Main St,,Springfield,\
+94110,USA
+2,a@healthtrack.com,Bob,Jones,male,+44 (0)20 7946 0000,1975-01-02,2 High St,,London,\
+EC1A 1BB,GB
+3,a@healthtrack.com,Cy,Lee,,020 7946 0001,1990-12-31,3 High St,Flat 2,London,,GBR
+4,a@healthtrack.com,Dup,Smith,female,415.555.0101,1980-05-17,4 Main St,,,,US
+5,nobody@healthtrack.com,Eve,Doe,female,4155550103,1980-05-17,5 Main St,,,,US
+6,a@healthtrack.com,Fay,Doe,female,12345,1980-05-17,6 Main St,,,,US
+7,a@healthtrack.com,Gil,Doe,male,4155550104,17/05/1980,7 Main St,,,,US
+8,a@healthtrack.com,Hal,Doe,male,4155550105,1980-05-17,8 Main St,,,,Atlantis
+9,a@healthtrack.com,Ida,Doe,female,+1 415 555 0199,1980-05-17,9 Main St,,,,US
+10,a@healthtrack.com,Jo,Doe,x,4155550106,1980-05-17,10 Main St,,,,US
+11,a@healthtrack.com,Dee,Renamed,female,1-415-555-0102,1970-03-04,11 Main St,,,,
+"""
+    assessments = """id,patient,assessment_type,assessment_date,final_score
+1,1,cognitive,2024-01-05,7.25
+2,1,Physical Ability,2024-01-06 10:00,"8,0"
+3,1,COGNITIVE,2024-01-05,7.3
+4,2,mental,2024-02-01,11
+5,2,mental,2024-02-01,abc
+6,5,mental,2024-02-01,5
+7,99,mental,2024-02-01,5
+8,2,sleep,2024-02-01,5
+9,3,emotional,2999-01-01,5
+10,3,emotional,yesterday,5
+11,11,emotional,2024-03-01,1
+"""
+
+    def setUp(self):
+        self.clinician = User.objects.create_user("a@healthtrack.com", "password")
+        other = User.objects.create_user("b@healthtrack.com", "password")
+        self.existing = Patient.objects.create(
+            clinician=self.clinician,
+            first_name="Dee",
+            last_name="Old",
+            phone_number="+14155550102",
+            date_of_birth=date(1970, 3, 4),
+        )
+        Patient.objects.create(
+            clinician=other,
+            first_name="Other",
+            last_name="Patient",
+            phone_number="+14155550199",
+            date_of_birth=date(1970, 3, 4),
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.files = {}
+        for name in ["patients", "assessments"]:
+            self.files[name] = f"{directory.name}/{name}.csv"
+            with open(self.files[name], "w") as file:
+                file.write(getattr(self, name))
+        self.files["rejects"] = f"{directory.name}/rejects.csv"
+
+    def run_import(self, **options):
+        stdout = StringIO()
+        call_command("import_healthtrack", **self.files, **options, stdout=stdout)
+        with open(self.files["rejects"]) as file:
+            rejects = {
+                (row["file"], int(row["row"])): (row["reason"], row["detail"])
+                for row in csv.DictReader(file)
+            }
+        return stdout.getvalue(), rejects
+
+    def test_import(self):
+        output, rejects = self.run_import()
+        self.assertIn(
+            "Created 3 patients, updated 1 and imported 3 assessments", output
+        )
+        self.assertEqual(
+            rejects,
+            {
+                ("patients", 4): ("duplicate phone number", "row 1"),
+                ("patients", 5): ("unknown clinician", ""),
+                ("patients", 6): ("invalid phone number", ""),
+                ("patients", 7): ("invalid date of birth", ""),
+                ("patients", 8): ("unknown country", ""),
+                ("patients", 9): ("phone number of another clinician's patient", ""),
+                ("patients", 10): ("invalid gender", ""),
+                ("assessments", 3): ("duplicate assessment", "row 1"),
+                ("assessments", 4): ("score out of range", "11.0"),
+                ("assessments", 5): ("invalid score", ""),
+                ("assessments", 6): ("patient was rejected", "row 5"),
+                ("assessments", 7): ("unknown patient", ""),
+                ("assessments", 8): ("invalid assessment type", ""),
+                ("assessments", 9): ("assessment date in the future", ""),
+                ("assessments", 10): ("invalid assessment date", ""),
+            },
+        )
+
+        patients = {
+            str(patient.phone_number): patient
+            for patient in Patient.objects.filter(clinician=self.clinician)
+            .select_related("address")
+            .prefetch_related("assessment_set")
+        }
+        self.assertEqual(
+            sorted(patients),
+            ["+14155550101", "+14155550102", "+442079460000", "+442079460001"],
+        )
+        ann = patients["+14155550101"]
+        self.assertEqual((ann.first_name, ann.gender), ("Ann", "female"))
+        self.assertEqual(ann.address.country.code, "US")
+        self.assertIsNone(ann.address.address_two)
+        self.assertEqual(
+            sorted(
+                (a.assessment_type, a.final_score) for a in ann.assessment_set.all()
+            ),
+            [("cognitive", Decimal("7.3")), ("physical", Decimal("8.0"))],
+        )
+        self.assertEqual(patients["+442079460001"].gender, "other")
+        self.assertEqual(patients["+442079460001"].address.country.code, "GB")
+        dee = patients["+14155550102"]
+        self.assertEqual((dee.pk, dee.last_name), (self.existing.pk, "Renamed"))
+        self.assertEqual(dee.address.address_one, "11 Main St")
+        self.assertIsNotNone(dee.search_vector)
+        self.assertEqual(
+            AssessmentDailyRollup.objects.aggregate(count=Sum("count"))["count"], 3
+        )
+
+        # Importing the files again changes nothing.
+        updated_at = Patient.objects.values_list("updated_at", flat=True)
+        before = sorted(updated_at)
+        output, rejects = self.run_import()
+        self.assertIn(
+            "Created 0 patients, updated 0 and imported 0 assessments", output
+        )
+        self.assertEqual(rejects[("assessments", 1)], ("already imported", ""))
+        self.assertEqual(sorted(updated_at), before)
+        self.assertEqual(Assessment.objects.count(), 3)
+
+    def test_address_change(self):
+        self.run_import()
+        updated_at = dict(Patient.objects.values_list("pk", "updated_at"))
+        with open(self.files["patients"], "w") as file:
+            file.write(self.patients.replace("11 Main St,,,,", "12 Main St,,,,"))
+        output, _ = self.run_import()
+        self.assertIn("Created 0 patients, updated 1", output)
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.address.address_one, "12 Main St")
+        self.assertGreater(self.existing.updated_at, updated_at.pop(self.existing.pk))
+        # The other patients are left alone.
+        self.assertEqual(
+            dict(
+                Patient.objects.exclude(pk=self.existing.pk).values_list(
+                    "pk", "updated_at"
+                )
+            ),
+            updated_at,
+        )
+
+    @override_settings(AUDIT_LOG={"FLUSH_INTERVAL": 3600, "BATCH_SIZE": 10**6})
+    def test_audit(self):
+        audit_log.flush()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_import()
+        self.assertEqual(audit_log.flush(), 7)
+        events = AuditEvent.objects.filter(
+            patient_id__in=Patient.objects.filter(clinician=self.clinician).values("pk")
+        )
+        self.assertEqual(
+            Counter(events.values_list("action", "model")),
+            {
+                ("create", "patient"): 3,
+                ("update", "patient"): 1,
+                ("create", "assessment"): 3,
+            },
+        )
+        self.assertTrue(
+            events.filter(action="update", object_id=self.existing.pk).exists()
+        )
+
+    def test_dry_run(self):
+        output, rejects = self.run_import(dry_run=True)
+        self.assertIn("Would create 3 patients", output)
+        self.assertEqual(len(rejects), 15)
+        self.assertEqual(Patient.objects.count(), 2)
+        self.assertFalse(Assessment.objects.exists())
+
+    def test_background(self):
+        stdout = StringIO()
+        call_command(
+            "import_healthtrack",
+            **self.files,
+            clinician="a@healthtrack.com",
+            background=True,
+            stdout=stdout,
+        )
+        self.assertFalse(Assessment.objects.exists())
+        job = Job.objects.get()
+        self.assertEqual((job.user_id, job.max_attempts), (self.clinician.pk, 1))
+
+        call_command("run_jobs", burst=True, stdout=stdout)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.SUCCEEDED)
+        self.assertIn("Created 3 patients", job.result["output"])
+        self.assertEqual(Assessment.objects.count(), 3)
+
+    def test_invalid_files(self):
+        with open(self.files["patients"], "w") as file:
+            file.write("first_name,last_name,nickname\n")
+        with self.assertRaises(CommandError):
+            call_command("import_healthtrack", patients=self.files["patients"])
+
+
+@override_settings(
+    RESPONSE_CACHE={"ENABLED": False},
+    AUDIT_LOG={"FLUSH_INTERVAL": 3600, "BATCH_SIZE": 10**6},
+)
+class AuditTests(APITestCase):
+    """
+    Reads and changes of patients and assessments are buffered and written to the
+    audit trail in batches.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinician, cls.other = seed_clinicians(2, 1, 1)
+        cls.staff = User.objects.create_user(
+            "auditor@healthtrack.com", "password", is_staff=True
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.clinician)
+        audit_log.flush()
+
+    def trail(self, patient_id):
+        return list(
+            audit.get_patient_events(patient_id)
+            .reverse()
+            .values_list("user_id", "action", "model", "fields")
+        )
+
+    def test_reads_and_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("patient-list"), make_patient_payload(1), format="json"
+            )
+        pk = Patient.objects.get(phone_number="+14155000001").pk
+        self.client.get(reverse("patient-detail", args=[pk]))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse("patient-detail", args=[pk]),
+                {"last_name": "Renamed", "address": {"city": "Shelbyville"}},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("patient-assessment-create", args=[pk]),
+                {"assessment_type": "mental", "final_score": "5.0"},
+                format="json",
+            )
+        assessment = Assessment.objects.get(patient_id=pk)
+        self.client.get(reverse("patient-assessment-list", args=[pk]))
+        self.client.get(reverse("assessment-detail", args=[assessment.pk]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse("assessment-detail", args=[assessment.pk]))
+        # Requests that fail or read other clinicians' data are not reads.
+        foreign = Patient.objects.filter(clinician=self.other).get()
+        self.client.get(reverse("patient-detail", args=[foreign.pk]))
+
+        # Nothing is written until the buffer is flushed.
+        self.assertEqual(self.trail(pk), [])
+        self.assertEqual(audit_log.flush(), 8)
+
+        user = self.clinician.pk
+        self.assertEqual(
+            self.trail(pk),
+            [
+                (user, "create", "patient", None),
+                (user, "read", "patient", None),
+                (user, "update", "patient", ["address"]),
+                (user, "update", "patient", ["last_name", "updated_at"]),
+                (user, "create", "assessment", None),
+                (user, "read", "assessment", None),
+                (user, "read", "assessment", None),
+                (user, "delete", "assessment", None),
+            ],
+        )
+        self.assertEqual(self.trail(foreign.pk), [])
+
+        url = reverse("patient-audit-list", args=[pk])
+        response = self.client.get(url)
+        self.assertEqual(response.data["count"], 8)
+        self.assertEqual(response.data["results"][0]["action"], "delete")
+        self.assertEqual(response.data["results"][0]["ip_address"], "127.0.0.1")
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(self.client.get(url).data["count"], 8)
+
+    def test_rolled_back_changes_are_not_audited(self):
+        patient = Patient.objects.filter(clinician=self.clinician).get()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse("patient-detail", args=[patient.pk]),
+                {"first_name": "Renamed"},
+                format="json",
+                HTTP_IF_MATCH='"stale"',
+            )
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(audit_log.flush(), 0)
+
+    @override_settings(AUDIT_LOG={"MAX_BUFFERED": 2, "FLUSH_INTERVAL": 3600})
+    def test_bounded_buffer(self):
+        patient = Patient.objects.filter(clinician=self.clinician).get()
+        events = [audit.make_instance_event("read", patient) for _ in range(5)]
+        # A full buffer is written by the thread that records.
+        audit_log.record(events)
+        self.assertEqual(audit_log.stats()["buffered"], 0)
+        self.assertEqual(len(self.trail(patient.pk)), 5)
+
+        # Events that do not fit while the database can not be written are dropped.
+        dropped = audit_log.stats()["dropped"]
+        with mock.patch.object(audit_log, "write", side_effect=DatabaseError):
+            with self.assertLogs("patients.audit", "ERROR"):
+                audit_log.record(events)
+        self.assertEqual(audit_log.stats()["buffered"], 2)
+        self.assertEqual(audit_log.stats()["dropped"], dropped + 3)
+        self.assertEqual(audit_log.flush(), 2)
+
+    @override_settings(AUDIT_LOG={"DURABILITY": "sync"})
+    def test_sync_durability(self):
+        patient = Patient.objects.filter(clinician=self.clinician).get()
+        self.client.get(reverse("patient-detail", args=[patient.pk]))
+        self.assertEqual(
+            self.trail(patient.pk), [(self.clinician.pk, "read", "patient", None)]
+        )
+
+    def test_lists_and_exports(self):
+        patient = Patient.objects.filter(clinician=self.clinician).get()
+        for name, params in [
+            ("patient-list", {}),
+            ("patient-list", {"search": patient.last_name}),
+            ("patient-suggest", {"q": patient.last_name}),
+            ("assessment-export", {"format": "csv"}),
+        ]:
+            response = self.client.get(reverse(name), params)
+            self.assertEqual(response.status_code, 200)
+            if response.streaming:
+                b"".join(response.streaming_content)
+        # A list that came from the response cache.
+        with override_settings(RESPONSE_CACHE={"ENABLED": True}):
+            cache.clear()
+            self.client.get(reverse("patient-list"))
+            self.assertEqual(self.client.get(reverse("patient-list"))["X-Cache"], "HIT")
+        self.assertEqual(audit_log.flush(), 6)
+        self.assertEqual(
+            list(
+                audit.get_patient_events(patient.pk)
+                .reverse()
+                .values_list("model", "object_id")
+            ),
+            [("patient", None)] * 3 + [("assessment", None)] + [("patient", None)] * 2,
+        )
+
+    def test_assessment_lists(self):
+        patient = Patient.objects.filter(clinician=self.clinician).get()
+        url = reverse("assessment-list")
+        token = AccessToken.for_user(self.clinician)
+        view = async_views.AssessmentListAPIView.as_view()
+
+        def async_get(url):
+            request = APIRequestFactory().get(url, HTTP_AUTHORIZATION=f"Bearer {token}")
+            return async_to_sync(view)(request)
+
+        statuses = []
+        with override_settings(RESPONSE_CACHE={"ENABLED": True}):
+            for get in [self.client.get, async_get]:
+                cache.clear()
+                response_cache.local.clear()
+                statuses += [get(url)["X-Cache"], get(url)["X-Cache"]]
+        self.assertEqual(statuses, ["MISS", "HIT"] * 2)
+        self.assertEqual(audit_log.flush(), 4)
+        self.assertEqual(
+            self.trail(patient.pk),
+            [(self.clinician.pk, "read", "assessment", None)] * 4,
+        )
+
+    @override_settings(AUDIT_LOG={"DURABILITY": "sync"})
+    def test_sync_durability_in_async_views(self):
+        patient = Patient.objects.filter(clinician=self.clinician).get()
+        request = APIRequestFactory().get(
+            reverse("patient-detail", args=[patient.pk]),
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.clinician)}",
+        )
+        view = async_views.PatientDetailAPIView.as_view()
+        self.assertEqual(async_to_sync(view)(request, pk=patient.pk).status_code, 200)
+        self.assertEqual(
+            self.trail(patient.pk), [(self.clinician.pk, "read", "patient", None)]
+        )
+
+
+class AuditFlusherTests(TransactionTestCase):
+    """
+    The background thread writes buffered events on its own connection.
+    """
+
+    @override_settings(AUDIT_LOG={"FLUSH_INTERVAL": 0.05})
+    def test_background_flush(self):
+        clinician = User.objects.create_user("clinician@healthtrack.com")
+        patient = Patient.objects.create(
+            clinician=clinician,
+            first_name="First",
+            last_name="Last",
+            phone_number="+14155550100",
+            date_of_birth=date(1980, 1, 1),
+        )
+        audit_log.record([audit.make_instance_event("read", patient)])
+        deadline = time.monotonic() + 5
+        while not AuditEvent.objects.filter(patient_id=patient.pk).exists():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+
+
+class JobTests(APITestCase):
+    """
+    Queued jobs run by priority, are retried with backoff and report their status.
+    """
+
+    def setUp(self):
+        self.calls = []
+        registry = {
+            **jobs.registry,
+            "tests.record": (self.record, 0, None),
+            "tests.flaky": (self.flaky, 0, 3),
+        }
+        patcher = mock.patch.object(jobs, "registry", registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def record(self, value):
+        self.calls.append(value)
+        return {"value": value}
+
+    def flaky(self):
+        self.calls.append(len(self.calls))
+        if len(self.calls) < 3:
+            raise ValueError("Not yet.")
+        return len(self.calls)
+
+    def run_jobs(self):
+        stdout = StringIO()
+        call_command("run_jobs", burst=True, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_priority(self):
+        soon = timezone.now() + timedelta(hours=1)
+        jobs.enqueue("tests.record", value="first")
+        jobs.enqueue("tests.record", value="urgent", priority=10)
+        jobs.enqueue("tests.record", value="second")
+        jobs.enqueue("tests.record", value="later", priority=20, run_at=soon)
+        with self.assertRaises(ValueError):
+            jobs.enqueue("tests.unknown")
+
+        self.assertIn("Ran 3 jobs, 0 of them failed.", self.run_jobs())
+        self.assertEqual(self.calls, ["urgent", "first", "second"])
+        job = Job.objects.get(payload__value="first")
+        self.assertEqual(job.status, Job.Status.SUCCEEDED)
+        self.assertEqual(job.result, {"value": "first"})
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(job.locked_by)
+        self.assertEqual(
+            Job.objects.get(payload__value="later").status, Job.Status.QUEUED
+        )
+
+    def test_retries(self):
+        job = jobs.enqueue("tests.flaky")
+        self.assertEqual(job.max_attempts, 3)
+        with self.assertLogs("patients.jobs", "ERROR"):
+            self.run_jobs()
+        job.refresh_from_db()
+        # The retry waits for the backoff of the first attempt, 5 to 10 seconds.
+        self.assertEqual((job.status, job.attempts), (Job.Status.QUEUED, 1))
+        self.assertIn("ValueError: Not yet.", job.error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=4))
+        self.assertLess(job.run_at, timezone.now() + timedelta(seconds=10))
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs("patients.jobs", "ERROR"):
+            self.run_jobs()
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertIn("Ran 1 jobs, 0 of them failed.", self.run_jobs())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.SUCCEEDED, 3))
+        self.assertEqual((job.result, job.error), (3, ""))
+
+        # A job that failed its last attempt is not retried.
+        self.calls = []
+        job = jobs.enqueue("tests.flaky", max_attempts=1)
+        with self.assertLogs("patients.jobs", "ERROR"):
+            self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.FAILED, 1))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_expired_lease(self):
+        job = jobs.enqueue("tests.record", value="again", max_attempts=2)
+        self.assertEqual(jobs.claim("gone:1:0"), job)
+        self.assertIsNone(jobs.claim("worker:1:0"))
+
+        # The worker stopped, once its lease ran out the job runs again.
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now())
+        taken = jobs.claim("worker:1:0")
+        self.assertEqual((taken, taken.attempts), (job, 2))
+        # The stopped worker can not record an outcome any more.
+        job.refresh_from_db()
+        job.locked_by = "gone:1:0"
+        jobs.execute(job)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.Status.RUNNING)
+        jobs.execute(taken)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.SUCCEEDED)
+        self.assertEqual(job.result, {"value": "again"})
+
+        # A job that used up its attempts fails.
+        job = jobs.enqueue("tests.record", value="never", max_attempts=1)
+        jobs.claim("gone:1:0")
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now())
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertEqual(job.error, "The worker running it (gone:1:0) stopped.")
+        self.assertNotIn("never", self.calls)
+
+    def test_background_command(self):
+        clinician = seed_clinicians(1, 1, 1)[0]
+        AssessmentDailyRollup.objects.all().delete()
+        stdout = StringIO()
+        call_command("rebuild_score_rollups", background=True, stdout=stdout)
+        self.assertFalse(AssessmentDailyRollup.objects.exists())
+
+        job = Job.objects.get()
+        self.assertIn(f"Queued job {job.pk}.", stdout.getvalue())
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.SUCCEEDED)
+        self.assertIn("Rebuilt 1 daily rollup rows", job.result["output"])
+        self.assertEqual(AssessmentDailyRollup.objects.get().clinician_id, clinician.pk)
+
+    def test_status_endpoint(self):
+        owner = User.objects.create_user("owner@healthtrack.com")
+        other = User.objects.create_user("other@healthtrack.com")
+        staff = User.objects.create_user("staff@healthtrack.com", is_staff=True)
+        job = jobs.enqueue("tests.record", value=1, user=owner)
+        jobs.enqueue("tests.record", value=2, user=other)
+
+        url = reverse("job-detail", args=[job.pk])
+        self.client.force_authenticate(owner)
+        response = self.client.get(url)
+        self.assertEqual(response.data["status"], "queued")
+        self.assertEqual(response.data["name"], "tests.record")
+        response = self.client.get(reverse("job-list"))
+        self.assertEqual([row["id"] for row in response.data["results"]], [job.pk])
+        self.run_jobs()
+        response = self.client.get(url)
+        self.assertEqual(response.data["status"], "succeeded")
+        self.assertEqual(response.data["result"], {"value": 1})
+
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_authenticate(staff)
+        response = self.client.get(reverse("job-list"), {"status": "succeeded"})
+        self.assertEqual(response.data["count"], 2)
+
+
+class JobWorkerTests(TransactionTestCase):
+    """
+    Workers in separate threads, and transactions, do not take each other's jobs.
+    """
+
+    def test_skip_locked(self):
+        first = jobs.enqueue("command", command="check", options={})
+        second = jobs.enqueue("command", command="check", options={})
+        with transaction.atomic():
+            # Another worker holds the lock on the first job while it claims it.
+            Job.objects.select_for_update().get(pk=first.pk)
+            with ThreadPoolExecutor(1) as executor:
+                claimed = executor.submit(self.claim_and_close, "other:1:0").result()
+        self.assertEqual(claimed, second)
+
+    def claim_and_close(self, worker):
+        try:
+            return jobs.claim(worker)
+        finally:
+            connection.close()
+
+    def test_concurrency(self):
+        for _ in range(6):
+            jobs.enqueue("command", command="check", options={})
+        call_command("run_jobs", burst=True, concurrency=3, stdout=StringIO())
+        self.assertEqual(
+            set(Job.objects.values_list("status", "attempts")),
+            {(Job.Status.SUCCEEDED, 1)},
+        )
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False}, METRICS={})
+class MetricsTests(APITestCase):
+    """
+    /metrics reports the latency, queries, serialization and render time of the
+    requests per route.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clinician = seed_clinicians(1, 5, 1)[0]
+
+    def setUp(self):
+        self.client.force_authenticate(self.clinician)
+
+    def scrape(self, status=200, **headers):
+        response = self.client.get("/metrics", **headers)
+        self.assertEqual(response.status_code, status)
+        if status != 200:
+            return None
+        self.assertEqual(response["Content-Type"], CONTENT_TYPE)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_routes(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("patient-list"))
+        query_count = len(queries)
+        self.client.get(reverse("patient-list"))
+        self.client.get(reverse("patient-detail", args=[10**9]))
+        self.client.get("/api/nowhere/")
+        samples = self.scrape()
+
+        histogram = "healthtrack_request_duration_seconds"
+        labels = 'route="patient-list",method="GET"'
+        self.assertEqual(samples[f'{histogram}_count{{{labels},status="200"}}'], 2)
+        self.assertEqual(
+            samples[f'{histogram}_bucket{{{labels},status="200",le="+Inf"}}'], 2
+        )
+        self.assertGreater(samples[f'{histogram}_sum{{{labels},status="200"}}'], 0)
+        self.assertEqual(
+            samples[f"healthtrack_request_db_queries_total{{{labels}}}"],
+            2 * query_count,
+        )
+        for name in ["db_seconds", "serialization_seconds", "render_seconds"]:
+            total = f"healthtrack_request_{name}_total{{{labels}}}"
+            self.assertGreater(samples[total], 0)
+
+        for route in ["patient-detail", "unmatched"]:
+            labels = f'route="{route}",method="GET",status="404"'
+            self.assertEqual(samples[f"{histogram}_count{{{labels}}}"], 1)
+
+    def test_async(self):
+        async_to_sync(self.async_client.get)(reverse("patient-list"))
+        samples = self.scrape()
+        labels = 'route="patient-list",method="GET",status="401"'
+        self.assertEqual(
+            samples[f"healthtrack_request_duration_seconds_count{{{labels}}}"], 1
+        )
+        labels = 'route="patient-list",method="GET"'
+        self.assertGreater(
+            samples[f"healthtrack_request_render_seconds_total{{{labels}}}"], 0
+        )
+
+    def test_buckets(self):
+        stats = RequestStats()
+        for duration in [0.01, 0.011, 20]:
+            metrics.observe("route", "GET", 200, duration, stats)
+        samples = self.scrape()
+        bucket = "healthtrack_request_duration_seconds_bucket"
+        labels = 'route="route",method="GET",status="200"'
+        for bound, count in [("0.005", 0), ("0.01", 1), ("0.025", 2), ("10", 2)]:
+            self.assertEqual(samples[f'{bucket}{{{labels},le="{bound}"}}'], count)
+        self.assertEqual(samples[f'{bucket}{{{labels},le="+Inf"}}'], 3)
+
+    def test_token(self):
+        with override_settings(METRICS={"TOKEN": "secret"}):
+            self.scrape(403)
+            self.scrape(403, HTTP_AUTHORIZATION="Bearer other")
+            self.scrape(HTTP_AUTHORIZATION="Bearer secret")
+
+    def test_deploy_check_requires_token(self):
+        check = (
+            "from django.core.management import execute_from_command_line; "
+            "execute_from_command_line(['manage.py', 'check', '--deploy'])"
+        )
+        output = run_production_python(check, METRICS_TOKEN=None, SINGLE_PROCESS="1")
+        self.assertNotEqual(output.returncode, 0)
+        self.assertIn("healthtrack.E001", output.stderr)
+        self.assertIn("Set METRICS_TOKEN", output.stderr)
+        output = run_production_python(
+            check, METRICS_TOKEN="secret", SINGLE_PROCESS="1"
+        )
+        self.assertNotIn("healthtrack.E001", output.stdout + output.stderr)
+
+    def test_production_commands_run_without_token(self):
+        output = run_production_python(
+            "from django.core.management import execute_from_command_line; "
+            "execute_from_command_line(['manage.py', 'showmigrations', 'patients'])",
+            METRICS_TOKEN=None,
+            SINGLE_PROCESS="1",
+            POSTGRES_DB=connection.settings_dict["NAME"],
+        )
+        self.assertEqual(output.returncode, 0, output.stderr)
+        self.assertIn("[X] 0001_initial", output.stdout)
+
+    def test_lists_are_measured_once(self):
+        patients = list(Patient.objects.filter(clinician=self.clinician).with_age())
+        serializer = PatientListSerializer(patients, many=True)
+        self.assertIsInstance(serializer, MeasuredListSerializer)
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        try:
+            with mock.patch(
+                "healthtrack.metrics.perf_counter", side_effect=[1.0, 3.0]
+            ) as clock:
+                self.assertEqual(len(serializer.data), 5)
+        finally:
+            request_stats.reset(token)
+        self.assertEqual(clock.call_count, 2)
+        self.assertEqual(stats.serialization, 2.0)
+
+    def test_processes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with override_settings(METRICS={"DIRECTORY": directory.name}):
+            other = {
+                "buckets": metrics.buckets,
+                "durations": [["route", "GET", 200, *[0] * 11, 1, 50.0]],
+                "totals": [["route", "GET", 3, 0.5, 0.25, 0.125]],
+            }
+            with open(f"{directory.name}/1.json", "w") as file:
+                json.dump(other, file)
+            metrics.observe("route", "GET", 200, 0.01, RequestStats())
+            metrics.export()
+            samples = self.scrape()
+        labels = 'route="route",method="GET"'
+        histogram = "healthtrack_request_duration_seconds"
+        self.assertEqual(samples[f'{histogram}_count{{{labels},status="200"}}'], 2)
+        self.assertEqual(samples[f'{histogram}_sum{{{labels},status="200"}}'], 50.01)
+        self.assertEqual(
+            samples[f"healthtrack_request_db_queries_total{{{labels}}}"], 3
+        )
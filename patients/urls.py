@@ -1,13 +1,35 @@
+from django.conf import settings
 from django.urls import path
 
 from patients.views import (AssessmentCreateAPIView, AssessmentDetailAPIView,
-                            AssessmentListAPIView,
+                            AssessmentExportAPIView, AssessmentIngestAPIView,
+                            AssessmentListAPIView, AssessmentSummaryAPIView,
+                            JobDetailAPIView, JobListAPIView,
                             PatientAssessmentDetailAPIView,
-                            PatientAssessmentListAPIView, PatientDetailAPIView,
-                            PatientListCreateAPIView)
+                            PatientAssessmentListAPIView,
+                            PatientAuditListAPIView,
+                            PatientBulkCreateAPIView, PatientDetailAPIView,
+                            PatientListCreateAPIView, PatientSuggestAPIView)
+
+if settings.ASYNC_VIEWS:
+    from patients.async_views import (AssessmentDetailAPIView,
+                                      AssessmentExportAPIView,
+                                      AssessmentListAPIView,
+                                      PatientAssessmentDetailAPIView,
+                                      PatientAssessmentListAPIView,
+                                      PatientDetailAPIView,
+                                      PatientListCreateAPIView)
 
 urlpatterns = [
     path("patient/", PatientListCreateAPIView.as_view(), name="patient-list"),
+    path(
+        "patient/bulk/",
+        PatientBulkCreateAPIView.as_view(),
+        name="patient-bulk-create",
+    ),
+    path(
+        "patient/suggest/", PatientSuggestAPIView.as_view(), name="patient-suggest"
+    ),
     path("patient/<int:pk>/", PatientDetailAPIView.as_view(), name="patient-detail"),
     path(
         "patient/<int:pk>/assessment/",
@@ -19,15 +41,37 @@ urlpatterns = [
         PatientAssessmentDetailAPIView.as_view(),
         name="patient-assessment-detail",
     ),
+    path(
+        "patient/<int:pk>/audit/",
+        PatientAuditListAPIView.as_view(),
+        name="patient-audit-list",
+    ),
     path(
         "patient/<int:pk>/assessment/create",
         AssessmentCreateAPIView.as_view(),
         name="patient-assessment-create",
     ),
     path("assessment/", AssessmentListAPIView.as_view(), name="assessment-list"),
+    path(
+        "assessment/export/",
+        AssessmentExportAPIView.as_view(),
+        name="assessment-export",
+    ),
+    path(
+        "assessment/ingest/",
+        AssessmentIngestAPIView.as_view(),
+        name="assessment-ingest",
+    ),
+    path(
+        "assessment/summary/",
+        AssessmentSummaryAPIView.as_view(),
+        name="assessment-summary",
+    ),
     path(
         "assessment/<int:pk>/",
         AssessmentDetailAPIView.as_view(),
         name="assessment-detail",
     ),
+    path("job/", JobListAPIView.as_view(), name="job-list"),
+    path("job/<int:pk>/", JobDetailAPIView.as_view(), name="job-detail"),
 ]
@@ -1,37 +1,84 @@
-from django.contrib.postgres.search import SearchVector
-from django.db import transaction
+import csv
+import itertools
+import json
+import re
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+)
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest, Upper
+from django.http import HttpRequest, StreamingHttpResponse
+from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics, status
-from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.filters import OrderingFilter
+from rest_framework.request import Request
 from rest_framework.response import Response
 
-from .filters import AssessmentTypeFilter, GenderFilter
-from .models import Address, Assessment, Patient
+from users.models import User
+
+from . import audit, jobs, rollups
+from .audit import AuditedListMixin, AuditedReadMixin, audit_log
+from .cache import CachedListMixin, invalidate_clinician
+from .conditional import ConditionalListMixin, ConditionalObjectMixin
+from .filters import (
+    AssessmentSummaryFilter,
+    AssessmentTypeFilter,
+    GenderFilter,
+    PatientOrderingFilter,
+)
+from .models import (
+    SEARCH_CONFIG,
+    Address,
+    Assessment,
+    AssessmentDailyRollup,
+    AuditEvent,
+    Job,
+    Patient,
+)
+from .pagination import OptionalCursorPagination
+from .parsers import LargeJSONParser
 from .permissions import IsOwner
+from .renderers import CSVRenderer, NDJSONRenderer
 from .serializers import (
     AssessmentCreateSerializer,
     AssessmentDetailSerializer,
+    AssessmentIngestSerializer,
     AssessmentListSerializer,
+    AssessmentSummarySerializer,
+    AuditEventSerializer,
+    JobSerializer,
+    PatientBulkCreateSerializer,
     PatientCreateSerializer,
     PatientDetailSerializer,
     PatientListSerializer,
+    PatientSuggestSerializer,
     PatientUpdateSerializer,
 )
 
 
 # Create your views here.
-class PatientListCreateAPIView(generics.ListCreateAPIView):
+class PatientListCreateAPIView(
+    AuditedListMixin, ConditionalListMixin, CachedListMixin, generics.ListCreateAPIView
+):
     """
     Handles listing and creating patients.
 
     This view provides a list of patients for the authenticated clinician and allows creating new patients.
     """
 
-    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, PatientOrderingFilter]
+    pagination_class = OptionalCursorPagination
 
     # search_fields = ["name", "pseudonym"]
-    ordering_fields = ["date_of_birth", "created_at"]
+    ordering_fields = ["date_of_birth", "created_at", "age"]
+    cursor_ordering_fields = ["date_of_birth", "created_at"]
+    cursor_default_ordering = "-created_at"
     filterset_class = GenderFilter
 
     def get_serializer_class(self):
@@ -45,18 +92,27 @@ class PatientListCreateAPIView(generics.ListCreateAPIView):
         Retrieves a queryset of patients associated with the current clinician.
 
         If a search query is provided, the queryset is filtered to include only patients
-        whose names match the search query.
+        whose names match the search query, best matches first. The match runs against
+        the stored search_vector column, so it is served by its GIN index instead of
+        re-tokenising every patient of the clinician.
         """
         clinician = self.request.user
         query = self.request.query_params.get("search", None)
-        patient = Patient.objects.filter(clinician=clinician).select_related(
-            "clinician",
-            "address",
+        patient = (
+            Patient.objects.filter(clinician=clinician)
+            .select_related(
+                "clinician",
+                "address",
+            )
+            .with_age()
         )
         if query:
-            search_patient = patient.annotate(
-                search=SearchVector("first_name", "last_name"),
-            ).filter(clinician=clinician, search=query)
+            search_query = SearchQuery(query, config=SEARCH_CONFIG)
+            search_patient = (
+                patient.filter(search_vector=search_query)
+                .annotate(rank=SearchRank(F("search_vector"), search_query))
+                .order_by("-rank", "-created_at")
+            )
 
             return search_patient
         return patient
@@ -78,7 +134,267 @@ class PatientListCreateAPIView(generics.ListCreateAPIView):
         serializer.save(**patient_data)
 
 
-class PatientDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class PatientBulkCreateAPIView(generics.GenericAPIView):
+    """
+    Creates many patients for the authenticated clinician in one request.
+
+    The body is a list of PatientCreateSerializer payloads. Every item is validated on
+    its own, phone number uniqueness is checked for the whole batch in one query, and
+    the valid items are inserted with one bulk insert for the addresses and one for
+    the patients. The response lists the id created for every valid item and the
+    errors of every rejected one, by position in the request.
+
+    Batches of more than max_batch_size patients, up to max_background_size, are
+    queued as a "patients.bulk_create" job instead and answered with 202 and the
+    URL of the job, whose result lists the created ids and errors the same way.
+    Bodies can be up to max_body_size bytes, above DATA_UPLOAD_MAX_MEMORY_SIZE.
+    """
+
+    serializer_class = PatientBulkCreateSerializer
+    parser_classes = [LargeJSONParser]
+    max_batch_size = 1000
+    max_background_size = 50000
+    # Room for max_background_size patients of about 500 bytes each.
+    max_body_size = 25 * 2**20
+    # Inserts tried when other requests take phone numbers of the batch between the
+    # uniqueness check and the insert.
+    max_insert_attempts = 3
+
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            raise ValidationError(
+                {"non_field_errors": ["Expected a list of patients."]}
+            )
+        if len(request.data) > self.max_background_size:
+            raise ValidationError(
+                {
+                    "non_field_errors": [
+                        "A batch can hold at most "
+                        f"{self.max_background_size} patients."
+                    ]
+                }
+            )
+        if len(request.data) > self.max_batch_size:
+            return self.enqueue(request.data)
+
+        result = self.create_batch(request.data)
+        if not result["errors"]:
+            response_status = status.HTTP_201_CREATED
+        elif result["created"]:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(result, status=response_status)
+
+    def enqueue(self, patients):
+        # A retry would report the patients the failed attempt created as taken.
+        job = jobs.enqueue(
+            "patients.bulk_create",
+            max_attempts=1,
+            user=self.request.user,
+            clinician=self.request.user.pk,
+            patients=patients,
+        )
+        url = self.request.build_absolute_uri(reverse("job-detail", args=[job.pk]))
+        return Response(
+            {"job": job.pk, "url": url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": url},
+        )
+
+    @classmethod
+    def create_in_background(cls, clinician, patients):
+        """
+        Creates the patients of a queued batch, max_batch_size at a time, for the
+        "patients.bulk_create" job.
+        """
+        request = Request(HttpRequest())
+        request.user = User.objects.get(pk=clinician)
+        view = cls(request=request, format_kwarg=None, args=(), kwargs={})
+        result = {"created": [], "errors": []}
+        # The audit trail records the clinician as the one who created them.
+        token = audit.current_request.set(request)
+        try:
+            for start in range(0, len(patients), cls.max_batch_size):
+                batch = view.create_batch(
+                    patients[start : start + cls.max_batch_size], start
+                )
+                result["created"] += batch["created"]
+                result["errors"] += batch["errors"]
+        finally:
+            audit.current_request.reset(token)
+        return result
+
+    def create_batch(self, patients, start=0):
+        """
+        Creates the valid items of `patients`, numbered from `start`. Returns the
+        created ids and the errors of the rejected items by position.
+        """
+        # One serializer validates every item, like ListSerializer does with its
+        # child, so the fields are only built once per request.
+        serializer = self.get_serializer()
+        errors = {}
+        valid = {}
+        for index, item in enumerate(patients, start):
+            try:
+                valid[index] = serializer.run_validation(item)
+            except ValidationError as exc:
+                errors[index] = exc.detail
+
+        created = self.create_valid(valid, errors)
+        return {
+            "created": [
+                {"index": index, "id": patient.pk} for index, patient in created.items()
+            ],
+            "errors": [
+                {"index": index, "errors": item_errors}
+                for index, item_errors in sorted(errors.items())
+            ],
+        }
+
+    def create_valid(self, valid, errors):
+        """
+        Creates the patients of `valid` whose phone numbers are free. A number taken
+        by another request after the check fails the insert, which is then retried
+        and rejects that item like the check would have.
+        """
+        for attempt in range(1, self.max_insert_attempts + 1):
+            self.check_phone_numbers(valid, errors)
+            try:
+                return self.perform_bulk_create(valid)
+            except IntegrityError:
+                if attempt == self.max_insert_attempts:
+                    raise
+
+    def check_phone_numbers(self, valid, errors):
+        """
+        Moves items whose phone number is already taken, or repeats one of an earlier
+        item of the batch, from `valid` to `errors`.
+        """
+        # Compare numbers in the format they are stored in.
+        field = Patient._meta.get_field("phone_number")
+        phone_numbers = {
+            index: field.get_prep_value(data["phone_number"])
+            for index, data in valid.items()
+        }
+        taken = {
+            field.get_prep_value(phone_number)
+            for phone_number in Patient.objects.filter(
+                phone_number__in=set(phone_numbers.values())
+            ).values_list("phone_number", flat=True)
+        }
+        for index, phone_number in phone_numbers.items():
+            if phone_number in taken:
+                del valid[index]
+                errors[index] = {
+                    "phone_number": ["patient with this phone number already exists."]
+                }
+            taken.add(phone_number)
+
+    @transaction.atomic()
+    def perform_bulk_create(self, valid):
+        if not valid:
+            return {}
+        addresses = Address.objects.bulk_create(
+            [Address(**data["address"]) for data in valid.values()]
+        )
+        patients = Patient.objects.bulk_create(
+            [
+                Patient(**{**data, "address": address})
+                for data, address in zip(valid.values(), addresses)
+            ]
+        )
+        # bulk_create sends no post_save signals, so drop cached lists and audit the
+        # new patients here.
+        invalidate_clinician(self.request.user.pk)
+        audit_log.record_changes(AuditEvent.Action.CREATE, patients)
+        return dict(zip(valid.keys(), patients))
+
+
+class PatientSuggestAPIView(AuditedListMixin, generics.ListAPIView):
+    """
+    Typeahead suggestions for the authenticated clinician's patients.
+
+    Matches the `q` parameter as a prefix or fuzzily (trigram similarity) against the
+    first and last name, and as a substring against the digits of the phone number.
+    Every term of `q` has to match. The response is a short, unpaginated list so no
+    COUNT query is run.
+    """
+
+    serializer_class = PatientSuggestSerializer
+    pagination_class = None
+
+    min_query_length = 2
+    min_phone_digits = 3
+    default_limit = 10
+    max_limit = 25
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.query_params.get("limit", self.default_limit))
+        except ValueError:
+            limit = self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def get_term_condition(self, term):
+        """
+        Builds the match condition for a single search term. Names are compared
+        upper-cased so the lookups can use the trigram expression indexes.
+        """
+        upper_term = term.upper()
+        condition = (
+            Q(first_name_upper__startswith=upper_term)
+            | Q(last_name_upper__startswith=upper_term)
+            | Q(first_name_upper__trigram_similar=upper_term)
+            | Q(last_name_upper__trigram_similar=upper_term)
+        )
+        digits = re.sub(r"\D", "", term)
+        if len(digits) >= self.min_phone_digits:
+            condition |= Q(phone_number__contains=digits)
+        return condition
+
+    def get_queryset(self):
+        query = self.request.query_params.get("q", "").strip()
+        if len(query) < self.min_query_length:
+            return Patient.objects.none()
+
+        patients = Patient.objects.filter(clinician=self.request.user).alias(
+            first_name_upper=Upper("first_name"),
+            last_name_upper=Upper("last_name"),
+        )
+        for term in query.split():
+            patients = patients.filter(self.get_term_condition(term))
+
+        return (
+            patients.annotate(
+                similarity=Greatest(
+                    TrigramSimilarity("first_name", query),
+                    TrigramSimilarity("last_name", query),
+                )
+            )
+            .only(*PatientSuggestSerializer.Meta.fields)
+            .order_by("-similarity", "last_name", "first_name", "id")[
+                : self.get_limit()
+            ]
+        )
+
+
+def assign_changed(instance, data):
+    """
+    Sets the values of `data` on `instance` and returns the names of the fields whose
+    value changed.
+    """
+    changed = []
+    for attr, value in data.items():
+        if getattr(instance, attr) != value:
+            setattr(instance, attr, value)
+            changed.append(attr)
+    return changed
+
+
+class PatientDetailAPIView(
+    AuditedReadMixin, ConditionalObjectMixin, generics.RetrieveUpdateDestroyAPIView
+):
     """
     Retrieves, updates, or deletes a patient instance.
 
@@ -87,33 +403,40 @@ class PatientDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
     """
 
     permission_classes = [IsOwner]
+    not_found_message = "Patient not found."
+    validator_queryset = Patient.objects.all()
+
+    def get_validator_queryset(self):
+        # Patients of other clinicians are not found either, so a 404 does not tell
+        # whether a patient exists.
+        return super().get_validator_queryset().filter(clinician=self.request.user)
 
     def get_object(self):
         """
-        Returns the patient instance for the given primary key.
-
-        It checks if the clinician has permission for this patient and also if the patient exists.
+        Returns the clinician's patient with the given primary key, fetched with a
+        single query that also does the ownership check.
         """
-
         try:
-            patient = Patient.objects.select_related("clinician").get(
-                pk=self.kwargs["pk"]
-            )
-            self.check_object_permissions(self.request, patient)
-            return patient
+            patient = self.get_validator_queryset().select_related("address").get()
         except Patient.DoesNotExist:
-            raise NotFound("Patient not found.")
+            raise NotFound(self.not_found_message)
+        self.check_object_permissions(self.request, patient)
+        # The ownership check compared the ids, the clinician is the requesting user.
+        patient.clinician = self.request.user
+        return patient
 
     def get_serializer_class(self):
         if self.request.method in ["PUT", "PATCH"]:
             return PatientUpdateSerializer
         return PatientDetailSerializer
 
-    @transaction.atomic()
     def update(self, request, *args, **kwargs):
         """
         Because address is a nested serializer in the PatientUpdateSerializer we need to override the update
-        method and manage the address update
+        method and manage the address update.
+
+        Only the columns whose values change are written. This runs inside the
+        transaction of ConditionalObjectMixin.conditional_write.
         """
         partial = kwargs.pop("partial", False)
         instance = self.get_object()
@@ -126,30 +449,38 @@ class PatientDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
         address_data = patient_data.pop("address", None)
 
         # Update the address (if provided)
+        address_changed = False
         if address_data:
-            # here we use .items() to get a list of key values in the serialized data(address)
-            # and then use setattr to set these key(attr) value to the model instance(address)
-            for attr, value in address_data.items():
-                setattr(instance.address, attr, value)
-            instance.address.save()
-
-        # Update the patient instance fields
-        for attr, value in patient_data.items():
-            setattr(instance, attr, value)
-
-        instance.save()
+            if instance.address is None:
+                patient_data["address"] = Address.objects.create(**address_data)
+            else:
+                changed = assign_changed(instance.address, address_data)
+                if changed:
+                    instance.address.save(update_fields=changed)
+                    address_changed = True
+
+        # Update the changed patient fields. The address is part of the patient, so
+        # its changes move the patient's updated_at, which the ETag is made from.
+        changed = assign_changed(instance, patient_data)
+        if changed or address_changed:
+            instance.save(update_fields=changed + ["updated_at"])
 
         detail_serializer = PatientDetailSerializer(instance)
         return Response(detail_serializer.data, status=status.HTTP_200_OK)
 
 
-class AssessmentListAPIView(generics.ListAPIView):
+class AssessmentListAPIView(
+    AuditedListMixin, ConditionalListMixin, CachedListMixin, generics.ListAPIView
+):
     """
     This view provides a list of patients for the authenticated clinician
     """
 
+    audit_model = "assessment"
+    audit_patient_key = "patient_id"
     serializer_class = AssessmentListSerializer
     filter_backends = [DjangoFilterBackend, OrderingFilter]
+    pagination_class = OptionalCursorPagination
 
     # search_fields = ["name", "pseudonym"]
     ordering_fields = [
@@ -158,6 +489,8 @@ class AssessmentListAPIView(generics.ListAPIView):
         "patient",
         "final_score",
     ]
+    cursor_ordering_fields = ["assessment_date", "final_score"]
+    cursor_default_ordering = "-assessment_date"
     filterset_class = AssessmentTypeFilter
 
     def get_queryset(self):
@@ -166,6 +499,124 @@ class AssessmentListAPIView(generics.ListAPIView):
         )
 
 
+class Echo:
+    """
+    File-like object that returns what is written to it, for csv.writer to produce
+    one line at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+class AssessmentExportAPIView(AssessmentListAPIView):
+    """
+    Streams all of the clinician's assessments as CSV or newline delimited JSON.
+
+    Takes the filters and ordering of AssessmentListAPIView. The rows are read through
+    a server-side cursor and written to the response as they arrive, so memory use
+    does not depend on the number of rows and the first bytes are sent before the
+    query has finished.
+    """
+
+    renderer_classes = [CSVRenderer, NDJSONRenderer]
+    columns = [
+        "id",
+        "patient_id",
+        "patient",
+        "assessment_type",
+        "assessment_date",
+        "final_score",
+    ]
+    chunk_size = 2000
+
+    def get(self, request, *args, **kwargs):
+        header, encode = self.get_line_encoder()
+        rows = self.audit_rows(
+            self.get_export_queryset().iterator(chunk_size=self.chunk_size)
+        )
+        return self.stream(
+            itertools.chain(header, (encode(self.format_row(row)) for row in rows))
+        )
+
+    def get_export_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        if not queryset.query.order_by:
+            queryset = queryset.order_by("assessment_date", "id")
+        return queryset.values_list(
+            "id",
+            "patient_id",
+            "patient__first_name",
+            "patient__last_name",
+            "assessment_type",
+            "assessment_date",
+            "final_score",
+        )
+
+    def is_read(self, request, response):
+        # The streamed rows are recorded by audit_rows.
+        return False
+
+    def audit_rows(self, rows):
+        """
+        Records a read of the assessments of every patient the export sent rows of,
+        a chunk of rows at a time.
+        """
+        seen, new = set(), []
+        for index, row in enumerate(rows, 1):
+            if row[1] not in seen:
+                seen.add(row[1])
+                new.append(row[1])
+            if index % self.chunk_size == 0:
+                self.audit_patients(new)
+                new = []
+            yield row
+        self.audit_patients(new)
+
+    def audit_patients(self, patient_ids):
+        audit_log.record(
+            [
+                audit.make_event(
+                    AuditEvent.Action.READ,
+                    "assessment",
+                    None,
+                    patient_id,
+                    request=self.request,
+                )
+                for patient_id in patient_ids
+            ]
+        )
+
+    def get_line_encoder(self):
+        """
+        Returns the lines that go before the rows and the function that turns a row
+        into a line, for the requested format.
+        """
+        if self.request.accepted_renderer.format == "ndjson":
+            return [], lambda row: json.dumps(dict(zip(self.columns, row))) + "\n"
+        writer = csv.writer(Echo())
+        return [writer.writerow(self.columns)], writer.writerow
+
+    def format_row(self, row):
+        pk, patient_id, first_name, last_name, type_, date, score = row
+        return (
+            pk,
+            patient_id,
+            f"{first_name} {last_name}",
+            type_,
+            date.isoformat().replace("+00:00", "Z"),
+            str(score),
+        )
+
+    def stream(self, content):
+        renderer = self.request.accepted_renderer
+        response = StreamingHttpResponse(content, content_type=renderer.media_type)
+        response["Content-Disposition"] = (
+            f'attachment; filename="assessments.{renderer.format}"'
+        )
+        return response
+
+
 class AssessmentCreateAPIView(generics.CreateAPIView):
     """
     Handles creating assessments for a patient.
@@ -177,15 +628,115 @@ class AssessmentCreateAPIView(generics.CreateAPIView):
     serializer_class = AssessmentCreateSerializer
 
     def perform_create(self, serializer):
-        patient_pk = self.kwargs["pk"]
-        try:
-            patient = Patient.objects.get(pk=patient_pk)
-        except Patient.DoesNotExist:
+        # One INSERT ... SELECT that only inserts when the patient is the clinician's.
+        data = dict(serializer.validated_data)
+        assessment = Assessment.objects.create_for_patient(
+            data.pop("clinician"), self.kwargs["pk"], **data
+        )
+        if assessment is None:
             raise NotFound("Patient not found.")
-        serializer.save(patient=patient)
+        serializer.instance = assessment
+
+
+class AssessmentIngestAPIView(generics.GenericAPIView):
+    """
+    Ingests assessments streamed as newline delimited JSON.
 
+    Every line is one object with the AssessmentCreateSerializer fields plus the
+    `patient` id. The body is read line by line and handled in chunks: each chunk
+    resolves its patient ids with one query limited to the clinician's patients and is
+    inserted with one bulk insert, so memory stays bounded whatever the upload size.
+    The response summarises the upload and reports rejected lines by line number.
+    """
 
-class AssessmentDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+    serializer_class = AssessmentIngestSerializer
+    chunk_size = 1000
+    max_reported_rejects = 1000
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer()
+        self.summary = {"lines": 0, "created": 0, "rejected": 0, "rejects": []}
+        chunk = []
+        stream = request.stream or []
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            self.summary["lines"] += 1
+            try:
+                item = json.loads(line)
+            except ValueError:
+                self.reject(line_number, {"non_field_errors": ["Invalid JSON."]})
+                continue
+            try:
+                chunk.append((line_number, serializer.run_validation(item)))
+            except ValidationError as exc:
+                self.reject(line_number, exc.detail)
+                continue
+            if len(chunk) >= self.chunk_size:
+                self.ingest_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.ingest_chunk(chunk)
+        self.summary["rejects"].sort(key=lambda reject: reject["line"])
+
+        if self.summary["created"]:
+            # bulk_create sends no post_save signals, so drop cached lists here.
+            invalidate_clinician(request.user.pk)
+        return Response(self.summary, status=status.HTTP_200_OK)
+
+    def reject(self, line_number, errors):
+        self.summary["rejected"] += 1
+        if len(self.summary["rejects"]) < self.max_reported_rejects:
+            self.summary["rejects"].append({"line": line_number, "errors": errors})
+
+    def ingest_chunk(self, chunk):
+        patient_ids = {data["patient"] for _, data in chunk}
+        owned = set(
+            Patient.objects.filter(
+                clinician=self.request.user, pk__in=patient_ids
+            ).values_list("pk", flat=True)
+        )
+        assessments = []
+        for line_number, data in chunk:
+            patient_id = data.pop("patient")
+            if patient_id not in owned:
+                self.reject(line_number, {"patient": ["Patient not found."]})
+                continue
+            assessments.append(Assessment(patient_id=patient_id, **data))
+        with transaction.atomic():
+            Assessment.objects.bulk_create(assessments)
+            # bulk_create sends no post_save signals to update the rollups or the
+            # audit trail either.
+            rollups.add_assessments(assessments)
+            audit_log.record_changes(AuditEvent.Action.CREATE, assessments)
+        self.summary["created"] += len(assessments)
+
+
+class AssessmentSummaryAPIView(
+    ConditionalListMixin, CachedListMixin, generics.ListAPIView
+):
+    """
+    Daily score statistics of the clinician's assessments, per assessment type.
+
+    Reads the daily rollups instead of the assessments, so the cost depends on the
+    number of days asked for and not on the number of assessments. Filter with
+    `assessment_type` and the `day_after` and `day_before` range.
+    """
+
+    serializer_class = AssessmentSummarySerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = AssessmentSummaryFilter
+    pagination_class = None
+
+    def get_queryset(self):
+        return AssessmentDailyRollup.objects.filter(
+            clinician=self.request.user
+        ).order_by("day", "assessment_type")
+
+
+class AssessmentDetailAPIView(
+    AuditedReadMixin, ConditionalObjectMixin, generics.RetrieveUpdateDestroyAPIView
+):
     """
     Handles retrieving, updating, and deleting assessments.
 
@@ -194,6 +745,8 @@ class AssessmentDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
 
     permission_classes = [IsOwner]
     serializer_class = AssessmentDetailSerializer
+    not_found_message = "Assessment not found."
+    validator_queryset = Assessment.objects.all()
 
     def get_object(self):
         """
@@ -213,7 +766,9 @@ class AssessmentDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
             raise NotFound("Assessment not found.")
 
 
-class PatientAssessmentListAPIView(generics.ListAPIView):
+class PatientAssessmentListAPIView(
+    AuditedReadMixin, ConditionalListMixin, CachedListMixin, generics.ListAPIView
+):
     """
     Handles listing assessments for a patient.
 
@@ -223,6 +778,7 @@ class PatientAssessmentListAPIView(generics.ListAPIView):
 
     serializer_class = AssessmentListSerializer
     filter_backends = [DjangoFilterBackend, OrderingFilter]
+    pagination_class = OptionalCursorPagination
 
     # search_fields = ["name", "pseudonym"]
     ordering_fields = [
@@ -230,15 +786,32 @@ class PatientAssessmentListAPIView(generics.ListAPIView):
         "assessment_type",
         "final_score",
     ]
+    cursor_ordering_fields = ["assessment_date", "final_score"]
+    cursor_default_ordering = "-assessment_date"
     filterset_class = AssessmentTypeFilter
 
     def get_queryset(self):
         clinician = self.request.user
         patient_pk = self.kwargs["pk"]
-        return Assessment.objects.filter(clinician=clinician, patient_id=patient_pk)
+        return Assessment.objects.select_related("patient").filter(
+            clinician=clinician, patient_id=patient_pk
+        )
+
+    def get_read_events(self, request, response):
+        return [
+            audit.make_event(
+                AuditEvent.Action.READ,
+                "assessment",
+                None,
+                self.kwargs["pk"],
+                request=request,
+            )
+        ]
 
 
-class PatientAssessmentDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class PatientAssessmentDetailAPIView(
+    AuditedReadMixin, ConditionalObjectMixin, generics.RetrieveUpdateDestroyAPIView
+):
     """
     Retrieves the assessment instance with the given primary key for the patient.
 
@@ -248,6 +821,9 @@ class PatientAssessmentDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
 
     permission_classes = [IsOwner]
     serializer_class = AssessmentDetailSerializer
+    not_found_message = "Assessment not found."
+    validator_queryset = Assessment.objects.all()
+    validator_lookups = {"patient__pk": "patient_pk", "pk": "assessment_pk"}
 
     def get_object(self):
         """
@@ -267,3 +843,53 @@ class PatientAssessmentDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
             return assessment
         except Assessment.DoesNotExist:
             raise NotFound("Assessment not found.")
+
+
+class PatientAuditListAPIView(generics.ListAPIView):
+    """
+    Lists the audit trail of a patient and their assessments, latest first.
+
+    Clinicians see the trail of their own patients, staff users that of any patient,
+    also after it was deleted. Events are written in batches, so the trail can lag
+    up to AUDIT_LOG["FLUSH_INTERVAL"] seconds behind.
+    """
+
+    serializer_class = AuditEventSerializer
+
+    def get_queryset(self):
+        patient_pk = self.kwargs["pk"]
+        if not (
+            self.request.user.is_staff
+            or Patient.objects.filter(
+                pk=patient_pk, clinician=self.request.user
+            ).exists()
+        ):
+            raise NotFound("Patient not found.")
+        return audit.get_patient_events(patient_pk)
+
+
+class JobQuerysetMixin:
+    serializer_class = JobSerializer
+
+    def get_queryset(self):
+        queryset = Job.objects.order_by("-created_at", "-id")
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(user_id=self.request.user.pk)
+        return queryset
+
+
+class JobListAPIView(JobQuerysetMixin, generics.ListAPIView):
+    """
+    Lists the background jobs the user queued, latest first, with their status.
+    Staff users see all jobs. Takes `status` and `name` filters.
+    """
+
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ["status", "name"]
+
+
+class JobDetailAPIView(JobQuerysetMixin, generics.RetrieveAPIView):
+    """
+    Retrieves the status of a background job, its result once it succeeded and its
+    last error.
+    """
@@ -0,0 +1,163 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import setting_changed
+from django.db import router, transaction
+from django.dispatch import receiver
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from patients.cache import LRUCache, get_shared_cache
+
+DEFAULTS = {
+    "ENABLED": True,
+    "CACHE_ALIAS": "default",
+    "SHARED": False,
+    "TIMEOUT": 300,
+    "LRU_MAXSIZE": 4096,
+    "LRU_TIMEOUT": 10,
+}
+
+
+class UserCache:
+    """
+    Caches the users that JWT requests authenticate as.
+
+    Entries are keyed on the user id and the user's auth version. Saving or deleting
+    a user, or changing their groups or permissions, bumps the version (see
+    users.signals), so a cached user is never returned after its is_active flag,
+    password or permissions changed.
+
+    Users are kept in an in-process LRU and, with AUTH_USER_CACHE["SHARED"], also in
+    the Django cache named by AUTH_USER_CACHE["CACHE_ALIAS"]. The version always lives
+    in that cache, which therefore has to be shared between the worker processes (see
+    patients.cache.get_shared_cache). In-process entries also expire after
+    LRU_TIMEOUT seconds, which bounds how long a change can go unnoticed should a
+    version bump be lost.
+    """
+
+    def __init__(self):
+        self.configure()
+
+    def configure(self):
+        options = {**DEFAULTS, **getattr(settings, "AUTH_USER_CACHE", {})}
+        self.enabled = options["ENABLED"]
+        self.shared_entries = options["SHARED"]
+        self.timeout = options["TIMEOUT"]
+        self.shared = get_shared_cache(options["CACHE_ALIAS"], "AUTH_USER_CACHE")
+        self.local = LRUCache(options["LRU_MAXSIZE"], options["LRU_TIMEOUT"])
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def version_key(user_id):
+        return f"users:auth-version:{user_id}"
+
+    def get_version(self, user_id):
+        key = self.version_key(user_id)
+        version = self.shared.get(key)
+        if version is None:
+            # Time based, so a version evicted from the cache can not collide with
+            # entries cached before.
+            self.shared.add(key, time.time_ns(), timeout=None)
+            version = self.shared.get(key)
+        return version
+
+    def bump_version(self, user_id):
+        self.shared.set(self.version_key(user_id), time.time_ns(), timeout=None)
+
+    def get(self, key):
+        values = self.local.get(key)
+        if values is None and self.shared_entries:
+            values = self.shared.get(key)
+            if values is not None:
+                self.local.set(key, values)
+        if values is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Every request gets its own instance, built like a row fetched from the
+        # database, so changes made to request.user are never shared.
+        user_model = get_user_model()
+        fields = [field.attname for field in user_model._meta.concrete_fields]
+        return user_model.from_db(router.db_for_read(user_model), fields, values)
+
+    def set(self, key, user):
+        values = tuple(
+            getattr(user, field.attname) for field in user._meta.concrete_fields
+        )
+        self.local.set(key, values)
+        if self.shared_entries:
+            self.shared.set(key, values, timeout=self.timeout)
+
+    def clear(self):
+        """
+        Drops the in-process entries. Shared entries age out by their timeout.
+        """
+        self.local.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            **self.local.stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+user_cache = UserCache()
+
+
+@receiver(setting_changed)
+def reload_user_cache(*, setting, **kwargs):
+    if setting in ("AUTH_USER_CACHE", "CACHES", "SINGLE_PROCESS"):
+        user_cache.configure()
+
+
+def invalidate_user(user_id):
+    """
+    Bumps the user's auth version right away, so the rest of the transaction sees
+    the change, and again once it commits, so no request can cache the old row under
+    the new version in between.
+    """
+    if user_id is not None:
+        user_cache.bump_version(user_id)
+        transaction.on_commit(lambda: user_cache.bump_version(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the user from the user cache instead of querying
+    it on every request. Inactive users and unknown ids are never cached.
+    """
+
+    def get_user(self, validated_token):
+        if not user_cache.enabled:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                "Token contained no recognizable user identification"
+            ) from e
+
+        key = f"users:auth-user:{user_id}:{user_cache.get_version(user_id)}"
+        user = user_cache.get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(key, user)
+            return user
+
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(
+                "The user's password has been changed.", code="password_changed"
+            )
+        return user
@@ -0,0 +1,9 @@
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    """
+    Documents CachedJWTAuthentication like the JWTAuthentication it extends.
+    """
+
+    target_class = "users.authentication.CachedJWTAuthentication"
@@ -0,0 +1,35 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from users.authentication import invalidate_user
+from users.models import User
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Any saved field can be read from request.user, not only is_active, the
+    # password and the staff flags, so every save invalidates.
+    invalidate_user(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_cached_user_permissions(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if not reverse:
+        if action.startswith("post_"):
+            invalidate_user(instance.pk)
+        return
+
+    # Changed from the group or permission side, pk_set holds user ids.
+    if action == "pre_clear":
+        # Clearing sends no ids, the users have to be found before they are removed.
+        related = "group" if sender is User.groups.through else "permission"
+        pk_set = sender.objects.filter(**{related: instance}).values_list(
+            "user_id", flat=True
+        )
+    elif action not in ("post_add", "post_remove"):
+        return
+    for user_id in pk_set:
+        invalidate_user(user_id)
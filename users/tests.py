@@ -1,3 +1,301 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.contrib.auth.tokens import default_token_generator
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from djoser.utils import encode_uid
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from patients.tests import QueryBudgetMixin
+from users.authentication import UserCache, user_cache
+from users.models import User
+
+PASSWORD = "correct-horse-battery"
+
+
+class AuthQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """
+    Sends a request to every djoser and JWT route and holds each to its query budget.
+    The user list is requested while the number of users grows.
+    """
+
+    query_budgets = {
+        "user-list GET": 3,
+        "user-list POST": 5,
+        "user-me GET": 1,
+        "user-me PATCH": 2,
+        "user-me DELETE": 8,
+        "user-detail GET": 2,
+        "user-activation POST": 2,
+        "user-resend-activation POST": 1,
+        "user-reset-password POST": 1,
+        "user-reset-password-confirm POST": 2,
+        "user-set-password POST": 2,
+        "user-reset-username POST": 1,
+        "user-reset-username-confirm POST": 3,
+        "user-set-username POST": 3,
+        "jwt-create POST": 1,
+        "jwt-refresh POST": 1,
+        "jwt-verify POST": 0,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            "clinician@healthtrack.com", PASSWORD, first_name="Ada"
+        )
+        cls.staff = User.objects.create_user(
+            "staff@healthtrack.com", PASSWORD, is_staff=True
+        )
+        cls.inactive = User.objects.create_user(
+            "inactive@healthtrack.com", PASSWORD, is_active=False
+        )
+
+    def authenticate(self, user):
+        token = AccessToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def uid_and_token(self, user):
+        return {
+            "uid": encode_uid(user.pk),
+            "token": default_token_generator.make_token(user),
+        }
+
+    def test_user_list(self):
+        self.authenticate(self.staff)
+
+        def add_users(size):
+            User.objects.bulk_create(
+                User(email=f"user{size}-{i}@healthtrack.com") for i in range(size)
+            )
+
+        self.assert_constant_queries(
+            "user-list GET",
+            lambda size: self.client.get(reverse("user-list")),
+            prepare=add_users,
+        )
+
+    def test_registration_and_activation(self):
+        self.measure(
+            "user-list POST",
+            lambda: self.client.post(
+                reverse("user-list"),
+                {
+                    "email": "new@healthtrack.com",
+                    "password": PASSWORD,
+                    "re_password": PASSWORD,
+                    "first_name": "New",
+                    "last_name": "Clinician",
+                    "clinic_name": "Clinic",
+                },
+            ),
+        )
+        self.measure(
+            "user-resend-activation POST",
+            lambda: self.client.post(
+                reverse("user-resend-activation"), {"email": self.inactive.email}
+            ),
+        )
+        self.measure(
+            "user-activation POST",
+            lambda: self.client.post(
+                reverse("user-activation"), self.uid_and_token(self.inactive)
+            ),
+        )
+
+    def test_jwt(self):
+        self.measure(
+            "jwt-create POST",
+            lambda: self.client.post(
+                reverse("jwt-create"),
+                {"email": self.user.email, "password": PASSWORD},
+            ),
+        )
+        refresh = RefreshToken.for_user(self.user)
+        self.measure(
+            "jwt-refresh POST",
+            lambda: self.client.post(reverse("jwt-refresh"), {"refresh": str(refresh)}),
+        )
+        self.measure(
+            "jwt-verify POST",
+            lambda: self.client.post(
+                reverse("jwt-verify"), {"token": str(refresh.access_token)}
+            ),
+        )
+
+    def test_current_user(self):
+        self.authenticate(self.user)
+        self.measure("user-me GET", lambda: self.client.get(reverse("user-me")))
+        self.measure(
+            "user-me PATCH",
+            lambda: self.client.patch(reverse("user-me"), {"clinic_name": "Clinic"}),
+        )
+        self.measure(
+            "user-detail GET",
+            lambda: self.client.get(reverse("user-detail", args=[self.user.pk])),
+        )
+        self.measure(
+            "user-set-password POST",
+            lambda: self.client.post(
+                reverse("user-set-password"),
+                {"current_password": PASSWORD, "new_password": PASSWORD + "!"},
+            ),
+        )
+        self.measure(
+            "user-set-username POST",
+            lambda: self.client.post(
+                reverse("user-set-username"),
+                {
+                    "current_password": PASSWORD + "!",
+                    "new_email": "ada@healthtrack.com",
+                },
+            ),
+        )
+        self.measure(
+            "user-me DELETE",
+            lambda: self.client.delete(
+                reverse("user-me"), {"current_password": PASSWORD + "!"}
+            ),
+        )
+
+    def test_resets(self):
+        self.measure(
+            "user-reset-password POST",
+            lambda: self.client.post(
+                reverse("user-reset-password"), {"email": self.user.email}
+            ),
+        )
+        self.measure(
+            "user-reset-password-confirm POST",
+            lambda: self.client.post(
+                reverse("user-reset-password-confirm"),
+                {
+                    **self.uid_and_token(self.user),
+                    "new_password": PASSWORD + "?",
+                    "re_new_password": PASSWORD + "?",
+                },
+            ),
+        )
+        self.measure(
+            "user-reset-username POST",
+            lambda: self.client.post(
+                reverse("user-reset-username"), {"email": self.staff.email}
+            ),
+        )
+        self.measure(
+            "user-reset-username-confirm POST",
+            lambda: self.client.post(
+                reverse("user-reset-username-confirm"),
+                {
+                    **self.uid_and_token(self.staff),
+                    "new_email": "ops@healthtrack.com",
+                },
+            ),
+        )
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+    """
+    Requests are authenticated from the user cache until the user changes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("clinician@healthtrack.com", PASSWORD)
+        cls.group = Group.objects.create(name="clinicians")
+
+    def setUp(self):
+        user_cache.clear()
+        token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def get_me(self, status=200):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("user-me"))
+        self.assertEqual(response.status_code, status)
+        return response, len(context.captured_queries)
+
+    def assert_cached(self):
+        self.assertEqual(self.get_me()[1], 0)
+
+    def assert_refetched(self):
+        self.assertEqual(self.get_me()[1], 1)
+
+    def test_user_is_cached(self):
+        self.assert_refetched()
+        self.assert_cached()
+        self.assert_cached()
+        self.assertEqual(user_cache.stats()["hits"], 2)
+        self.assertEqual(user_cache.stats()["misses"], 1)
+        self.assertAlmostEqual(user_cache.stats()["hit_rate"], 2 / 3)
+
+    def test_changes_invalidate(self):
+        self.assert_refetched()
+        self.client.patch(reverse("user-me"), {"clinic_name": "Clinic"})
+        response, queries = self.get_me()
+        self.assertEqual(queries, 1)
+        self.assertEqual(response.data["clinic_name"], "Clinic")
+
+        self.user.set_password(PASSWORD + "!")
+        self.user.save()
+        self.assert_refetched()
+
+        self.user.user_permissions.add(Permission.objects.first())
+        self.assert_refetched()
+        self.group.user_set.add(self.user)
+        self.assert_refetched()
+        self.group.user_set.clear()
+        self.assert_refetched()
+        self.assert_cached()
+
+        self.user.is_active = False
+        self.user.save()
+        self.get_me(status=401)
+
+    def test_staff_flag_change(self):
+        User.objects.create_user("other@healthtrack.com", PASSWORD)
+        response = self.client.get(reverse("user-list"))
+        self.assertEqual(response.data["count"], 1)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse("user-list"))
+        self.assertEqual(response.data["count"], 2)
+
+    def test_deleted_user(self):
+        self.assert_refetched()
+        self.user.delete()
+        self.get_me(status=401)
+
+    def test_shared_entries(self):
+        with self.settings(AUTH_USER_CACHE={"SHARED": True}):
+            self.assert_refetched()
+            user_cache.local.clear()
+            self.assert_cached()
+            self.assertEqual(user_cache.stats()["size"], 1)
+
+    def test_changes_in_other_processes(self):
+        self.assert_refetched()
+        # Another worker process deactivates the user and bumps the version in the
+        # shared cache with its own UserCache.
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        UserCache().bump_version(self.user.pk)
+        self.get_me(status=401)
+
+    def test_local_entries_expire(self):
+        self.assert_refetched()
+        self.assert_cached()
+        later = time.monotonic() + settings.AUTH_USER_CACHE["LRU_TIMEOUT"]
+        with mock.patch("patients.cache.time.monotonic", return_value=later):
+            self.assert_refetched()
+
+    def test_process_local_cache_refused(self):
+        with mock.patch.object(settings, "SINGLE_PROCESS", False):
+            with self.assertRaisesMessage(ImproperlyConfigured, "AUTH_USER_CACHE"):
+                UserCache()